@@ -58,6 +58,13 @@ class ArmFrame(Frame):
         assert isinstance(offset, int)
         return [O("str {{}}, [{{}}, #{:d}]".format(offset), srcs=[temp, self.fp])]
 
+    def rematerializable(self, instr):
+        # Constants and additions or subtractions, as generated for the
+        # CONST and BINOP nodes.
+        return isinstance(instr, O) and len(instr.dsts) == 1 and \
+            not instr.jmps and not instr.extra_conflicts and \
+            instr.template.split()[0] in ("mov", "add", "sub")
+
     def reserve_stack_space(self):
         return [O("add {{}}, {{}}, #-{}".format(self.offset), dsts=[self.sp], srcs=[self.sp])] \
                 if self.offset else []
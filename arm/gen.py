@@ -54,10 +54,14 @@ class Gen:
     def visit(self, label):
         l = L("{}:".format(label.label), label.label)
         if label.label == self.frame.end_label:
-            # The end label marks the place of the return instruction
+            # The end label marks the place of the return instruction. It
+            # reads the return address, the result if any, and the callee
+            # save registers, which the caller expects to find unchanged,
+            # so that their restoration in the epilogue is live.
             srcs = [self.frame.lr]
             if self.frame.returns_value:
                 srcs.append(self.frame.r0)
+            srcs += self.frame.callee_save
             return [l, O("bx {}", srcs=srcs)]
         else:
             return [l]
@@ -118,24 +122,44 @@ class Gen:
         else:
             raise AssertionError("unimplemented operator {}".format(binop.op))
         # Determination of instructions to do
-        stms = left_stms + right_stms + [O("{} {}, {}, {}".format(op, temp, left_temp, right_temp))]
+        instr = O("{} {{}}, {{}}, {{}}".format(op), dsts=[temp], srcs=[left_temp, right_temp])
+        if op == "mul":
+            # Rd and Rm must be different registers for mul.
+            instr.record_conflict(temp, left_temp)
+        stms = left_stms + right_stms + [instr]
         return stms, temp
 
     @visitor(CALL)
     def visit(self,func):
+        # The calling sequence is:
+        #   - the arguments are evaluated into temporaries;
+        #   - the first four are moved into r0-r3, and the others pushed;
+        #   - `bl` reads r0-r3 and defines every caller save register,
+        #     so that no temporary living across the call is given one;
+        #   - the pushed arguments are popped by adjusting sp;
+        #   - the result, if any, is moved out of r0.
+        # The caller save registers are not pushed around the call, as the
+        # register allocator keeps live values out of them.
         # Register used to stock result
         temp = Temp.create("func")
-        # Saving registers
-        stms = [O("push {{r0-r3,lr}}")]
-        args_count = 0
+        stms = []
+        args = []
         for arg in func.args:
             (stm, tmp) = arg.accept(self)
             stms += stm
-            if (args_count < 4):
-                stms += [M("mov {{}}, {{}}", dst = Temp("r{}".format(args_count)), src=tmp)]
-            else:
-                stms += [O("push {{{}}}", srcs = [tmp])]
-            args_count += 1
-        stms += [O("pop {{r0-r3,lr}}")]
-        stms +=  [O("bl {}".format(func.func.label.name), jmps=[func.func.label])]
+            args.append(tmp)
+        regs = [Temp("r{}".format(i)) for i in range(min(len(args), 4))]
+        for (reg, tmp) in zip(regs, args):
+            stms += [M("mov {}, {}", dst=reg, src=tmp)]
+        for tmp in args[4:]:
+            stms += [O("push {{{}}}", srcs=[tmp])]
+        # A call returns to the next instruction, it is not a jump. It reads
+        # the argument registers and clobbers the caller save ones.
+        stms += [O("bl {}".format(func.func.label.name),
+                   dsts=self.frame.caller_save, srcs=regs)]
+        if len(args) > 4:
+            stms += [O("add {{}}, {{}}, #{}".format(4 * (len(args) - 4)),
+                       dsts=[self.frame.sp], srcs=[self.frame.sp])]
+        if func.return_result:
+            stms += [M("mov {}, {}", dst=temp, src=self.frame.r0)]
         return stms, temp
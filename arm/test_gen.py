@@ -0,0 +1,54 @@
+import unittest
+
+from arm.frame import ArmFrame
+from arm.gen import Gen
+from codegen.instr import MOVE as M, OPER as O
+from ir.context import Context
+from ir.nodes import *
+
+class TestGen(unittest.TestCase):
+
+    def call(self, nargs, return_result=True):
+        frame = ArmFrame(Label("f"))
+        with Context() as context, context.function(frame):
+            args = [TEMP(Temp.create("a")) for _ in range(nargs)]
+            stms, temp = CALL(NAME(Label("g")), args,
+                              return_result).accept(Gen(frame))
+        return frame, [arg.temp for arg in args], stms, temp
+
+    def test_call(self):
+        frame, (a, b), stms, temp = self.call(2)
+        r0, r1 = Temp("r0"), Temp("r1")
+        self.assertEqual([str(i).strip() for i in stms],
+                         ["mov r0, %s" % a, "mov r1, %s" % b, "bl g",
+                          "mov %s, r0" % temp])
+        # The arguments are passed with moves, which may be coalesced.
+        self.assertIsInstance(stms[0], M)
+        self.assertEqual((stms[0].dst, stms[0].src), (r0, a))
+        # The call reads the argument registers and clobbers the caller
+        # save ones, so that nothing lives in those across it.
+        self.assertIsInstance(stms[2], O)
+        self.assertEqual(stms[2].uses(), [r0, r1])
+        self.assertEqual(stms[2].defs(), frame.caller_save)
+        self.assertEqual((stms[3].dst, stms[3].src), (temp, r0))
+
+    def test_call_stack_arguments(self):
+        frame, args, stms, temp = self.call(6, False)
+        self.assertEqual([str(i).strip() for i in stms],
+                         ["mov r%d, %s" % (n, a)
+                          for (n, a) in enumerate(args[:4])] +
+                         ["push {%s}" % a for a in args[4:]] +
+                         ["bl g", "add sp, sp, #8"])
+        self.assertEqual(stms[-2].uses(), frame.param_regs)
+        self.assertEqual(stms[-1].defs(), [frame.sp])
+
+    def test_return(self):
+        frame = ArmFrame(Label("f"))
+        frame.returns_value = True
+        (label, ret) = LABEL(frame.end_label).accept(Gen(frame))
+        self.assertEqual(str(ret).strip(), "bx lr")
+        self.assertEqual(ret.uses(),
+                         [frame.lr, frame.r0] + frame.callee_save)
+
+if __name__ == '__main__':
+    unittest.main()
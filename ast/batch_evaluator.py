@@ -0,0 +1,245 @@
+import numpy as np
+
+from ast.nodes import *
+from parser.parser import parse
+from semantics.binder import Binder
+from typer.typer import Typer
+from utils.visitor import *
+
+
+class BatchException(Exception):
+    """Exception encountered during batch evaluation."""
+    pass
+
+
+COMPARISONS = {'<': np.less, '<=': np.less_equal, '>': np.greater,
+               '>=': np.greater_equal, '=': np.equal, '<>': np.not_equal}
+
+
+def invert(mask):
+    """Return the negation of a boolean or of a boolean mask."""
+    return not mask if mask is True or mask is False else ~mask
+
+
+def prepare(text, names):
+    """Parse, bind and type an expression in which every name in names is a
+    free integer variable. Return the tree and the variable declarations
+    corresponding to names, in order."""
+    tree = parse(text)
+    binder = Binder()
+    decls = [VarDecl(name, Type('int'), None) for name in names]
+    for decl in decls:
+        binder.add_binding(decl)
+    tree.accept(binder)
+    typer = Typer()
+    for decl in decls:
+        typer.merge(decl, decl.type)
+    typer.run(tree, False)
+    return tree, decls
+
+
+def evaluate(text, columns):
+    """Evaluate the expression text once for every row of columns, a
+    dictionary mapping variable names to integer arrays of the same length,
+    and return the array of results."""
+    names = sorted(columns)
+    tree, decls = prepare(text, names)
+    return BatchEvaluator(dict((decl, columns[decl.name])
+                               for decl in decls)).run(tree)
+
+
+class BatchEvaluator(Visitor):
+    """Evaluate a bound and typed expression for many rows at once.
+
+    The free variables of the expression are bound to NumPy integer arrays
+    (see `prepare`), given to the constructor as a dictionary keyed by
+    declaration. Every node is then evaluated once for all the rows:
+    arithmetic operators are applied on whole columns, and comparisons
+    produce boolean masks.
+
+    `if`, `&` and `|` keep their short-circuit semantics: their second
+    operand (or branches) are only evaluated over the rows selected by
+    the first one, so that for example `x <> 0 & 100 / x > 2` never
+    divides by zero and an assignment only changes the selected rows.
+    `rows` holds the indices of the rows being evaluated, or None when
+    all of them are, and the value of a node only holds those rows.
+
+    Values are 64 bits integers: unlike the Evaluator, overflows wrap
+    around. Loops, breaks and function calls are not supported."""
+
+    def __init__(self, columns):
+        self.size = None
+        self.values = {}
+        for (decl, column) in columns.items():
+            column = np.asarray(column)
+            if column.ndim != 1 or column.dtype.kind not in 'iu':
+                raise BatchException("column %s is not a vector of integers"
+                                     % decl.name)
+            if self.size is None:
+                self.size = len(column)
+            elif len(column) != self.size:
+                raise BatchException("column %s has %d rows instead of %d" %
+                                     (decl.name, len(column), self.size))
+            self.values[decl] = column
+        # Variables holding an array of all the rows which is not shared
+        # with anything else and can be partially assigned in place.
+        self.owned = set()
+        self.rows = None
+
+    def run(self, tree, size=None):
+        """Evaluate tree and return an array with its value for every row,
+        or None if tree has no value. size must be given if no column
+        has been given."""
+        if self.size is None:
+            self.size = size
+        if self.size is None:
+            raise BatchException("unknown number of rows")
+        value = tree.accept(self)
+        if value is None:
+            return None
+        return np.array(np.broadcast_to(value, (self.size,)),
+                        dtype=np.int64)
+
+    def select(self, mask, node, method=None):
+        """Evaluate node (using method, defaulting to accept) over the rows
+        where mask is true only. Return None if no row is selected."""
+        if mask is True or (mask is not False and mask.all()):
+            return node.accept(self) if method is None else method(node)
+        if mask is False or not mask.any():
+            return None
+        saved = self.rows
+        selected = np.flatnonzero(mask)
+        self.rows = selected if saved is None else saved[selected]
+        try:
+            return node.accept(self) if method is None else method(node)
+        finally:
+            self.rows = saved
+
+    def merge(self, mask, then_value, else_value):
+        """Combine values computed over the rows where mask is respectively
+        true and false."""
+        if mask is True or mask is False:
+            return then_value if mask else else_value
+        if mask.all():
+            return then_value
+        if not mask.any():
+            return else_value
+        if then_value is None and else_value is None:
+            return None
+        result = np.empty(len(mask),
+                          dtype=np.result_type(then_value, else_value))
+        result[mask] = then_value
+        result[~mask] = else_value
+        return result
+
+    def condition(self, node):
+        """Evaluate node as a condition and return a boolean mask, or a
+        boolean when it is the same for all the rows."""
+        if isinstance(node, BinaryOperator):
+            op = node.op
+            if op in COMPARISONS:
+                result = COMPARISONS[op](node.left.accept(self),
+                                         node.right.accept(self))
+                return bool(result) if np.ndim(result) == 0 else result
+            if op == '&':
+                left = self.condition(node.left)
+                return self.merge(left,
+                                  self.select(left, node.right,
+                                              self.condition), False)
+            if op == '|':
+                left = self.condition(node.left)
+                return self.merge(left, True,
+                                  self.select(invert(left), node.right,
+                                              self.condition))
+        value = node.accept(self)
+        return bool(value) if np.ndim(value) == 0 else value != 0
+
+    def read(self, decl):
+        value = self.values[decl]
+        if self.rows is None or np.ndim(value) == 0:
+            # The value may now be shared with another variable or be an
+            # operand still to be used, so that it cannot be assigned in
+            # place any longer.
+            self.owned.discard(decl)
+            return value
+        return value[self.rows]
+
+    def write(self, decl, value):
+        if self.rows is None:
+            # The value may be shared with another variable or column.
+            self.values[decl] = value
+            self.owned.discard(decl)
+            return
+        if decl not in self.owned:
+            self.values[decl] = np.array(
+                np.broadcast_to(self.values.get(decl, 0), (self.size,)),
+                dtype=np.int64)
+            self.owned.add(decl)
+        self.values[decl][self.rows] = value
+
+    @visitor(None)
+    def visit(self, node):
+        raise BatchException("no batch evaluation defined for %s" % node)
+
+    @visitor(IntegerLiteral)
+    def visit(self, literal):
+        return np.int64(literal.intValue)
+
+    @visitor(Identifier)
+    def visit(self, identifier):
+        return self.read(identifier.decl)
+
+    @visitor(BinaryOperator)
+    def visit(self, binop):
+        op = binop.op
+        if op in COMPARISONS or op == '&' or op == '|':
+            condition = self.condition(binop)
+            return np.int64(condition) if condition is True or \
+                condition is False else condition.astype(np.int64)
+        left = binop.left.accept(self)
+        right = binop.right.accept(self)
+        if op == '+':
+            return left + right
+        elif op == '-':
+            return left - right
+        elif op == '*':
+            return left * right
+        elif op == '/':
+            if np.any(right == 0):
+                raise ZeroDivisionError("division by zero")
+            # Truncate towards zero as int(left / right) does.
+            return (left / right).astype(np.int64)
+        else:
+            raise BatchException("unknown operator %s" % op)
+
+    @visitor(IfThenElse)
+    def visit(self, ifthenelse):
+        mask = self.condition(ifthenelse.condition)
+        then_value = self.select(mask, ifthenelse.then_part)
+        if ifthenelse.else_part is None:
+            return None
+        else_value = self.select(invert(mask), ifthenelse.else_part)
+        return self.merge(mask, then_value, else_value)
+
+    @visitor(SeqExp)
+    def visit(self, seq):
+        value = None
+        for exp in seq.exps:
+            value = exp.accept(self)
+        return value
+
+    @visitor(Let)
+    def visit(self, let):
+        for decl in let.decls:
+            if not isinstance(decl, VarDecl):
+                raise BatchException("no batch evaluation defined for %s" %
+                                     decl)
+            self.write(decl, decl.exp.accept(self))
+        value = None
+        for exp in let.exps:
+            value = exp.accept(self)
+        return value
+
+    @visitor(Assignment)
+    def visit(self, assignment):
+        self.write(assignment.identifier.decl, assignment.exp.accept(self))
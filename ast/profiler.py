@@ -0,0 +1,129 @@
+import time
+from collections import defaultdict
+
+
+class FunctionProfile:
+    """Statistics gathered for a function."""
+
+    __slots__ = ('name', 'lineno', 'calls', 'inclusive', 'exclusive',
+                 'active')
+
+    def __init__(self, name, lineno):
+        self.name = name
+        self.lineno = lineno
+        self.calls = 0
+        self.inclusive = 0.0
+        self.exclusive = 0.0
+        # Number of activations currently running, used so that the
+        # inclusive time of recursive functions is not counted twice.
+        self.active = 0
+
+
+class Profiler:
+    """Collect execution statistics from the StackEvaluator.
+
+    The evaluator calls `enter` and `leave` around every function body
+    evaluation, `iteration` for every loop iteration and `broke` for every
+    executed break. Call stacks are interned in a tree so that entering a
+    function costs a dictionary lookup whatever the recursion depth; the
+    exclusive time of every distinct call stack is kept to produce a
+    collapsed-stack file suitable for flame graph tools.
+
+    The top-level expression is accounted for as a function called
+    `main`."""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.functions = {}
+        self.iterations = defaultdict(int)
+        self.breaks = defaultdict(int)
+        # Interned call stacks: (parent stack, function) -> stack index.
+        self.stack_index = {}
+        self.stack_parent = [None]
+        self.stack_function = [None]
+        self.stack_time = [0.0]
+        # Running activations: [function profile, stack index, start time,
+        # time spent in callees].
+        self.running = []
+
+    def function(self, decl):
+        profile = self.functions.get(decl)
+        if profile is None:
+            profile = FunctionProfile(decl.name if decl else "main",
+                                      getattr(decl, 'lineno', None))
+            self.functions[decl] = profile
+        return profile
+
+    def enter(self, decl):
+        """Record the start of the evaluation of a function body. decl is
+        None for the top-level expression."""
+        profile = self.function(decl)
+        profile.calls += 1
+        profile.active += 1
+        parent = self.running[-1][1] if self.running else 0
+        key = (parent, profile)
+        stack = self.stack_index.get(key)
+        if stack is None:
+            stack = len(self.stack_parent)
+            self.stack_index[key] = stack
+            self.stack_parent.append(parent)
+            self.stack_function.append(profile)
+            self.stack_time.append(0.0)
+        self.running.append([profile, stack, self.clock(), 0.0])
+
+    def leave(self):
+        """Record the end of the innermost function body evaluation."""
+        profile, stack, start, children = self.running.pop()
+        elapsed = self.clock() - start
+        profile.exclusive += elapsed - children
+        self.stack_time[stack] += elapsed - children
+        profile.active -= 1
+        if not profile.active:
+            profile.inclusive += elapsed
+        if self.running:
+            self.running[-1][3] += elapsed
+
+    def close(self):
+        """Leave all the running functions, for example after the
+        evaluation has been aborted."""
+        while self.running:
+            self.leave()
+
+    def iteration(self, loop):
+        self.iterations[loop] += 1
+
+    def broke(self, b):
+        self.breaks[b] += 1
+
+    def report(self, stream):
+        """Write a human readable report."""
+        self.close()
+        stream.write("%-24s %6s %10s %14s %14s\n" %
+                     ("function", "line", "calls", "inclusive (ms)",
+                      "exclusive (ms)"))
+        for f in sorted(self.functions.values(), key=lambda f: -f.exclusive):
+            stream.write("%-24s %6s %10d %14.3f %14.3f\n" %
+                         (f.name, f.lineno or "", f.calls,
+                          f.inclusive * 1000, f.exclusive * 1000))
+        for (loop, count) in sorted(self.iterations.items(),
+                                    key=lambda c: -c[1]):
+            stream.write("%s loop at line %s: %d iterations\n" %
+                         (type(loop).__name__.lower(),
+                          getattr(loop, 'lineno', "?"), count))
+        for (b, count) in sorted(self.breaks.items(), key=lambda c: -c[1]):
+            stream.write("break at line %s: %d times\n" %
+                         (getattr(b, 'lineno', "?"), count))
+
+    def write_collapsed(self, stream):
+        """Write the exclusive time, in microseconds, of every call stack
+        in the collapsed format (`main;f;g 1234`) used by flame graph
+        tools."""
+        self.close()
+        names = [None]
+        for stack in range(1, len(self.stack_parent)):
+            parent = names[self.stack_parent[stack]]
+            name = self.stack_function[stack].name
+            names.append(name if parent is None else parent + ";" + name)
+            weight = int(self.stack_time[stack] * 1e6)
+            if weight:
+                stream.write("%s %d\n" % (names[stack], weight))
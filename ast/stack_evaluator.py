@@ -0,0 +1,357 @@
+import sys
+from collections import OrderedDict
+
+from ast.nodes import *
+from utils.visitor import visitor
+
+# Value sent back to a loop when a break targeting it has been executed.
+BREAK = object()
+
+
+class Activation:
+    """The variables of a function activation, keyed by declaration, and
+    the activation of the statically enclosing function."""
+
+    __slots__ = ('values', 'link')
+
+    def __init__(self, values, link):
+        self.values = values
+        self.link = link
+
+
+class Invoke:
+    """Request to evaluate the body of a function in a new activation."""
+
+    __slots__ = ('decl', 'activation', 'tail')
+
+    def __init__(self, decl, activation, tail):
+        self.decl = decl
+        self.activation = activation
+        self.tail = tail
+
+
+def operate(op, left, right):
+    """Apply a non short-circuiting binary operator."""
+    if op == '+':
+        return left + right
+    elif op == '*':
+        return left * right
+    elif op == '-':
+        return left - right
+    elif op == '/':
+        return int(left / right)
+    elif op == '<':
+        return int(left < right)
+    elif op == '<=':
+        return int(left <= right)
+    elif op == '>':
+        return int(left > right)
+    elif op == '>=':
+        return int(left >= right)
+    elif op == '=':
+        return int(left == right)
+    elif op == '<>':
+        return int(left != right)
+    else:
+        raise SyntaxError("unknown operator %s" % op)
+
+
+def analyze(tree):
+    """Return the set of function calls in tail position in the bodies of
+    the functions declared in tree, and the set of simple expressions
+    (made only of literals, identifiers and binary operators) which can
+    be evaluated without suspending."""
+    tail_calls, simple = set(), set()
+
+    def mark(node):
+        if isinstance(node, FunCall):
+            tail_calls.add(node)
+        elif isinstance(node, IfThenElse):
+            mark(node.then_part)
+            if node.else_part is not None:
+                mark(node.else_part)
+        elif isinstance(node, SeqExp) and node.exps:
+            mark(node.exps[-1])
+        elif isinstance(node, Let) and node.exps:
+            mark(node.exps[-1])
+
+    # Visit the nodes in reverse preorder so that children are seen before
+    # their parent.
+    nodes, order = [tree], []
+    while nodes:
+        node = nodes.pop()
+        order.append(node)
+        if isinstance(node, FunDecl):
+            mark(node.exp)
+        nodes.extend(node.children)
+    for node in reversed(order):
+        if isinstance(node, (IntegerLiteral, Identifier)) or \
+           (isinstance(node, BinaryOperator) and node.left in simple and
+                node.right in simple):
+            simple.add(node)
+    return tail_calls, simple
+
+
+class StackEvaluator:
+    """Evaluate a bound AST without using the Python stack for Tiger
+    function calls.
+
+    Every visitor method is a generator: it yields the child nodes it needs
+    the value of and receives this value back, and its return value is the
+    value of the node. The `run` method drives those generators using an
+    explicit stack, so the depth of Tiger recursion is only limited by the
+    available memory. Breaks and simple expressions, which cannot call a
+    function, are handled directly by the driver to avoid creating a
+    generator for them.
+
+    When `memoize` is True, the functions found pure by the purity analysis
+    are memoized on the values of their arguments in a table holding at
+    most `memo_size` entries, the least recently used one being evicted
+    first. Calls in tail position are looked up in this table but their
+    result is not recorded, to keep their evaluation in constant stack
+    space.
+
+    Calls in tail position in a function body do not grow the stack: the
+    generators of the current function body are dropped and replaced by
+    the one of the called function body.
+
+    When a `profiler` (see ast.profiler) is given, it is told about every
+    function body evaluation, loop iteration and executed break. Calls
+    answered from the memoization table are not function body evaluations
+    and are not reported."""
+
+    def __init__(self, output=None, memoize=True, memo_size=1 << 16,
+                 profiler=None):
+        self.output = output if output is not None else sys.stdout
+        self.activation = None
+        self.tail_calls = set()
+        self.simple = set()
+        self.memoize = memoize
+        self.memo_size = memo_size
+        self.memo = OrderedDict()
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self.purity = None
+        self.profiler = profiler
+
+    def __getstate__(self):
+        # The output stream cannot be saved, it is reset to the standard
+        # output when restored.
+        state = self.__dict__.copy()
+        del state['output']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.output = sys.stdout
+
+    def run(self, tree, activation=None):
+        """Evaluate tree in the given activation (or a new top-level one)
+        and return its value. The analyses made on tree are kept, so that
+        functions declared in tree may be called from trees evaluated
+        later in an activation reachable from this one."""
+        tail_calls, simple = analyze(tree)
+        self.tail_calls |= tail_calls
+        self.simple |= simple
+        if self.memoize:
+            if self.purity is None:
+                from semantics.purity import PurityAnalysis
+                self.purity = PurityAnalysis()
+            self.purity.run(tree)
+        self.activation = activation if activation is not None \
+            else Activation({}, None)
+
+        def root():
+            return (yield tree)
+
+        gen, node = root(), None
+        # Suspended generators along with the node they evaluate.
+        stack = []
+        # For every function being evaluated, the index in stack at which
+        # its body starts and the activation of the caller.
+        frames = []
+        value = None
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.enter(None)
+        while True:
+            try:
+                request = gen.send(value)
+            except StopIteration as e:
+                value = e.value
+                if not stack:
+                    if profiler is not None:
+                        profiler.leave()
+                    return value
+                if frames and len(stack) == frames[-1][0]:
+                    self.activation = frames.pop()[1]
+                    if profiler is not None:
+                        profiler.leave()
+                gen, node = stack.pop()
+                continue
+            cls = type(request)
+            if request in self.simple:
+                value = self.expression(request)
+            elif cls is Invoke:
+                if profiler is not None:
+                    if request.tail and frames:
+                        profiler.leave()
+                    profiler.enter(request.decl)
+                if request.tail and frames:
+                    del stack[frames[-1][0]:]
+                else:
+                    stack.append((gen, node))
+                    frames.append((len(stack), self.activation))
+                self.activation = request.activation
+                node = request.decl.exp
+                gen = self.simple_body(node) if node in self.simple \
+                    else node.accept(self)
+                value = None
+            elif cls is Break:
+                if profiler is not None:
+                    profiler.broke(request)
+                while node is not request.loop:
+                    gen, node = stack.pop()
+                value = BREAK
+            else:
+                stack.append((gen, node))
+                gen, node, value = request.accept(self), request, None
+
+    def expression(self, node):
+        """Evaluate a simple expression directly."""
+        cls = type(node)
+        if cls is IntegerLiteral:
+            return node.intValue
+        if cls is Identifier:
+            activation = self.activation
+            for _ in range(node.depth - node.decl.depth):
+                activation = activation.link
+            return activation.values[node.decl]
+        op = node.op
+        left = self.expression(node.left)
+        if op == '&':
+            return 1 if left and self.expression(node.right) else 0
+        if op == '|':
+            return 1 if left or self.expression(node.right) else 0
+        return operate(op, left, self.expression(node.right))
+
+    def simple_body(self, node):
+        """Generator evaluating a function body made of a simple
+        expression, which may have no visitor method."""
+        return self.expression(node)
+        yield
+
+    def intrinsic(self, name, args):
+        if name == 'print_int':
+            self.output.write("%d\n" % args[0])
+        elif name == 'exit':
+            raise SystemExit(args[0])
+        else:
+            raise SyntaxError("unknown intrinsic %s" % name)
+
+    @visitor(None)
+    def visit(self, node):
+        raise SyntaxError("no evaluation defined for %s" % node)
+
+    @visitor(BinaryOperator)
+    def visit(self, binop):
+        op = binop.op
+        left = yield binop.left
+        if op == '&':
+            return 1 if left and (yield binop.right) else 0
+        if op == '|':
+            return 1 if left or (yield binop.right) else 0
+        return operate(op, left, (yield binop.right))
+
+    @visitor(IfThenElse)
+    def visit(self, ifthenelse):
+        if (yield ifthenelse.condition) != 0:
+            return (yield ifthenelse.then_part)
+        elif ifthenelse.else_part is not None:
+            return (yield ifthenelse.else_part)
+
+    @visitor(SeqExp)
+    def visit(self, seq):
+        value = None
+        for exp in seq.exps:
+            value = yield exp
+        return value
+
+    @visitor(Let)
+    def visit(self, let):
+        values = self.activation.values
+        for decl in let.decls:
+            # Functions do not need anything at declaration time, the
+            # static link is computed when they are called.
+            if isinstance(decl, VarDecl):
+                values[decl] = yield decl.exp
+        value = None
+        for exp in let.exps:
+            value = yield exp
+        return value
+
+    @visitor(Assignment)
+    def visit(self, assignment):
+        value = yield assignment.exp
+        identifier = assignment.identifier
+        activation = self.activation
+        for _ in range(identifier.depth - identifier.decl.depth):
+            activation = activation.link
+        activation.values[identifier.decl] = value
+
+    @visitor(While)
+    def visit(self, w):
+        profiler = self.profiler
+        while (yield w.condition):
+            if profiler is not None:
+                profiler.iteration(w)
+            if (yield w.exp) is BREAK:
+                break
+
+    @visitor(For)
+    def visit(self, f):
+        values = self.activation.values
+        index = yield f.low_bound
+        high = yield f.high_bound
+        profiler = self.profiler
+        while index <= high:
+            values[f.indexdecl] = index
+            if profiler is not None:
+                profiler.iteration(f)
+            if (yield f.exp) is BREAK:
+                break
+            index += 1
+
+    @visitor(FunCall)
+    def visit(self, call):
+        args = []
+        for param in call.params:
+            args.append((yield param))
+        identifier = call.identifier
+        decl = identifier.decl
+        if isinstance(decl.exp, Intrinsics):
+            return self.intrinsic(decl.name, args)
+        link = self.activation
+        for _ in range(identifier.depth - decl.depth):
+            link = link.link
+        activation = Activation(dict(zip(decl.args, args)), link)
+        if self.purity is None or decl not in self.purity.pure:
+            return (yield Invoke(decl, activation, call in self.tail_calls))
+        # A pure function only depends on its arguments, the static link
+        # does not need to be part of the key.
+        key = (decl, tuple(args))
+        memo = self.memo
+        if key in memo:
+            self.memo_hits += 1
+            memo.move_to_end(key)
+            return memo[key]
+        self.memo_misses += 1
+        # Keep the stack bounded for tail calls rather than recording
+        # their result.
+        if call in self.tail_calls:
+            return (yield Invoke(decl, activation, True))
+        value = yield Invoke(decl, activation, False)
+        memo[key] = value
+        if len(memo) > self.memo_size:
+            memo.popitem(last=False)
+        return value
@@ -0,0 +1,70 @@
+import io
+import unittest
+
+try:
+    import numpy as np
+    from ast.batch_evaluator import BatchException, evaluate, prepare
+except ImportError:
+    np = None
+from ast.stack_evaluator import Activation, StackEvaluator
+
+@unittest.skipIf(np is None, "NumPy is not available")
+class TestBatchEvaluator(unittest.TestCase):
+
+    def setUp(self):
+        self.x = np.arange(-50, 50)
+        self.y = np.arange(100) % 7 - 3
+
+    def check(self, text):
+        """Compare the batch evaluation of text with the evaluation of every
+        row by the StackEvaluator."""
+        columns = {'x': self.x, 'y': self.y}
+        result = evaluate(text, columns)
+        tree, decls = prepare(text, ['x', 'y'])
+        for i in range(len(self.x)):
+            evaluator = StackEvaluator(io.StringIO(), memoize=False)
+            values = {decls[0]: int(self.x[i]), decls[1]: int(self.y[i])}
+            self.assertEqual(result[i],
+                             evaluator.run(tree, Activation(values, None)),
+                             "%s for x = %d, y = %d" %
+                             (text, self.x[i], self.y[i]))
+        return result
+
+    def test_arithmetic(self):
+        self.check('x * 3 + y - 7')
+        self.check('(x < y) + (x >= 0) * 2')
+        self.assertEqual(list(self.check('42')), [42] * 100)
+
+    def test_division(self):
+        self.check('x / 3 + (0 - x) / 7')
+        self.assertRaises(ZeroDivisionError, evaluate, 'x / y',
+                          {'x': self.x, 'y': self.y})
+
+    def test_short_circuit(self):
+        self.check('y <> 0 & x / y > 2')
+        self.check('y = 0 | x / y < 0')
+        self.check('if y <> 0 then x / y else x')
+        self.check('if x < 0 then (if y = 0 then 1 else x / y) else 2')
+
+    def test_assignments(self):
+        self.check('let var s := x in if y > 0 then s := s * y; s end')
+        self.check('let var s := 0 in '
+                   '(if x > 10 & (s := 1; y > 0) then s := s + 10); s end')
+        # Columns are never modified.
+        self.check('let var z := x in if y > 0 then z := 0; x + z end')
+        self.assertEqual(list(self.x), list(range(-50, 50)))
+        # Variables are not changed through another one sharing its value,
+        self.check('let var s := x in (if y > 0 then s := 0); '
+                   'let var z := s in (if y > 0 then s := 5); z end end')
+        # nor is a value already read.
+        self.check('let var s := x in (if y > 0 then s := 0); '
+                   's + ((if y > 0 then s := 100 else ()); 0) end')
+
+    def test_unsupported(self):
+        self.assertRaises(BatchException, evaluate,
+                          'while x do ()', {'x': self.x})
+        self.assertRaises(BatchException, evaluate,
+                          'x', {'x': self.x, 'y': self.y[:10]})
+
+if __name__ == '__main__':
+    unittest.main()
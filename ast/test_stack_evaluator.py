@@ -0,0 +1,141 @@
+import glob
+import io
+import os
+import unittest
+
+from ast.profiler import Profiler
+from ast.stack_evaluator import StackEvaluator
+from parser.parser import parse
+from semantics.binder import Binder
+from semantics.purity import PurityAnalysis
+from typer.typer import Typer
+
+TESTS = os.path.join(os.path.dirname(os.path.dirname(__file__)), "tests")
+
+class TestStackEvaluator(unittest.TestCase):
+
+    def parse_bind(self, text):
+        tree = parse(text)
+        tree.accept(Binder())
+        Typer().run(tree, False)
+        return tree
+
+    def run_text(self, text, memoize=True):
+        output = io.StringIO()
+        evaluator = StackEvaluator(output, memoize=memoize)
+        return evaluator.run(self.parse_bind(text)), output.getvalue()
+
+    def check(self, text, expected):
+        self.assertEqual(self.run_text(text)[0], expected)
+
+    def test_expressions(self):
+        self.check('1 + 2 * 3', 7)
+        self.check('7 / 2', 3)
+        self.check('0 & 2 / 0', 0)
+        self.check('if 0 then 100 else 200 + 300', 500)
+
+    def test_static_links(self):
+        self.check('let var a := 1 '
+                   'function f(n: int): int = '
+                   '  let function g(): int = a + n in g() end '
+                   'in a := 10; f(5) end', 15)
+        self.check('let var a := 4 function get(): int = a '
+                   'function one(): int = 1 in get() + one() end', 5)
+
+    def test_breaks(self):
+        self.check('let var a := 0 in '
+                   'for i := 1 to 10 do (while 1 do (a := a + 1; break); '
+                   'if i = 5 then break); a end', 5)
+
+    def test_deep_recursion(self):
+        self.check('let function sum(n: int): int = '
+                   'if n = 0 then 0 else n + sum(n - 1) in sum(20000) end',
+                   200010000)
+
+    def test_tail_calls(self):
+        self.check('let function sum(n: int, a: int): int = '
+                   'if n = 0 then a else sum(n - 1, a + n) '
+                   'in sum(20000, 0) end', 200010000)
+
+    def test_purity(self):
+        analysis = PurityAnalysis()
+        analysis.run(self.parse_bind(
+            'let var a := 1 '
+            'function fibo(n: int): int = '
+            '  if n < 2 then n else fibo(n - 1) + fibo(n - 2) '
+            'function reader(): int = a '
+            'function writer() = a := 2 '
+            'function printer() = print_int(fibo(3)) '
+            'function caller(): int = reader() + 1 '
+            'function outer(n: int): int = '
+            '  let function inner(m: int): int = m * 2 in inner(n) end '
+            'in 0 end'))
+        self.assertEqual(analysis.report(),
+                         ["fibo: pure",
+                          "reader: impure (reads a)",
+                          "writer: impure (assigns a)",
+                          "printer: impure (calls print_int)",
+                          "caller: impure (calls impure reader)",
+                          "outer: pure",
+                          "outer$inner: pure"])
+
+    def test_memoization(self):
+        text = 'let function fibo(n: int): int = ' \
+               'if n < 2 then n else fibo(n - 1) + fibo(n - 2) ' \
+               'in print_int(fibo(20)); fibo(15) end'
+        self.assertEqual(self.run_text(text, memoize=True),
+                         self.run_text(text, memoize=False))
+        output = io.StringIO()
+        evaluator = StackEvaluator(output, memo_size=8)
+        evaluator.run(self.parse_bind(text))
+        self.assertEqual(output.getvalue(), "6765\n")
+        self.assertLessEqual(len(evaluator.memo), 8)
+        self.assertGreater(evaluator.memo_hits, 0)
+
+    def test_profiler(self):
+        ticks = iter(range(1000000))
+        profiler = Profiler(clock=lambda: next(ticks))
+        evaluator = StackEvaluator(io.StringIO(), memoize=False,
+                                   profiler=profiler)
+        self.assertEqual(evaluator.run(self.parse_bind(
+            'let function f(n: int): int =\n'
+            '  if n = 0 then 0 else 1 + f(n - 1)\n'
+            'function g(n: int): int = if n = 0 then 0 else g(n - 1)\n'
+            'var a := 0\n'
+            'in while 1 do\n'
+            '  (a := a + 1; if a = 3 then break);\n'
+            'for i := 1 to 4 do a := a + f(2) + g(2); a end')), 11)
+        functions = dict((f.name, (f.lineno, f.calls))
+                         for f in profiler.functions.values())
+        self.assertEqual(functions, {'main': (None, 1), 'f': (1, 12),
+                                     'g': (3, 12)})
+        self.assertEqual(dict((type(loop).__name__, (loop.lineno, count))
+                              for (loop, count) in
+                              profiler.iterations.items()),
+                         {'While': (5, 3), 'For': (7, 4)})
+        self.assertEqual([(b.lineno, count)
+                          for (b, count) in profiler.breaks.items()],
+                         [(6, 1)])
+        # Every enter and leave reads the clock once: the exclusive times
+        # add up to the inclusive time of the whole program.
+        main = profiler.functions[None]
+        self.assertEqual(sum(f.exclusive
+                             for f in profiler.functions.values()),
+                         main.inclusive)
+        output = io.StringIO()
+        profiler.write_collapsed(output)
+        stacks = [line.rsplit(" ", 1)[0]
+                  for line in output.getvalue().splitlines()]
+        self.assertEqual(stacks, ["main", "main;f", "main;f;f", "main;f;f;f",
+                                  "main;g"])
+
+    def test_tests_directory(self):
+        for filename in sorted(glob.glob(os.path.join(TESTS, "*.tiger"))):
+            with open(filename) as fd:
+                content = fd.read()
+            expected = content.split("\n")[0].lstrip("/ ")
+            _, output = self.run_text(content)
+            self.assertEqual(output.strip(), expected, filename)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,145 +1,523 @@
-from codegen.liveness import liveness_analysis
+from codegen.liveness import InterferenceGraph
 from codegen.instr import LABEL as L, MOVE as M, OPER as O
+from flow.loops import Loops
 from ir.nodes import Temp
 
 class Spill(Exception):
 
-    def __init__(self, temp):
-        super().__init__("Temporary {} requires spilling".format(temp))
-        self.temp = temp
-
-def colorize(frame, instrs):
-    """Return a map of registers allocation or fail with a Spill exception if
-    a color cannot be allocated for a register."""
-    interferences, coalesces = liveness_analysis(frame, instrs)
-    # List of mappings after register allocation or coalescing
-    remapped = {}
-    # Number of registers
-    k = len(frame.registers)
-    # Stack of registers to later color when unstacking
-    stack = []
-    # Temporaries not stacked yet
-    temporaries = set(interferences.keys()).difference(frame.registers)
-
-    def canon(reg):
-        """Find the canonical representation of a register in the remapping table.
-        Mappings are updated to the final destination while the call chain gets rewound."""
-        target = remapped.get(reg)
-        if target:
-            final = canon(target)
-            if final != target:
-                remapped[reg] = final
-            return final
-        return reg
-
-    def mark_coalesced(a, b):
-        """Coalesce a and b. Physical registers are always selected as the target. If one of them
-        is a physical register, it will always be the target of the remapping. The interferences
-        entry for a will be merged into the one of b then removed, same for the coalesces entries.
-        Also, a will be removed from the temporaries as it has been taken care of."""
-        a, b = canon(a), canon(b)
-        if a in frame.registers:
-            assert b not in frame.registers, "cannot coalesce physical registers {} and {}".format(a, b)
-            a, b = b, a
-        remapped[a] = b
-        raise NotImplementedError("marking registers as coalesced")
-
-    def push_to_stack(t):
-        """Push a temporary and its interferences to the stack, and clear its
-        interferences in the live tree. Also remove it from the temporaries list.
-        Pushing the interferences of the temporary along with it allows to easily
-        determine an available color when unstacking."""
-        raise NotImplementedError("push to stack")
+    def __init__(self, temps):
+        super().__init__("Temporaries {} require spilling".format(
+            ", ".join(str(t) for t in temps)))
+        self.temps = temps
+
+# States of the MOVE operations during the coloring.
+WORKLIST, ACTIVE, COALESCED, CONSTRAINED, FROZEN = range(5)
+
+def block_weights(cfg):
+    """Return the estimated number of executions of every block of cfg,
+    relative to the entry block: 10 to the power of its loop nesting
+    depth (see flow.loops.Loops)."""
+    depth = cfg.analysis(Loops).depth
+    return [10 ** depth[b] for b in range(len(cfg))]
+
+def colorize(frame, instrs, stats=None, graph=None, unspillable=()):
+    """Allocate registers with the iterated register coalescing of George
+    and Appel, and return the instructions using only physical registers,
+    or fail with a Spill exception giving the temporaries for which a color
+    cannot be allocated. The interferences are taken from graph, an
+    InterferenceGraph of the instructions, which is built if not given.
+    The temporaries of unspillable are only chosen for spilling when no
+    other one can be.
+
+    Every temporary is a node, numbered from 0, the physical registers of
+    the frame coming first. Those are precolored, and the temporaries can
+    get any of them but the stack and frame pointers. Every node is in
+    exactly one of the simplify, freeze and spill worklists, the set of
+    the coalesced nodes or the stack, and every pair of temporaries
+    susceptible of coalescing (a move) in exactly one of the worklist,
+    active, coalesced, constrained or frozen states.
+
+    If stats is given, the number of MOVE instructions and the number of
+    MOVE instructions removed after the coloring are added to its "moves"
+    and "eliminated" entries."""
+    if graph is None:
+        graph = InterferenceGraph(frame, instrs)
+    interferences, coalesces = graph.interferences, graph.coalesces
+    # Nodes and their numbering
+    nodes = list(frame.registers)
+    precolored = len(nodes)
+    nodes += sorted(set(interferences).difference(frame.registers),
+                    key=lambda t: t.id)
+    index = dict((t, n) for (n, t) in enumerate(nodes))
+    count = len(nodes)
+    # Colors are the indices of the registers temporaries may be put into
+    colors = [n for n in range(precolored)
+              if nodes[n] not in (frame.sp, frame.fp)]
+    all_colors = sum(1 << c for c in colors)
+    k = len(colors)
+    # Interferences, as a triangular bit matrix and as adjacency lists
+    # (not maintained for precolored nodes, which are never simplified).
+    matrix = bytearray((count * (count + 1) // 2 + 7) // 8)
+    adj_list = [[] for _ in range(count)]
+    degree = [0] * count
+    infinite = count + k
+    for n in range(precolored):
+        degree[n] = infinite
+    # Moves and, for every node, the moves it is involved in
+    moves = []
+    move_list = [set() for _ in range(count)]
+    move_state = []
+    worklist_moves = []
+    # Node sets
+    simplify_worklist, freeze_worklist, spill_worklist = set(), set(), set()
+    coalesced, spilled = set(), []
+    select_stack = []
+    on_stack = bytearray(count)
+    alias = list(range(count))
+    color = list(range(precolored)) + [None] * (count - precolored)
+    # Number of definitions and uses of every node, weighted by the loop
+    # nesting depth of the instructions, used to choose the temporaries to
+    # spill.
+    occurrences = [0] * count
+
+    def adjacent(u, v):
+        """Check whether u and v interfere in the bit matrix."""
+        if u > v:
+            u, v = v, u
+        i = v * (v + 1) // 2 + u
+        return matrix[i >> 3] & (1 << (i & 7))
+
+    def add_edge(u, v):
+        if u == v or adjacent(u, v):
+            return
+        if u > v:
+            i = u * (u + 1) // 2 + v
+        else:
+            i = v * (v + 1) // 2 + u
+        matrix[i >> 3] |= 1 << (i & 7)
+        if u >= precolored:
+            adj_list[u].append(v)
+            degree[u] += 1
+        if v >= precolored:
+            adj_list[v].append(u)
+            degree[v] += 1
+
+    def build():
+        """Build the interference graph and the moves from the liveness
+        analysis results. Physical registers always conflict and do not
+        need edges between them."""
+        for (t, others) in interferences.items():
+            u = index[t]
+            for other in others:
+                v = index[other]
+                if u < v and v >= precolored:
+                    add_edge(u, v)
+        for (t, others) in coalesces.items():
+            u = index[t]
+            for other in others:
+                v = index[other]
+                if u < v:
+                    m = len(moves)
+                    moves.append((u, v))
+                    move_state.append(WORKLIST)
+                    worklist_moves.append(m)
+                    move_list[u].add(m)
+                    move_list[v].add(m)
+        cfg = graph.cfg
+        for (b, weight) in enumerate(block_weights(cfg)):
+            for i in range(cfg.start(b), cfg.end(b)):
+                for t in instrs[i].defs() + instrs[i].uses():
+                    occurrences[index[t]] += weight
+
+    def neighbours(n):
+        """Return the nodes adjacent to n still in the graph."""
+        return [m for m in adj_list[n]
+                if not on_stack[m] and m not in coalesced]
+
+    def node_moves(n):
+        return [m for m in move_list[n]
+                if move_state[m] in (WORKLIST, ACTIVE)]
+
+    def move_related(n):
+        return any(move_state[m] in (WORKLIST, ACTIVE)
+                   for m in move_list[n])
+
+    def make_worklists():
+        for n in range(precolored, count):
+            if degree[n] >= k:
+                spill_worklist.add(n)
+            elif move_related(n):
+                freeze_worklist.add(n)
+            else:
+                simplify_worklist.add(n)
+
+    def enable_moves(ns):
+        for n in ns:
+            for m in node_moves(n):
+                if move_state[m] == ACTIVE:
+                    move_state[m] = WORKLIST
+                    worklist_moves.append(m)
+
+    def decrement_degree(m):
+        d = degree[m]
+        degree[m] = d - 1
+        if d == k and m >= precolored:
+            enable_moves([m] + neighbours(m))
+            spill_worklist.discard(m)
+            if move_related(m):
+                freeze_worklist.add(m)
+            else:
+                simplify_worklist.add(m)
 
     def simplify():
-        """Push one temporary of insignificant degree not involved in a MOVE operation
-        to the stack and return it. It gets removed from the temporaries list. If none is
-        found, return None."""
-        raise NotImplementedError("simplify")
+        """Push a node of insignificant degree not involved in a MOVE
+        operation to the stack, and remove its edges from the graph."""
+        n = simplify_worklist.pop()
+        select_stack.append(n)
+        on_stack[n] = 1
+        for m in neighbours(n):
+            decrement_degree(m)
+
+    def get_alias(n):
+        while n in coalesced:
+            n = alias[n]
+        return n
+
+    def add_worklist(u):
+        if u >= precolored and not move_related(u) and degree[u] < k:
+            freeze_worklist.discard(u)
+            simplify_worklist.add(u)
+
+    def ok(t, r):
+        """George test: t, a neighbour of a node to be merged into r, does
+        not prevent the merge."""
+        return degree[t] < k or t < precolored or adjacent(t, r)
+
+    def conservative(u, v):
+        """Briggs test: the node merging u and v would have fewer than k
+        neighbours of significant degree. The neighbours are only looked
+        at until k of them are found."""
+        significant = set()
+        for n in (u, v):
+            for t in adj_list[n]:
+                if degree[t] >= k and not on_stack[t] and \
+                   t not in coalesced:
+                    significant.add(t)
+                    if len(significant) >= k:
+                        return False
+        return True
+
+    def combine(u, v):
+        if v in freeze_worklist:
+            freeze_worklist.remove(v)
+        else:
+            spill_worklist.remove(v)
+        coalesced.add(v)
+        alias[v] = u
+        move_list[u] |= move_list[v]
+        enable_moves([v])
+        for t in neighbours(v):
+            add_edge(t, u)
+            decrement_degree(t)
+        if degree[u] >= k and u in freeze_worklist:
+            freeze_worklist.remove(u)
+            spill_worklist.add(u)
 
     def coalesce():
-        """Coalesce two temporaries involved in a MOVE operation so that they do not
-        prevent the new node from being simplified. Return the pair that has been coalesced
-        or None otherwise."""
-        raise NotImplementedError("coalesce")
+        """Coalesce the two nodes of a move from the worklist, if they do
+        not interfere and if the Briggs test or, when one of them is a
+        physical register, the George test says that the merged node will
+        not make the graph uncolorable. Physical registers are always
+        selected as the target."""
+        m = worklist_moves.pop()
+        if move_state[m] != WORKLIST:
+            return
+        x, y = get_alias(moves[m][0]), get_alias(moves[m][1])
+        u, v = (y, x) if y < precolored else (x, y)
+        if u == v:
+            move_state[m] = COALESCED
+            add_worklist(u)
+        elif v < precolored or adjacent(u, v):
+            move_state[m] = CONSTRAINED
+            add_worklist(u)
+            add_worklist(v)
+        elif (u < precolored and all(ok(t, u) for t in neighbours(v))) or \
+             (u >= precolored and conservative(u, v)):
+            move_state[m] = COALESCED
+            combine(u, v)
+            add_worklist(u)
+        else:
+            move_state[m] = ACTIVE
+
+    def freeze_moves(u):
+        """Give up the coalescing of the moves involving u."""
+        for m in node_moves(u):
+            x, y = moves[m]
+            v = get_alias(x) if get_alias(y) == get_alias(u) \
+                else get_alias(y)
+            move_state[m] = FROZEN
+            if v in freeze_worklist and not move_related(v) \
+               and degree[v] < k:
+                freeze_worklist.remove(v)
+                simplify_worklist.add(v)
+
+    def freeze():
+        u = freeze_worklist.pop()
+        simplify_worklist.add(u)
+        freeze_moves(u)
 
     def spill_candidate():
-        """Find a spill candidate with the best score. We do not take loops into account."""
-        raise NotImplementedError("spill candidate")
+        """Find a spill candidate with the best score, that is the fewest
+        definitions and uses per interference, those in loops counting for
+        more. Spilling again the short-lived temporaries introduced by
+        spilling would not lower the register pressure."""
+        return min(spill_worklist,
+                   key=lambda n: (nodes[n] in unspillable,
+                                  occurrences[n] / degree[n], n))
+
+    def select_spill():
+        m = spill_candidate()
+        spill_worklist.remove(m)
+        simplify_worklist.add(m)
+        freeze_moves(m)
 
     def unstack():
         """Pop and color temporaries from the stack. If a temporary cannot
-        get a color that none of his neighbour has, we need to spill it. A Spill
-        exception will be raised to indicate that spilling needs to occur and
-        the whole process must be started again. The parameter of the exception
-        will indicate the register that needs spilling"""
-        raise NotImplementedError("unstack")
-
-    def apply_mappings():
-        """Apply register mappings and return a list of instructions with
-        only physical registers. Redundant move operations and non-jumped-to
-        labels will be removed to. The stack size for the function is now
-        known and the appropriate label will be replaced by a stack
-        allocation. The cleaned up list of instructions will be returned."""
-        raise NotImplementedError("apply mappings")
-
-    while temporaries:
-        simplified_or_coalesced = False
-
-        # Simplify as much as possible
-        while True:
-            n = simplify()
-            if n:
-                simplified_or_coalesced = True
+        get a color that none of his neighbour has, we need to spill it. A
+        Spill exception will be raised to indicate that spilling needs to
+        occur and the whole process must be started again. The parameter of
+        the exception will indicate all the temporaries that need
+        spilling."""
+        while select_stack:
+            n = select_stack.pop()
+            on_stack[n] = 0
+            available = all_colors
+            for w in adj_list[n]:
+                c = color[get_alias(w)]
+                if c is not None:
+                    available &= ~(1 << c)
+            if available:
+                color[n] = (available & -available).bit_length() - 1
             else:
-                break
+                spilled.append(n)
+        if spilled:
+            raise Spill([nodes[n] for n in spilled])
+        for n in coalesced:
+            color[n] = color[get_alias(n)]
 
-        # Coalesce as much as possible
-        while True:
-            p = coalesce()
-            if p:
-                simplified_or_coalesced = True
-            else:
-                break
-
-        # We went a full round without simplification or coalescing.
-        # If possible, we will break a coalescing bound, otherwise,
-        # we will have to spill a potential candidate. Hopefully,
-        # when unstacking, several neighbours will have the same color
-        # and we will not have to really spill it.
-        if not simplified_or_coalesced:
-            candidates = temporaries.intersection(coalesces.keys())
-            if candidates:
-                weights = dict((node, len(interferences[node])) for node in candidates)
-                to_remove = min(weights.keys(), key=lambda n: weights[n])
-                for n in coalesces[to_remove]:
-                    coalesces[n].remove(to_remove)
-                del coalesces[to_remove]
-            else:
-                potential_spill = spill_candidate()
-                push_to_stack(potential_spill)
+    build()
+    make_worklists()
+    while True:
+        if simplify_worklist:
+            simplify()
+        elif worklist_moves:
+            coalesce()
+        elif freeze_worklist:
+            freeze()
+        elif spill_worklist:
+            select_spill()
+        else:
+            break
 
     # Unstack and color the temporaries with physical registers.
     unstack()
 
     # So far so good, apply mappings and return.
-    return apply_mappings()
+    return apply_mappings(frame, instrs,
+                          dict((nodes[n], nodes[color[n]])
+                               for n in range(precolored, count)),
+                          stats)
 
-def allocate_registers(frame, instrs):
+def apply_mappings(frame, instrs, registers, stats=None):
+    """Apply the registers mapping from temporaries to physical registers
+    and return a list of instructions with only physical registers.
+    Redundant move operations and non-jumped-to labels will be removed to.
+    The stack size for the function is now known and the appropriate label
+    will be replaced by a stack allocation. The cleaned up list of
+    instructions will be returned, and the number of MOVE instructions and
+    of removed ones added to the "moves" and "eliminated" entries of stats
+    if given."""
+    occurrences_of = {}
+    for instr in instrs:
+        for t in set(instr.defs() + instr.uses()):
+            occurrences_of.setdefault(t, []).append(instr)
+    for (temp, register) in registers.items():
+        for instr in occurrences_of.get(temp, []):
+            instr.replace_with(temp, register)
+    jumped = set(label for instr in instrs for label in instr.jumps())
+    result = []
+    move_count = eliminated = 0
+    for instr in instrs:
+        if isinstance(instr, M):
+            move_count += 1
+            if instr.dst == instr.src:
+                eliminated += 1
+                continue
+        elif isinstance(instr, L):
+            if instr.label == frame.allocate_frame_size_label:
+                result += frame.reserve_stack_space()
+                continue
+            if instr.label != frame.label and \
+               instr.label not in jumped and not instr.updates:
+                continue
+        result.append(instr)
+    if stats is not None:
+        stats["moves"] = stats.get("moves", 0) + move_count
+        stats["eliminated"] = stats.get("eliminated", 0) + eliminated
+    return result
+
+# Functions with more instructions than this get their registers allocated
+# by a linear scan rather than by coloring, unless told otherwise.
+LINEAR_SCAN_THRESHOLD = 2000
+
+def allocate_registers(frame, instrs, stats=None, allocator=None):
     """Allocate registers for the given instructions. If we get a
     Spill exception from colorize, we need to spill the given
-    temporary and start over."""
+    temporaries and start over, updating the interference graph rather
+    than computing it again. If stats is given, the allocation
+    statistics (see colorize) are added to it, as well as the number
+    of spilled temporaries in its "spills" entry.
+
+    allocator may be "coloring" or "linear" (see
+    codegen.linearscan.linear_scan). If it is None, the linear scan is
+    only used for functions of more than LINEAR_SCAN_THRESHOLD
+    instructions."""
+    if allocator is None:
+        allocator = "linear" if len(instrs) > LINEAR_SCAN_THRESHOLD \
+            else "coloring"
+    assert allocator in ("coloring", "linear"), \
+        "unknown register allocator {}".format(allocator)
+    if allocator == "linear":
+        from codegen.linearscan import linear_scan
+        return linear_scan(frame, instrs, stats)
+    graph = InterferenceGraph(frame, instrs)
+    # Temporaries introduced by spilling
+    unspillable = set()
     while True:
         try:
-            return colorize(frame, instrs)
+            return colorize(frame, instrs, stats, graph, unspillable)
         except Spill as spill_exception:
-            instrs = spill_temporary(frame, instrs, spill_exception.temp)
+            spilled, created, removed = spill_exception.temps, set(), set()
+            instrs = spill_temporaries(frame, instrs, spilled, created,
+                                       removed)
+            graph.spill(instrs, spilled + sorted(removed, key=lambda t: t.id),
+                        created)
+            unspillable |= created
+            if stats is not None:
+                stats["spills"] = stats.get("spills", 0) + len(spilled)
 
 def spill_temporary(frame, instrs, spill):
     """Spill a temporary, reload it before every use through a new temporary,
     save it after every def through a new temporary. Those temporary will
     replace the spilled temporary in the original instructions, so that
     the new lifetimes are kept very short."""
-    # Allocate a new spill space in the frame
-    saved_offset = frame.alloc_spill()
-    raise NotImplementedError("spill temporary for {}".format(spill))
+    return spill_temporaries(frame, instrs, [spill])
+
+def rematerializable(frame, instrs):
+    """Return a dictionary giving the defining instruction of every
+    temporary which, rather than being spilled, may have its value computed
+    again before every use: a temporary defined once, by a MOVE or an
+    instruction the frame says is rematerializable (such as the loading
+    of a constant), reading only the frame pointer and other such
+    temporaries defined earlier."""
+    definitions = {}
+    for instr in instrs:
+        for t in instr.defs():
+            definitions[t] = None if t in definitions else instr
+    result = {}
+    for instr in instrs:
+        defs = instr.defs()
+        if len(defs) == 1 and not defs[0].is_physical() and \
+           definitions[defs[0]] is instr and \
+           (isinstance(instr, M) or frame.rematerializable(instr)) and \
+           all(t == frame.fp or t in result for t in instr.uses()):
+            result[defs[0]] = instr
+    return result
+
+def spill_temporaries(frame, instrs, spills, created=None, removed=None):
+    """Spill several temporaries at once (see spill_temporary), each in its
+    own new spill space in the frame. The new temporaries are added to the
+    created set if given.
+
+    The rematerializable temporaries (see rematerializable) do not get any
+    spill space: their definition is removed, and the instructions
+    computing their value are copied before every use, their sources
+    being computed again as well so that only new temporaries are live
+    there. The sources which are not used anymore disappear with their
+    definition, and are added to the removed set if given."""
+    definitions = rematerializable(frame, instrs)
+    rematerialized = set(spill for spill in spills if spill in definitions)
+    # Allocate a new spill space in the frame for every other temporary
+    saved_offsets = dict((spill, frame.alloc_spill()) for spill in spills
+                         if spill not in rematerialized)
+    # The definitions of the rematerialized temporaries are removed, as
+    # well as those of their sources which were only used there.
+    dead = set(rematerialized)
+    if dead:
+        uses = {}
+        for instr in instrs:
+            for t in instr.uses():
+                uses[t] = uses.get(t, 0) + 1
+        pending = list(dead)
+        while pending:
+            for src in definitions[pending.pop()].uses():
+                uses[src] -= 1
+                if not uses[src] and src in definitions and \
+                   src not in dead:
+                    dead.add(src)
+                    pending.append(src)
+                    if removed is not None:
+                        removed.add(src)
+
+    def new_temp(name):
+        temp = Temp.create(name)
+        if created is not None:
+            created.add(temp)
+        return temp
+
+    def recompute(temp):
+        """Return the instructions computing the value of temp into a new
+        temporary, and that temporary."""
+        definition = definitions[temp]
+        if isinstance(definition, M) and definition.src in definitions:
+            # A copy has the value of its source.
+            return recompute(definition.src)
+        code, srcs = [], []
+        for src in definition.uses():
+            if src in definitions:
+                src_code, src = recompute(src)
+                code += src_code
+            srcs.append(src)
+        temp = new_temp("remat")
+        if isinstance(definition, M):
+            code.append(M(definition.template, dst=temp, src=srcs[0]))
+        else:
+            code.append(O(definition.template, dsts=[temp], srcs=srcs))
+        return code, temp
+
+    result = []
+    for instr in instrs:
+        if dead and any(t in dead for t in instr.defs()):
+            continue
+        temps = [t for t in dict.fromkeys(instr.defs() + instr.uses())
+                 if t in saved_offsets or t in rematerialized]
+        if not temps:
+            result.append(instr)
+            continue
+        saves = []
+        for spill in temps:
+            if spill in rematerialized:
+                code, temp = recompute(spill)
+                result += code
+                instr.replace_with(spill, temp)
+                continue
+            used, defined = spill in instr.uses(), spill in instr.defs()
+            temp = new_temp("spill")
+            instr.replace_with(spill, temp)
+            if used:
+                result += frame.load_spill(temp, saved_offsets[spill])
+            if defined:
+                saves += frame.save_spill(temp, saved_offsets[spill])
+        result.append(instr)
+        result += saves
+    return result
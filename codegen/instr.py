@@ -3,13 +3,17 @@ from ir.nodes import Label, Temp
 class Instr:
     """A class of assembler instructions."""
 
+    # Temporaries live before and after the instruction. They are only
+    # recorded on the instruction when asked to the liveness analysis,
+    # for example to dump them.
+    live_in = frozenset()
+    live_out = frozenset()
+
     def __init__(self, template):
         """The template argument will be given a list with
         all the defs followed by all the uses. Register names
         must be templated as they may be replaced later on."""
         self.template = template
-        self.live_in = set()
-        self.live_out = set()
         # The extra_conflicts field may be used to record
         # that some instruction operands may not be in some
         # registers, or in identical parameters. It will be
@@ -54,24 +58,32 @@ class Instr:
         indent = 0 if isinstance(self, LABEL) else 8
         return " " * indent + self.template.format(*(self.defs() + self.uses()))
 
+    def comments(self):
+        """Return the relevant information about this instruction, in an
+        assembler comment."""
+        defs = ["defs: {}".format(self.defs())] if self.defs() else []
+        uses = ["uses: {}".format(self.uses())] if self.uses() else []
+        live_in = ["live in: {}".format(sorted(list(self.live_in), key=lambda t: t.name))] \
+                  if self.live_in else []
+        live_out = ["live out: {}".format(sorted(list(self.live_out), key=lambda t: t.name))] \
+                   if self.live_out else []
+        jumps = ["jumps: {}".format(self.jumps())] if self.jumps() else []
+        conflicts = ["extra conflicts: {}".format(self.extra_conflicts)] \
+                    if self.extra_conflicts else []
+        comments = ", ".join(defs + uses + live_in + live_out + jumps + conflicts)
+        return " ; {}".format(comments) if comments else ""
+
     def dump(self, verbose):
         """Dump instruction with all relevant information."""
+        return str(self).ljust(40) + (self.comments() if verbose else "")
+
+    def write(self, stream, verbose):
+        """Write the dump of the instruction to stream, followed by a
+        newline."""
+        stream.write(str(self).ljust(40))
         if verbose:
-            defs = ["defs: {}".format(self.defs())] if self.defs() else []
-            uses = ["uses: {}".format(self.uses())] if self.uses() else []
-            live_in = ["live in: {}".format(sorted(list(self.live_in), key=lambda t: t.name))] \
-                      if self.live_in else []
-            live_out = ["live out: {}".format(sorted(list(self.live_out), key=lambda t: t.name))] \
-                       if self.live_out else []
-            jumps = ["jumps: {}".format(self.jumps())] if self.jumps() else []
-            conflicts = ["extra conflicts: {}".format(self.extra_conflicts)] \
-                        if self.extra_conflicts else []
-            comments = ", ".join(defs + uses + live_in + live_out + jumps + conflicts)
-            if comments:
-                comments = " ; {}".format(comments)
-        else:
-            comments = ""
-        return "{!s:40}{}".format(self, comments)
+            stream.write(self.comments())
+        stream.write("\n")
 
 class OPER(Instr):
     """A regular instruction which is neither a direct transfer
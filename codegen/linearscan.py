@@ -0,0 +1,236 @@
+from bisect import bisect_right
+
+from codegen.alloc import apply_mappings, block_weights, spill_temporaries
+from codegen.instr import MOVE as M
+from flow.cfg import instr_cfg
+from flow.dataflow import Liveness, bits
+
+class Interval:
+    """Lifetime interval of a temporary, made of disjoint ranges of
+    positions sorted in increasing order. The instruction of index i reads
+    its operands at position 2i and writes its results at position 2i+1,
+    so that a MOVE source dying in the instruction does not overlap the
+    destination. The gaps between the ranges are the lifetime holes, in
+    which the register of the interval may be used by other intervals."""
+
+    def __init__(self, temp):
+        self.temp = temp
+        # Ranges [starts[n], ends[n]). They are built from the last one to
+        # the first one, then reversed by finish().
+        self.starts = []
+        self.ends = []
+        self.register = None
+        # Number of definitions and uses of the temporary, weighted by the
+        # loop nesting depth of the instructions (see block_weights).
+        self.uses = 0
+
+    def add_range(self, start, end):
+        """Add a range, merging it with the range added last if they
+        overlap or are adjacent."""
+        starts, ends = self.starts, self.ends
+        if starts and starts[-1] <= end and start <= ends[-1]:
+            starts[-1] = min(starts[-1], start)
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+
+    def set_from(self, position):
+        """Start the interval at position, where the temporary is written.
+        If it is not live after position, the write is dead and only
+        occupies position."""
+        if self.starts and self.starts[-1] <= position < self.ends[-1]:
+            self.starts[-1] = position
+        else:
+            self.add_range(position, position + 1)
+
+    def finish(self):
+        self.starts.reverse()
+        self.ends.reverse()
+
+    def start(self):
+        return self.starts[0]
+
+    def end(self):
+        return self.ends[-1]
+
+    def covers(self, position):
+        n = bisect_right(self.starts, position) - 1
+        return n >= 0 and position < self.ends[n]
+
+    def intersection(self, other):
+        """Return the first position covered by both intervals, or None if
+        they do not intersect."""
+        if len(self.starts) > len(other.starts):
+            self, other = other, self
+        starts, ends = other.starts, other.ends
+        for (start, end) in zip(self.starts, self.ends):
+            n = bisect_right(ends, start)
+            if n < len(starts) and starts[n] < end:
+                return max(start, starts[n])
+        return None
+
+def build_intervals(instrs):
+    """Return the dictionary of the lifetime intervals of the temporaries,
+    physical registers included, from the liveness of the instructions
+    taken in their order. The temporaries of an instruction recorded in
+    its `extra_conflicts` are made to overlap."""
+    cfg = instr_cfg(instrs)
+    liveness = cfg.analysis(Liveness)
+    temps = liveness.temps
+    intervals = dict((t, Interval(temp)) for (t, temp) in temps.items())
+    weights = block_weights(cfg)
+    for b in range(len(cfg) - 1, -1, -1):
+        block_start, weight = 2 * cfg.start(b), weights[b]
+        for t in bits(liveness.outs[b]):
+            intervals[t].add_range(block_start, 2 * cfg.end(b))
+        for i in range(cfg.end(b) - 1, cfg.start(b) - 1, -1):
+            instr = instrs[i]
+            for temp in instr.defs():
+                intervals[temp.id].set_from(2 * i + 1)
+                intervals[temp.id].uses += weight
+            for temp in instr.uses():
+                intervals[temp.id].add_range(block_start, 2 * i + 1)
+                intervals[temp.id].uses += weight
+            # Operands read by the instruction and conflicting with others
+            # are kept live until its results are written.
+            for temp in set(t for pair in instr.extra_conflicts
+                            for t in pair):
+                if temp in instr.uses():
+                    intervals[temp.id].add_range(block_start, 2 * i + 2)
+                elif temp not in instr.defs():
+                    intervals[temp.id].add_range(2 * i, 2 * i + 2)
+    for interval in intervals.values():
+        interval.finish()
+    return dict((interval.temp, interval) for interval in intervals.values())
+
+def scan(frame, instrs, unspillable):
+    """Assign registers to the intervals of the temporaries in the order of
+    their starts, and return the intervals and the list of the
+    temporaries to spill. When no register is free for the whole
+    interval, either the current interval or the ones holding a register
+    are spilled, whichever are used the least, except for those of the
+    temporaries in unspillable."""
+    intervals = build_intervals(instrs)
+    colors = [r for r in frame.registers if r not in (frame.sp, frame.fp)]
+    fixed = [intervals[r] for r in colors if r in intervals]
+    # Move related temporaries are given the same register when possible.
+    hints = {}
+    for instr in instrs:
+        if isinstance(instr, M):
+            if not instr.dst.is_physical():
+                hints[instr.dst] = instr.src
+            elif not instr.src.is_physical():
+                hints[instr.src] = instr.dst
+    unhandled = sorted((i for i in intervals.values()
+                        if not i.temp.is_physical()),
+                       key=lambda i: (i.start(), i.temp.id))
+    active, inactive, spilled = [], [], []
+    infinite = 2 * len(instrs) + 2
+
+    for current in unhandled:
+        position = current.start()
+        # Intervals not covering position any longer are in a hole or
+        # are over.
+        still_active = []
+        for interval in active:
+            if interval.end() <= position:
+                continue
+            if interval.covers(position):
+                still_active.append(interval)
+            else:
+                inactive.append(interval)
+        still_inactive = []
+        for interval in inactive:
+            if interval.end() <= position:
+                continue
+            if interval.covers(position):
+                still_active.append(interval)
+            else:
+                still_inactive.append(interval)
+        active, inactive = still_active, still_inactive
+
+        # Positions until which every register is free.
+        free_until = dict((r, infinite) for r in colors)
+        for interval in active:
+            free_until[interval.register] = 0
+        for interval in inactive + fixed:
+            register = interval.register or interval.temp
+            if free_until[register]:
+                x = interval.intersection(current)
+                if x is not None:
+                    free_until[register] = min(free_until[register], x)
+
+        hint = hints.get(current.temp)
+        if hint is not None and not hint.is_physical():
+            hint = intervals[hint].register
+        end = current.end()
+        if hint in free_until and free_until[hint] >= end:
+            register = hint
+        else:
+            register = next((r for r in colors if free_until[r] >= end),
+                            None)
+        if register is not None:
+            current.register = register
+            active.append(current)
+            continue
+
+        # Spill the cheapest intervals, those with the fewest definitions and
+        # uses, preferring the ones ending last: either the current one or
+        # the intervals holding a register not used by a physical register
+        # during the current interval.
+        victim_register, victim_cost = None, None
+        for r in colors:
+            if any(interval.temp is r and interval.intersection(current)
+                   is not None for interval in fixed):
+                continue
+            holders = [interval for interval in active
+                       if interval.register is r] + \
+                      [interval for interval in inactive
+                       if interval.register is r and
+                       interval.intersection(current) is not None]
+            if not holders or \
+               any(interval.temp in unspillable for interval in holders):
+                continue
+            cost = (sum(interval.uses for interval in holders),
+                    -max(interval.end() for interval in holders))
+            if victim_cost is None or cost < victim_cost:
+                victim_register, victim_cost = r, cost
+        if current.temp not in unspillable and \
+           (victim_register is None or (current.uses, -end) <= victim_cost):
+            spilled.append(current.temp)
+            continue
+        assert victim_register is not None, \
+            "no register can be freed for {}".format(current.temp)
+        evicted = set(interval for interval in active + inactive
+                      if interval.register is victim_register and
+                      interval.intersection(current) is not None)
+        spilled += sorted((interval.temp for interval in evicted),
+                          key=lambda t: t.id)
+        active = [i for i in active if i not in evicted]
+        inactive = [i for i in inactive if i not in evicted]
+        current.register = victim_register
+        active.append(current)
+
+    return intervals, spilled
+
+def linear_scan(frame, instrs, stats=None):
+    """Allocate registers for the given instructions with a linear scan
+    over the lifetime intervals of the temporaries, which is much faster
+    than colorize on large functions at the cost of more moves and
+    spills. Spilled temporaries are all rewritten at once (see
+    spill_temporaries) before starting over, the new temporaries never
+    being spilled again. stats is updated as with allocate_registers."""
+    unspillable = set()
+    while True:
+        intervals, spilled = scan(frame, instrs, unspillable)
+        if not spilled:
+            break
+        instrs = spill_temporaries(frame, instrs, spilled, unspillable)
+        if stats is not None:
+            stats["spills"] = stats.get("spills", 0) + len(spilled)
+    return apply_mappings(frame, instrs,
+                          dict((temp, interval.register)
+                               for (temp, interval) in intervals.items()
+                               if not temp.is_physical()),
+                          stats)
@@ -1,13 +1,146 @@
-from codegen.instr import LABEL as L, MOVE as M
+from codegen.instr import MOVE as M
+from flow.cfg import instr_cfg
+from flow.dataflow import Liveness, bits
 
-def liveness_analysis(frame, instrs):
-    """Annotate instructions with liveness analysis. Return the interferences
+class InterferenceGraph:
+    """Interferences and coalesces of the temporaries of instructions (see
+    liveness_analysis), which can be updated after spilling instead of
+    being computed again.
+
+    `cfg` is the control flow graph of the instructions, and
+    `blocks[temp]` the set of its blocks where temp is defined or used,
+    which gives the blocks to walk again when it gets spilled."""
+
+    def __init__(self, frame, instrs, annotate=False):
+        self.cfg = cfg = instr_cfg(instrs)
+        liveness = cfg.analysis(Liveness)
+        self.frame = frame
+        self.temps = temps = dict(liveness.temps)
+        # Temporaries live at the end of every block.
+        self.outs = list(liveness.outs)
+        self.blocks = {}
+        registers = set(frame.registers)
+        self.interferences = dict((temp, set()) for temp in temps.values())
+        for reg in registers:
+            self.interferences[reg] = registers - {reg}
+        self.coalesces = {}
+        moves = []
+        for b in range(len(cfg)):
+            moves += self._walk(cfg, b, instrs, None, annotate)
+        self._add_coalesces(moves)
+
+    def _conflict(self, a, b):
+        if a is not b:
+            self.interferences.setdefault(a, set()).add(b)
+            self.interferences.setdefault(b, set()).add(a)
+
+    def _walk(self, cfg, b, instrs, new, annotate):
+        """Record the conflicts of block b, walking it backward from its
+        live out set, and return its moves. If new is not None, only the
+        conflicts and moves involving the temporaries of the bitset new
+        are recorded."""
+        temps, blocks, conflict = self.temps, self.blocks, self._conflict
+        live = self.outs[b]
+        moves = []
+        for i in range(cfg.end(b) - 1, cfg.start(b) - 1, -1):
+            instr = instrs[i]
+            defs, uses = instr.defs(), instr.uses()
+            defs_mask = uses_mask = 0
+            for t in defs:
+                defs_mask |= 1 << t.id
+            for t in uses:
+                uses_mask |= 1 << t.id
+            for t in defs + uses:
+                temps[t.id] = t
+                blocks.setdefault(t, set()).add(b)
+            conflicting = live
+            if isinstance(instr, M):
+                conflicting &= ~(1 << instr.src.id)
+                if new is None or (defs_mask | uses_mask) & new:
+                    moves.append((instr.dst, instr.src))
+            for d in defs:
+                if new is None or new >> d.id & 1:
+                    for t in bits(conflicting):
+                        conflict(d, temps[t])
+                else:
+                    for t in bits(conflicting & new):
+                        conflict(d, temps[t])
+            for (n, d) in enumerate(defs):
+                for other in defs[n + 1:]:
+                    conflict(d, other)
+            for (x, y) in instr.extra_conflicts:
+                conflict(x, y)
+            if annotate:
+                instr.live_out = set(temps[t] for t in bits(live))
+                live_in = (live & ~defs_mask) | uses_mask
+                instr.live_in = set(temps[t] for t in bits(live_in))
+            live = (live & ~defs_mask) | uses_mask
+        return moves
+
+    def _add_coalesces(self, moves):
+        """Moves whose operands do not conflict may be coalesced."""
+        registers = self.frame.registers
+        for (dst, src) in moves:
+            if dst is not src and dst not in self.interferences[src] and \
+               not (dst in registers and src in registers):
+                self.coalesces.setdefault(dst, set()).add(src)
+                self.coalesces.setdefault(src, set()).add(dst)
+
+    def spill(self, instrs, spilled, created):
+        """Update the graph after the temporaries of spilled have been
+        replaced in instrs by the temporaries of created, or removed with
+        their definition (see codegen.alloc.spill_temporaries). The new
+        temporaries only live between a spill load or save, or a
+        rematerialization, and the instruction using them, so the live
+        sets of the blocks are unchanged but for the spilled temporaries,
+        and only the blocks where those appeared need to be walked again.
+        The frame pointer read by the spill code is not made live before
+        it: it is never written and never allocated. The sources of the
+        removed definitions which are still used keep their conflicts,
+        which is conservative."""
+        self.cfg = cfg = instr_cfg(instrs)
+        assert len(cfg) == len(self.outs), "spilling changed the blocks"
+        interferences, coalesces = self.interferences, self.coalesces
+        mask = new = 0
+        walk = set()
+        for temp in spilled:
+            mask |= 1 << temp.id
+            walk |= self.blocks.pop(temp)
+            for other in interferences.pop(temp):
+                interferences[other].discard(temp)
+            for other in coalesces.pop(temp, ()):
+                coalesces[other].discard(temp)
+                if not coalesces[other]:
+                    del coalesces[other]
+            del self.temps[temp.id]
+        for temp in created:
+            new |= 1 << temp.id
+            interferences[temp] = set()
+        self.outs = [live & ~mask for live in self.outs]
+        moves = []
+        for b in sorted(walk):
+            moves += self._walk(cfg, b, instrs, new, False)
+        self._add_coalesces(moves)
+
+def liveness_analysis(frame, instrs, annotate=False):
+    """Perform liveness analysis on instructions. Return the interferences
     and coalesces dictionaries as a pair.
 
-    The interferences dictionary gives, for every temporary, the list of
-    temporaries it conflicts with.
+    The interferences dictionary gives, for every temporary, the set of
+    temporaries it conflicts with: a temporary conflicts with the ones
+    live after the instructions defining it (except for the source of a
+    MOVE instruction), with the other temporaries defined by the same
+    instructions, and as recorded in the `extra_conflicts` of the
+    instructions. The physical registers of the frame all conflict with
+    each other. Labels defining `updates` are handled as any instruction.
 
-    The coalesces dictionary gives, for every temporary, the list of other
+    The coalesces dictionary gives, for every temporary, the set of other
     temporaries involved in a direct MOVE operation. Those are susceptible
-    of merging."""
-    raise NotImplementedError("liveness analysis")
+    of merging. Temporaries which conflict, or which are both physical
+    registers, are never in it.
+
+    Liveness is computed per basic block (see flow.dataflow.Liveness). If
+    annotate is True, the `live_in` and `live_out` sets of every
+    instruction are recorded as well."""
+    graph = InterferenceGraph(frame, instrs, annotate)
+    return graph.interferences, graph.coalesces
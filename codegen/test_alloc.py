@@ -0,0 +1,126 @@
+import unittest
+
+from arm.frame import ArmFrame
+from codegen.alloc import allocate_registers
+from codegen.instr import LABEL as L, MOVE as M, OPER as O
+from ir.context import Context
+from ir.nodes import Label, Temp
+
+class TestAlloc(unittest.TestCase):
+
+    def setUp(self):
+        # Temporaries created when spilling are numbered in the function.
+        self.frame = ArmFrame(Label("f"))
+        self.context = Context()
+        self.context.__enter__()
+        self.function = self.context.function(self.frame)
+        self.function.__enter__()
+
+    def tearDown(self):
+        self.function.__exit__(None, None, None)
+        self.context.__exit__(None, None, None)
+
+    def allocate(self, frame, instrs):
+        stats = {}
+        result = allocate_registers(frame, instrs, stats)
+        for instr in result:
+            for t in instr.defs() + instr.uses():
+                self.assertTrue(t.is_physical(), "{} remains".format(t))
+        return result, stats
+
+    def test_coalesce(self):
+        frame = self.frame
+        r0, r1 = Temp("r0"), Temp("r1")
+        a, b, c = Temp.create("a"), Temp.create("b"), Temp.create("c")
+        loop = Label("loop")
+        instrs = [L("f:", frame.label),
+                  L("alloc:", frame.allocate_frame_size_label),
+                  M("mov {}, {}", dst=a, src=r0),
+                  M("mov {}, {}", dst=b, src=r1),
+                  L("loop:", loop),
+                  O("mul {}, {}, {}", dsts=[c], srcs=[a, b])
+                  .record_conflict(c, a),
+                  O("sub {}, {}, #1", dsts=[b], srcs=[b]),
+                  M("mov {}, {}", dst=a, src=c),
+                  O("cmp {}, #0", srcs=[b]),
+                  O("bne loop", jmps=[loop, Label("end")]),
+                  L("end:", Label("end")),
+                  M("mov {}, {}", dst=r0, src=a)]
+        result, stats = self.allocate(frame, instrs)
+        # a and b are coalesced with the parameter registers, and the
+        # result of the mul cannot go into the register of a.
+        self.assertEqual(stats, {"moves": 4, "eliminated": 3})
+        self.assertEqual([i.label for i in result if isinstance(i, L)],
+                         [frame.label, loop, Label("end")])
+        mul = [i for i in result if str(i).strip().startswith("mul")][0]
+        self.assertEqual(mul.srcs, [r0, r1])
+        self.assertNotEqual(mul.dsts[0], r0)
+        self.assertEqual(len([i for i in result if isinstance(i, M)]), 1)
+
+    def test_spill(self):
+        frame = self.frame
+        temps = [Temp.create("t") for _ in range(20)]
+        instrs = [L("f:", frame.label),
+                  L("alloc:", frame.allocate_frame_size_label)]
+        instrs += [O("ldr {}, [{}, #%d]" % (4 * n), dsts=[t],
+                     srcs=[frame.fp]) for (n, t) in enumerate(temps)]
+        instrs += [O("add {}, {}, {}", dsts=[frame.r0],
+                     srcs=[frame.r0, t]) for t in temps]
+        result, stats = self.allocate(frame, instrs)
+        # 11 registers are left when r0 is live, and one of them is needed
+        # to reload the spilled temporaries.
+        self.assertEqual(stats["spills"], 10)
+        self.assertEqual(frame.offset, 40)
+        self.assertEqual(str(result[1]).strip(), "add sp, sp, #-40")
+        self.assertEqual(
+            len([i for i in result if str(i).strip().startswith("str")]), 10)
+
+    def test_rematerialize(self):
+        frame = self.frame
+        offset, address = Temp.create("offset"), Temp.create("address")
+        temps = [Temp.create("t") for _ in range(20)]
+        instrs = [L("f:", frame.label),
+                  L("alloc:", frame.allocate_frame_size_label),
+                  O("mov {}, #-4", dsts=[offset]),
+                  O("add {}, {}, {}", dsts=[address],
+                    srcs=[frame.fp, offset])]
+        instrs += [O("mov {}, #%d" % n, dsts=[t])
+                   for (n, t) in enumerate(temps)]
+        instrs += [O("add {}, {}, {}", dsts=[frame.r0],
+                     srcs=[frame.r0, t]) for t in temps]
+        instrs += [O("str {}, [{}]", srcs=[frame.r0, address])]
+        result, stats = self.allocate(frame, instrs)
+        # The constants and the address are computed again where they are
+        # used instead of going through the frame.
+        self.assertEqual(stats["spills"], 11)
+        self.assertEqual(frame.offset, 0)
+        texts = [str(i).strip() for i in result]
+        self.assertEqual(len([t for t in texts if t.startswith("ldr")]), 0)
+        self.assertEqual(texts[-3:-1], ["mov r1, #-4", "add r1, r11, r1"])
+        self.assertEqual(len([t for t in texts if t.startswith("mov")]), 21)
+
+    def test_spill_outside_loops(self):
+        frame = self.frame
+        a = Temp.create("a")
+        temps = [Temp.create("t") for _ in range(12)]
+        loop, end = Label("loop"), Label("end")
+        instrs = [L("f:", frame.label),
+                  L("alloc:", frame.allocate_frame_size_label),
+                  O("mov {}, #0", dsts=[a])]
+        instrs += [O("mov {}, #%d" % n, dsts=[t])
+                   for (n, t) in enumerate(temps)]
+        instrs += [L("loop:", loop),
+                   O("add {}, {}, #1", dsts=[a], srcs=[a]),
+                   O("cmp {}, #10", srcs=[a]),
+                   O("blt loop", jmps=[loop, end]),
+                   L("end:", end)]
+        instrs += [O("push {}", srcs=[t]) for t in temps * 5]
+        result, stats = self.allocate(frame, instrs)
+        # a is used less often than any other temporary, but in a loop.
+        self.assertEqual(stats["spills"], 1)
+        texts = [str(i).strip() for i in result]
+        body = texts[texts.index("loop:") + 1:texts.index("blt loop")]
+        self.assertEqual([t.split()[0] for t in body], ["add", "cmp"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+
+from arm.frame import ArmFrame
+from codegen.alloc import allocate_registers
+from codegen.instr import LABEL as L, MOVE as M, OPER as O
+from codegen.linearscan import build_intervals
+from ir.context import Context
+from ir.nodes import Label, Temp
+
+class TestLinearScan(unittest.TestCase):
+
+    def setUp(self):
+        # Temporaries created when spilling are numbered in the function.
+        self.frame = ArmFrame(Label("f"))
+        self.context = Context()
+        self.context.__enter__()
+        self.function = self.context.function(self.frame)
+        self.function.__enter__()
+
+    def tearDown(self):
+        self.function.__exit__(None, None, None)
+        self.context.__exit__(None, None, None)
+
+    def loop(self):
+        r0 = Temp("r0")
+        a, b, c = Temp.create("a"), Temp.create("b"), Temp.create("c")
+        loop, end = Label("loop"), Label("end")
+        self.temps = a, b, c
+        return [L("f:", self.frame.label),                      # 0
+                O("mov {}, #0", dsts=[a]),                      # 1
+                L("loop:", loop),                               # 2
+                M("mov {}, {}", dst=b, src=a),                  # 3
+                O("add {}, {}, #1", dsts=[c], srcs=[b]),        # 4
+                O("mul {}, {}, {}", dsts=[a], srcs=[c, b])      # 5
+                .record_conflict(a, c),
+                O("cmp {}, #9", srcs=[a]),                      # 6
+                O("blt loop", jmps=[loop, end]),                # 7
+                L("end:", end),                                 # 8
+                M("mov {}, {}", dst=r0, src=a)]                 # 9
+
+    def test_intervals(self):
+        intervals = build_intervals(self.loop())
+        a, b, c = [intervals[t] for t in self.temps]
+        # a is live around the loop but has a hole from the move to the
+        # mul, and c is kept live until a is written because of the extra
+        # conflict.
+        self.assertEqual(list(zip(a.starts, a.ends)), [(3, 7), (11, 19)])
+        self.assertEqual(list(zip(b.starts, b.ends)), [(7, 11)])
+        self.assertEqual(list(zip(c.starts, c.ends)), [(9, 12)])
+        self.assertEqual(a.intersection(b), None)
+        self.assertEqual(a.intersection(c), 11)
+        self.assertTrue(a.covers(16))
+        self.assertFalse(a.covers(8))
+
+    def test_allocate(self):
+        stats = {}
+        result = allocate_registers(self.frame, self.loop(), stats,
+                                    "linear")
+        for instr in result:
+            for t in instr.defs() + instr.uses():
+                self.assertTrue(t.is_physical(), "{} remains".format(t))
+        # a and b share a register thanks to the hole of a.
+        self.assertEqual(stats, {"moves": 2, "eliminated": 2})
+        mul = [i for i in result if str(i).strip().startswith("mul")][0]
+        self.assertNotEqual(mul.dsts[0], mul.srcs[0])
+
+    def test_spill(self):
+        frame = self.frame
+        temps = [Temp.create("t") for _ in range(20)]
+        instrs = [L("f:", frame.label),
+                  L("alloc:", frame.allocate_frame_size_label)]
+        instrs += [O("ldr {}, [{}, #%d]" % (4 * n), dsts=[t],
+                     srcs=[frame.fp]) for (n, t) in enumerate(temps)]
+        instrs += [O("add {}, {}, {}", dsts=[frame.r0],
+                     srcs=[frame.r0, t]) for t in temps]
+        stats = {}
+        result = allocate_registers(frame, instrs, stats, "linear")
+        # All the spills are found in a single scan.
+        self.assertEqual(stats["spills"], 10)
+        self.assertEqual(str(result[1]).strip(), "add sp, sp, #-40")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+from arm.frame import ArmFrame
+from codegen.instr import LABEL as L, MOVE as M, OPER as O
+from codegen.alloc import spill_temporaries
+from codegen.liveness import InterferenceGraph, liveness_analysis
+from ir.context import Context
+from ir.nodes import Label, Temp
+
+class TestLiveness(unittest.TestCase):
+
+    def test_loop(self):
+        r0 = Temp("r0")
+        loop = Label("loop")
+        frame = ArmFrame(Label("f"))
+        with Context() as context, context.function(frame):
+            a, b, c = Temp.create("a"), Temp.create("b"), Temp.create("c")
+        instrs = [O("mov {}, #0", dsts=[a]),
+                  L("loop:", loop),
+                  M("mov {}, {}", dst=b, src=a),
+                  O("add {}, {}, #1", dsts=[c], srcs=[b]),
+                  O("mul {}, {}, {}", dsts=[a], srcs=[c, b])
+                  .record_conflict(a, c),
+                  O("cmp {}, #9", srcs=[a]),
+                  O("blt loop", jmps=[loop, Label("end")]),
+                  L("end:", Label("end")),
+                  M("mov {}, {}", dst=r0, src=a)]
+        interferences, coalesces = liveness_analysis(frame, instrs, True)
+        # b and c are live together, a is only live when b and c are dead,
+        # but must not share the register of c in the mul.
+        self.assertEqual(interferences[b], {c})
+        self.assertEqual(interferences[c], {b, a})
+        self.assertEqual(interferences[a], {c})
+        self.assertEqual(interferences[r0], set(frame.registers) - {r0})
+        self.assertEqual(coalesces, {a: {b, r0}, b: {a}, r0: {a}})
+        self.assertEqual(instrs[1].live_in, {a})
+        self.assertEqual(instrs[4].live_out, {a})
+        self.assertEqual(instrs[3].live_out, {b, c})
+
+    def test_spill(self):
+        r0 = Temp("r0")
+        frame = ArmFrame(Label("f"))
+        with Context() as context, context.function(frame):
+            a, b, c = Temp.create("a"), Temp.create("b"), Temp.create("c")
+            instrs = [O("ldr {}, [{}]", dsts=[a], srcs=[frame.fp]),
+                      O("mov {}, #2", dsts=[b]),
+                      O("add {}, {}, {}", dsts=[c], srcs=[a, b]),
+                      O("add {}, {}, {}", dsts=[b], srcs=[b, c]),
+                      M("mov {}, {}", dst=r0, src=a)]
+            graph = InterferenceGraph(frame, instrs)
+            created = set()
+            instrs = spill_temporaries(frame, instrs, [a], created)
+            graph.spill(instrs, [a], created)
+        # The graph is updated as if it was built again, but for the frame
+        # pointer which is only read by the spill code.
+        interferences, coalesces = liveness_analysis(frame, instrs)
+        without_fp = lambda d: dict((t, d[t] - {frame.fp})
+                                    for t in d if t is not frame.fp)
+        self.assertEqual(without_fp(graph.interferences),
+                         without_fp(interferences))
+        self.assertEqual(graph.coalesces, coalesces)
+        self.assertNotIn(a, graph.interferences)
+        self.assertEqual(len(created), 3)
+        self.assertEqual(len(coalesces), 2)
+
+if __name__ == '__main__':
+    unittest.main()
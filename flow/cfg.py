@@ -0,0 +1,201 @@
+from array import array
+from bisect import bisect_right
+
+from codegen.instr import LABEL as L
+from ir.effects import effects
+from ir.nodes import CJUMP, JUMP, LABEL, NAME
+
+
+class CFG:
+    """Control flow graph of a function, given as a list of items (IR
+    statements or instructions) in execution order.
+
+    A basic block starts at the first item, at a label, or after a jump.
+    Blocks are numbered in the order of the items, block 0 being the entry
+    block, and block b covers the items `items[start(b):end(b)]`. Block
+    boundaries and edges are stored as integer arrays: the successors of
+    block b are `succs[succ_index[b]:succ_index[b + 1]]`, in the order of
+    the jump targets followed by the next block if control falls through,
+    and likewise for the predecessors. The `labels` dictionary maps every
+    label defined in the function to its block.
+
+    Targets which are not defined in the function are ignored. The graph
+    is built in a single pass over the items, so in linear time.
+
+    `defs_of(item)` and `uses_of(item)` return the temporaries written and
+    read by an item, for the dataflow analyses (see flow.dataflow)."""
+
+    def __init__(self, items, label_of, targets_of, defs_of, uses_of):
+        """Build the graph of items. label_of(item) must return the label
+        defined by item if any, None otherwise. targets_of(item) must
+        return None if control falls through item, or the list of labels
+        it may jump to."""
+        self.items = items
+        self.defs_of = defs_of
+        self.uses_of = uses_of
+        self.labels = labels = {}
+        bounds = []
+        # Targets of the last item of every block.
+        block_targets = []
+        targets = None
+        for (i, item) in enumerate(items):
+            label = label_of(item)
+            if label is not None:
+                labels[label] = len(bounds)
+                bounds.append(i)
+                block_targets.append(None)
+            elif targets is not None or not i:
+                bounds.append(i)
+                block_targets.append(None)
+            targets = targets_of(item)
+            if targets is not None:
+                block_targets[-1] = targets
+        bounds.append(len(items))
+        self.bounds = array('i', bounds)
+        n = len(block_targets)
+
+        # Successors, in compressed rows.
+        self.succ_index = array('i', [0])
+        self.succs = array('i')
+        for (b, targets) in enumerate(block_targets):
+            if targets is None:
+                if b + 1 < n:
+                    self.succs.append(b + 1)
+            else:
+                first = len(self.succs)
+                for label in targets:
+                    s = self.labels.get(label)
+                    if s is not None and s not in self.succs[first:]:
+                        self.succs.append(s)
+            self.succ_index.append(len(self.succs))
+
+        # Predecessors, by counting the incoming edges of every block first.
+        counts = [0] * (n + 1)
+        for s in self.succs:
+            counts[s + 1] += 1
+        for b in range(n):
+            counts[b + 1] += counts[b]
+        self.pred_index = array('i', counts)
+        self.preds = array('i', [0]) * len(self.succs)
+        for b in range(n):
+            for s in self.successors(b):
+                self.preds[counts[s]] = b
+                counts[s] += 1
+
+        self._rpo = None
+        self._analyses = {}
+
+    def __len__(self):
+        return len(self.bounds) - 1
+
+    def start(self, b):
+        return self.bounds[b]
+
+    def end(self, b):
+        return self.bounds[b + 1]
+
+    def block_of(self, i):
+        """Return the block containing the item of index i."""
+        return bisect_right(self.bounds, i, 0, len(self.bounds) - 1) - 1
+
+    def block(self, b):
+        """Return the items of block b."""
+        return self.items[self.bounds[b]:self.bounds[b + 1]]
+
+    def successors(self, b):
+        return self.succs[self.succ_index[b]:self.succ_index[b + 1]]
+
+    def predecessors(self, b):
+        return self.preds[self.pred_index[b]:self.pred_index[b + 1]]
+
+    def reverse_postorder(self):
+        """Return the list of the blocks reachable from the entry block in
+        reverse postorder, in which a block comes before its successors
+        except along back edges. The order is computed once."""
+        if self._rpo is None:
+            postorder = []
+            visited = bytearray(len(self))
+            if visited:
+                visited[0] = 1
+                # Stack of (block, index of its next successor to visit).
+                stack = [(0, self.succ_index[0])]
+                while stack:
+                    b, i = stack[-1]
+                    if i < self.succ_index[b + 1]:
+                        stack[-1] = (b, i + 1)
+                        s = self.succs[i]
+                        if not visited[s]:
+                            visited[s] = 1
+                            stack.append((s, self.succ_index[s]))
+                    else:
+                        stack.pop()
+                        postorder.append(b)
+            postorder.reverse()
+            self._rpo = postorder
+        return self._rpo
+
+    def analysis(self, cls):
+        """Return cls(self), an analysis of the graph such as
+        flow.dominators.Dominators, computed once. The graph is a snapshot
+        of the items: when they are modified, a new graph must be built,
+        which drops the cached analyses."""
+        result = self._analyses.get(cls)
+        if result is None:
+            result = self._analyses[cls] = cls(self)
+        return result
+
+    def reachable(self):
+        """Return a bytearray telling for every block whether it can be
+        reached from the entry block."""
+        reachable = bytearray(len(self))
+        for b in self.reverse_postorder():
+            reachable[b] = 1
+        return reachable
+
+    def unreachable(self):
+        """Return the list of the blocks which cannot be reached from the
+        entry block, in increasing order."""
+        reachable = self.reachable()
+        return [b for b in range(len(self)) if not reachable[b]]
+
+
+def _stm_label(stm):
+    return stm.label if isinstance(stm, LABEL) else None
+
+
+def _stm_targets(stm):
+    if isinstance(stm, JUMP):
+        return [stm.target.label] if isinstance(stm.target, NAME) else []
+    if isinstance(stm, CJUMP):
+        return [stm.ifTrue.label, stm.ifFalse.label]
+    return None
+
+
+def _stm_defs(stm):
+    return effects(stm).writes
+
+
+def _stm_uses(stm):
+    return effects(stm).reads
+
+
+def ir_cfg(stms):
+    """Return the control flow graph of a list of canonical IR
+    statements."""
+    return CFG(stms, _stm_label, _stm_targets, _stm_defs, _stm_uses)
+
+
+def _instr_label(instr):
+    return instr.label if isinstance(instr, L) else None
+
+
+def _instr_targets(instr):
+    return instr.jumps() or None
+
+
+def instr_cfg(instrs):
+    """Return the control flow graph of a list of instructions. An
+    instruction jumps to the targets given by its `jumps` method, and
+    falls through it if there are none."""
+    return CFG(instrs, _instr_label, _instr_targets,
+               lambda instr: instr.defs(), lambda instr: instr.uses())
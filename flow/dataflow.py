@@ -0,0 +1,272 @@
+from bisect import bisect_left
+
+from ir.effects import effects
+from ir.nodes import BINOP, MEM, Stm
+
+
+def bits(x):
+    """Yield the indices of the bits set in x, lowest first."""
+    while x:
+        low = x & -x
+        yield low.bit_length() - 1
+        x ^= low
+
+
+def solve(cfg, gen, kill, forward=True, universe=None, boundary=0):
+    """Solve a dataflow problem over cfg (see flow.cfg) and return the
+    (ins, outs) pair of the lists of the values at the beginning and at
+    the end of every block.
+
+    Values are sets represented as Python integers used as bitsets. The
+    transfer function of block b maps a value x to
+    `gen[b] | (x & ~kill[b])`, going forward from the beginning of the
+    block to its end, or backward from its end to its beginning. Values
+    flowing into a block are merged by union if universe is None, or by
+    intersection otherwise, universe being then the value every block
+    starts from. boundary is the value at the beginning of the entry
+    block, or at the end of the blocks without successors when going
+    backward.
+
+    The blocks whose inputs have changed are taken from a worklist in
+    reverse postorder, or in postorder when going backward, so that the
+    values are final after a single pass on code without loops, and after
+    a few passes in general. Forward problems ignore the blocks
+    which cannot be reached from the entry block."""
+    n = len(cfg)
+    order = cfg.reverse_postorder()
+    if not forward:
+        reachable = cfg.reachable()
+        order = order[::-1] + [b for b in range(n) if not reachable[b]]
+    position = [-1] * n
+    for (i, b) in enumerate(order):
+        position[b] = i
+    union = universe is None
+    start = 0 if union else universe
+    # Values where the blocks are entered and left in the direction of the
+    # analysis.
+    before, after = [start] * n, [start] * n
+    if forward:
+        sources, source_index = cfg.preds, cfg.pred_index
+        targets, target_index = cfg.succs, cfg.succ_index
+    else:
+        sources, source_index = cfg.succs, cfg.succ_index
+        targets, target_index = cfg.preds, cfg.pred_index
+    # The worklist is a flag per position in order, and is swept in order
+    # until it is empty. Going back to the first position after every
+    # change instead would walk the code following a loop once for every
+    # loop preceding it in the reverse postorder.
+    queued = bytearray(b"\1" * len(order))
+    pending = len(order)
+    while pending:
+        for (i, b) in enumerate(order):
+            if not queued[i]:
+                continue
+            queued[i] = 0
+            pending -= 1
+            if forward:
+                x = boundary if b == 0 else None
+            else:
+                x = boundary if source_index[b] == source_index[b + 1] \
+                    else None
+            for k in range(source_index[b], source_index[b + 1]):
+                s = sources[k]
+                if position[s] < 0:
+                    continue
+                if x is None:
+                    x = after[s]
+                elif union:
+                    x |= after[s]
+                else:
+                    x &= after[s]
+            if x is None:
+                x = start
+            before[b] = x
+            x = gen[b] | (x & ~kill[b])
+            if x != after[b]:
+                after[b] = x
+                for k in range(target_index[b], target_index[b + 1]):
+                    t = position[targets[k]]
+                    if t >= 0 and not queued[t]:
+                        queued[t] = 1
+                        pending += 1
+    return (before, after) if forward else (after, before)
+
+
+class Liveness:
+    """Temporaries live at the beginning and at the end of every block of a
+    control flow graph, that is which may be read later before being
+    written.
+
+    Sets of temporaries are bitsets indexed by temporary ids, and `temps`
+    maps the ids to the temporaries. `defs[i]` and `uses[i]` are the sets
+    of the temporaries written and read by the item of index i. The
+    problem is solved on the summaries of the blocks, and the sets of the
+    items are only computed when walking a block with `backward`."""
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.temps = temps = {}
+        self.defs, self.uses = defs, uses = [], []
+        for item in cfg.items:
+            for (temps_of, masks) in ((cfg.defs_of, defs),
+                                      (cfg.uses_of, uses)):
+                mask = 0
+                for temp in temps_of(item):
+                    temps[temp.id] = temp
+                    mask |= 1 << temp.id
+                masks.append(mask)
+        n = len(cfg)
+        gen, kill = [0] * n, [0] * n
+        for b in range(n):
+            g = k = 0
+            for i in range(cfg.end(b) - 1, cfg.start(b) - 1, -1):
+                g = (g & ~defs[i]) | uses[i]
+                k |= defs[i]
+            gen[b], kill[b] = g, k
+        self.ins, self.outs = solve(cfg, gen, kill, forward=False)
+
+    def backward(self, b):
+        """Yield the (index, live out) pairs of the items of block b, from
+        the last one to the first one."""
+        defs, uses = self.defs, self.uses
+        live = self.outs[b]
+        for i in range(self.cfg.end(b) - 1, self.cfg.start(b) - 1, -1):
+            yield (i, live)
+            live = (live & ~defs[i]) | uses[i]
+
+    def temps_of(self, live):
+        """Return the set of the temporaries of a bitset."""
+        temps = self.temps
+        return set(temps[t] for t in bits(live))
+
+
+class ReachingDefinitions:
+    """Definitions reaching every block of a control flow graph.
+
+    A definition is the write of a temporary by an item. `defs` lists the
+    (item index, temporary) pairs of the definitions, numbered in the order
+    of the items, and `temp_defs[temp]` is the bitset of the definitions of
+    temp. `ins[b]` and `outs[b]` are the bitsets of the definitions which
+    reach the beginning and the end of block b."""
+
+    def __init__(self, cfg):
+        items, defs_of = cfg.items, cfg.defs_of
+        self.cfg = cfg
+        self.defs = defs = []
+        self.temp_defs = temp_defs = {}
+        for (i, item) in enumerate(items):
+            for temp in dict.fromkeys(defs_of(item)):
+                temp_defs[temp] = temp_defs.get(temp, 0) | 1 << len(defs)
+                defs.append((i, temp))
+        self.def_items = [i for (i, _) in defs]
+        n = len(cfg)
+        gen, kill = [0] * n, [0] * n
+        d = 0
+        for b in range(n):
+            g = k = 0
+            for i in range(cfg.start(b), cfg.end(b)):
+                while d < len(defs) and defs[d][0] == i:
+                    temp_mask = temp_defs[defs[d][1]]
+                    g = (g & ~temp_mask) | 1 << d
+                    k |= temp_mask
+                    d += 1
+            gen[b], kill[b] = g, k
+        self.ins, self.outs = solve(cfg, gen, kill)
+
+    def reaching(self, i):
+        """Return the bitset of the definitions reaching the item of
+        index i, before its execution."""
+        cfg, defs, temp_defs = self.cfg, self.defs, self.temp_defs
+        b = cfg.block_of(i)
+        x = self.ins[b]
+        d = bisect_left(self.def_items, cfg.start(b))
+        while d < len(defs) and defs[d][0] < i:
+            x = (x & ~temp_defs[defs[d][1]]) | 1 << d
+            d += 1
+        return x
+
+
+class Chains:
+    """Def-use and use-def chains of a control flow graph, built from its
+    reaching definitions.
+
+    `use_defs[(i, temp)]` is the list of the definitions (see
+    ReachingDefinitions) which may give its value to temp when it is read
+    by the item of index i, and `def_uses[d]` the list of the indices of
+    the items which may read the value given by definition d."""
+
+    def __init__(self, cfg):
+        reaching = cfg.analysis(ReachingDefinitions)
+        defs, temp_defs = reaching.defs, reaching.temp_defs
+        items, uses_of = cfg.items, cfg.uses_of
+        self.use_defs = use_defs = {}
+        self.def_uses = def_uses = [[] for _ in defs]
+        d = 0
+        for b in range(len(cfg)):
+            x = reaching.ins[b]
+            for i in range(cfg.start(b), cfg.end(b)):
+                for temp in dict.fromkeys(uses_of(items[i])):
+                    ds = list(bits(x & temp_defs.get(temp, 0)))
+                    use_defs[(i, temp)] = ds
+                    for u in ds:
+                        def_uses[u].append(i)
+                while d < len(defs) and defs[d][0] == i:
+                    x = (x & ~temp_defs[defs[d][1]]) | 1 << d
+                    d += 1
+
+
+class AvailableExpressions:
+    """Expressions available at the beginning and at the end of every block
+    of the control flow graph of canonical IR statements, that is which
+    have been computed on every path from the entry block and whose
+    operands have not been changed since.
+
+    Expressions are the BINOP and MEM nodes read by the statements. Since
+    IR nodes are hash-consed, identical expressions are the same node.
+    `exprs` lists them, and `ins[b]` and `outs[b]` are bitsets of
+    indices in `exprs`. An expression is killed by the writes of the
+    temporaries it reads, and a MEM by any store or call."""
+
+    def __init__(self, cfg):
+        self.exprs = exprs = []
+        index = {}
+        # Expressions reading every temporary, and reading memory.
+        temp_exprs, memory = {}, 0
+        stm_exprs = []
+        for stm in cfg.items:
+            assert isinstance(stm, Stm), "available expressions need IR"
+            e = 0
+            # The kids of a MOVE to memory are the address and the value.
+            nodes = [stm]
+            while nodes:
+                node = nodes.pop()
+                nodes.extend(node.kids)
+                if not isinstance(node, (BINOP, MEM)):
+                    continue
+                x = index.get(node)
+                if x is None:
+                    x = index[node] = len(exprs)
+                    exprs.append(node)
+                    effect = effects(node)
+                    for temp in effect.reads:
+                        temp_exprs[temp] = temp_exprs.get(temp, 0) | 1 << x
+                    if effect.loads or effect.loads_any:
+                        memory |= 1 << x
+                e |= 1 << x
+            stm_exprs.append(e)
+        n = len(cfg)
+        gen, kill = [0] * n, [0] * n
+        for b in range(n):
+            g = k = 0
+            for i in range(cfg.start(b), cfg.end(b)):
+                effect = effects(cfg.items[i])
+                killed = memory if effect.stores or effect.stores_any \
+                    else 0
+                for temp in effect.writes:
+                    killed |= temp_exprs.get(temp, 0)
+                g = (g | stm_exprs[i]) & ~killed
+                k |= killed
+            gen[b], kill[b] = g, k
+        universe = (1 << len(exprs)) - 1
+        self.ins, self.outs = solve(cfg, gen, kill, universe=universe)
+
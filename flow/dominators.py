@@ -0,0 +1,92 @@
+from array import array
+
+
+class Dominators:
+    """Dominator tree of a control flow graph (see flow.cfg). A block a
+    dominates a block b if every path from the entry block to b goes
+    through a.
+
+    `idom[b]` is the immediate dominator of block b, the entry block being
+    its own immediate dominator, and -1 for the blocks which cannot be
+    reached. Immediate dominators are computed with the iterative
+    algorithm of Cooper, Harvey and Kennedy over the reverse postorder,
+    which converges in a few passes on the graphs built from structured
+    code. The dominator tree is then numbered in preorder so that
+    `dominates` takes constant time."""
+
+    def __init__(self, cfg):
+        n = len(cfg)
+        rpo = cfg.reverse_postorder()
+        # Position of every reachable block in the reverse postorder.
+        order = [-1] * n
+        for (i, b) in enumerate(rpo):
+            order[b] = i
+        idom = [-1] * n
+        if rpo:
+            idom[0] = 0
+        pred_index, preds = cfg.pred_index, cfg.preds
+        changed = True
+        while changed:
+            changed = False
+            for b in rpo[1:]:
+                new = -1
+                for k in range(pred_index[b], pred_index[b + 1]):
+                    p = preds[k]
+                    if idom[p] < 0:
+                        continue
+                    if new < 0:
+                        new = p
+                        continue
+                    # Walk up the tree from both blocks to their nearest
+                    # common dominator.
+                    a = p
+                    while a != new:
+                        while order[a] > order[new]:
+                            a = idom[a]
+                        while order[new] > order[a]:
+                            new = idom[new]
+                if idom[b] != new:
+                    idom[b] = new
+                    changed = True
+        self.idom = array('i', idom)
+
+        # Children in the dominator tree, in compressed rows.
+        counts = [0] * (n + 1)
+        for b in rpo[1:]:
+            counts[idom[b] + 1] += 1
+        for b in range(n):
+            counts[b + 1] += counts[b]
+        self.child_index = array('i', counts)
+        self.childs = array('i', [0]) * max(len(rpo) - 1, 0)
+        for b in rpo[1:]:
+            self.childs[counts[idom[b]]] = b
+            counts[idom[b]] += 1
+
+        # Preorder numbers, and the last number in the subtree of every
+        # block.
+        self.pre = array('i', [-1] * n)
+        self.last = array('i', [-1] * n)
+        if rpo:
+            number = 0
+            stack = [0]
+            while stack:
+                b = stack.pop()
+                if b < 0:
+                    self.last[~b] = number - 1
+                    continue
+                self.pre[b] = number
+                number += 1
+                stack.append(~b)
+                stack.extend(self.children(b))
+
+    def children(self, b):
+        """Return the blocks immediately dominated by b."""
+        return self.childs[self.child_index[b]:self.child_index[b + 1]]
+
+    def dominates(self, a, b):
+        """Check whether block a dominates block b. Every block dominates
+        itself, and unreachable blocks neither dominate nor are
+        dominated."""
+        pre = self.pre[b]
+        return pre >= 0 and self.pre[a] >= 0 and \
+            self.pre[a] <= pre <= self.last[a]
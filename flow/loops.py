@@ -0,0 +1,79 @@
+from array import array
+
+from flow.dominators import Dominators
+
+
+class Loops:
+    """Loop nesting forest of a control flow graph (see flow.cfg).
+
+    An edge from b to h is a back edge when h dominates b, and the natural
+    loop of h is made of h and of the blocks which can reach a back edge to
+    h without going through h. A loop is identified by its header block.
+
+    `header[b]` is the header of the innermost loop containing block b, or
+    -1 if b is in no loop, `parent[h]` is the header of the loop immediately
+    containing the loop of header h, or -1, and `depth[b]` is the number of
+    loops containing block b. `headers` lists the loop headers, outermost
+    loops first.
+
+    Loops are found from the innermost ones, in reverse postorder of their
+    headers: when the body of a loop reaches a block of an inner loop, the
+    walk goes on from the header of the outermost loop found so far
+    containing it, through a union-find structure, so every block is
+    walked through once per loop header above it in the forest at most,
+    and nearly once in practice. Retreating edges which are not back edges,
+    from irreducible control flow, do not form loops."""
+
+    def __init__(self, cfg):
+        n = len(cfg)
+        dominators = cfg.analysis(Dominators)
+        rpo = cfg.reverse_postorder()
+        reachable = cfg.reachable()
+        pred_index, preds = cfg.pred_index, cfg.preds
+        header = [-1] * n
+        parent = [-1] * n
+        # Union-find of the outermost loop found so far containing a block.
+        outer = list(range(n))
+
+        def find(b):
+            root = b
+            while outer[root] != root:
+                root = outer[root]
+            while outer[b] != root:
+                outer[b], b = root, outer[b]
+            return root
+
+        headers = []
+        for h in reversed(rpo):
+            stack = [p for p in preds[pred_index[h]:pred_index[h + 1]]
+                     if dominators.dominates(h, p)]
+            if not stack:
+                continue
+            headers.append(h)
+            header[h] = h
+            while stack:
+                b = find(stack.pop())
+                if b == h:
+                    continue
+                # b is either a block in no loop yet, or the header of an
+                # outermost inner loop.
+                outer[b] = h
+                if header[b] < 0:
+                    header[b] = h
+                elif header[b] == b:
+                    parent[b] = h
+                stack.extend(p for p in preds[pred_index[b]:pred_index[b + 1]]
+                             if reachable[p])
+        headers.reverse()
+
+        # Parent loops come first in the reverse postorder.
+        depth = [0] * n
+        for h in headers:
+            depth[h] = depth[parent[h]] + 1 if parent[h] >= 0 else 1
+        for b in range(n):
+            if header[b] >= 0:
+                depth[b] = depth[header[b]]
+        self.header = array('i', header)
+        self.parent = array('i', parent)
+        self.depth = array('i', depth)
+        self.headers = headers
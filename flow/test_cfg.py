@@ -0,0 +1,47 @@
+import unittest
+
+from codegen.instr import LABEL as L, MOVE as M, OPER as O
+from flow.cfg import instr_cfg, ir_cfg
+from ir.nodes import *
+
+class TestCFG(unittest.TestCase):
+
+    def test_ir(self):
+        a, b, c, d = [Label(name) for name in ("a", "b", "c", "d")]
+        t = TEMP(Temp("x"))
+        stms = [MOVE(t, CONST(0)),
+                LABEL(a), CJUMP('<', t, CONST(10), NAME(b), NAME(c)),
+                LABEL(b), MOVE(t, BINOP('+', t, CONST(1))), JUMP(NAME(a)),
+                MOVE(t, CONST(2)),
+                LABEL(d), JUMP(NAME(c)),
+                LABEL(c)]
+        cfg = ir_cfg(stms)
+        self.assertEqual(len(cfg), 6)
+        self.assertEqual([(cfg.start(i), cfg.end(i)) for i in range(6)],
+                         [(0, 1), (1, 3), (3, 6), (6, 7), (7, 9), (9, 10)])
+        self.assertEqual(cfg.labels, {a: 1, b: 2, d: 4, c: 5})
+        self.assertEqual([list(cfg.successors(i)) for i in range(6)],
+                         [[1], [2, 5], [1], [4], [5], []])
+        self.assertEqual([list(cfg.predecessors(i)) for i in range(6)],
+                         [[], [0, 2], [1], [], [3], [1, 4]])
+        self.assertEqual(cfg.reverse_postorder(), [0, 1, 5, 2])
+        self.assertEqual(cfg.unreachable(), [3, 4])
+
+    def test_instrs(self):
+        a, b, f = Label("a"), Label("b"), Label("f")
+        r0, r1 = Temp("r0"), Temp("r1")
+        instrs = [L("a:", a),
+                  O("cmp {}, {}", srcs=[r0, r1]),
+                  O("beq b", jmps=[b, a]),
+                  O("bl f"),
+                  L("b:", b),
+                  M("mov {}, {}", dst=r0, src=r1)]
+        cfg = instr_cfg(instrs)
+        self.assertEqual(list(cfg.bounds), [0, 3, 4, 6])
+        self.assertEqual([list(cfg.successors(i)) for i in range(3)],
+                         [[2, 0], [2], []])
+        self.assertEqual(cfg.unreachable(), [1])
+        self.assertEqual(cfg.block(2), instrs[4:])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+from flow.cfg import ir_cfg
+from flow.dataflow import (AvailableExpressions, Chains, ReachingDefinitions,
+                           bits)
+from ir.nodes import *
+
+class TestDataflow(unittest.TestCase):
+
+    def loop(self):
+        head, body, end = Label("head"), Label("body"), Label("end")
+        i, s, p = [TEMP(Temp(name)) for name in ("i", "s", "p")]
+        self.i, self.s, self.p = i, s, p
+        self.sum = BINOP('+', s, i)
+        self.load = MEM(p)
+        return ir_cfg([
+            MOVE(i, CONST(0)),                                  # 0
+            MOVE(s, self.load),                                 # 1
+            LABEL(head),                                        # 2
+            CJUMP('<', i, self.load, NAME(body), NAME(end)),    # 3
+            LABEL(body),                                        # 4
+            MOVE(s, self.sum),                                  # 5
+            MOVE(i, BINOP('+', i, CONST(1))),                   # 6
+            JUMP(NAME(head)),                                   # 7
+            LABEL(end),                                         # 8
+            MOVE(MEM(p), self.sum)])                            # 9
+
+    def test_reaching_definitions(self):
+        cfg = self.loop()
+        reaching = cfg.analysis(ReachingDefinitions)
+        self.assertEqual(reaching.defs, [(0, self.i.temp), (1, self.s.temp),
+                                         (5, self.s.temp), (6, self.i.temp)])
+        self.assertEqual(list(bits(reaching.ins[1])), [0, 1, 2, 3])
+        self.assertEqual(list(bits(reaching.reaching(6))), [0, 2, 3])
+
+    def test_chains(self):
+        chains = self.loop().analysis(Chains)
+        self.assertEqual(chains.use_defs[(5, self.i.temp)], [0, 3])
+        self.assertEqual(chains.use_defs[(9, self.s.temp)], [1, 2])
+        self.assertEqual(chains.use_defs[(9, self.p.temp)], [])
+        self.assertEqual(chains.def_uses[3], [3, 5, 6, 9])
+
+    def test_available_expressions(self):
+        cfg = self.loop()
+        available = cfg.analysis(AvailableExpressions)
+        load = 1 << available.exprs.index(self.load)
+        # The load is computed before the loop and never killed in it, but
+        # the sum is killed by the increment of i.
+        self.assertEqual(available.ins[1] & load, load)
+        self.assertEqual(available.outs[1], load)
+        self.assertEqual(available.outs[2], load)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+from arm.frame import ArmFrame
+from arm.gen import Gen
+from flow.cfg import instr_cfg, ir_cfg
+from flow.dominators import Dominators
+from flow.loops import Loops
+from ir.blocks import reorder_blocks
+from ir.canonical import canon
+from ir.context import Context
+from ir.hoist import HoistCalls
+from ir.nodes import *
+from ir.translate import Translator
+from parser.parser import parse
+from semantics.binder import Binder
+from typer.typer import Typer
+
+class TestLoops(unittest.TestCase):
+
+    def nested(self):
+        h1, h2, b3, b4, end = [Label(name) for name in
+                               ("h1", "h2", "b3", "b4", "end")]
+        t = TEMP(Temp("x"))
+        return ir_cfg([
+            MOVE(t, CONST(0)),
+            LABEL(h1), CJUMP('<', t, CONST(10), NAME(h2), NAME(end)),
+            LABEL(h2), CJUMP('<', t, CONST(5), NAME(b3), NAME(b4)),
+            LABEL(b3), JUMP(NAME(h2)),
+            LABEL(b4), JUMP(NAME(h1)),
+            LABEL(end)])
+
+    def test_dominators(self):
+        cfg = self.nested()
+        dominators = cfg.analysis(Dominators)
+        self.assertIs(cfg.analysis(Dominators), dominators)
+        self.assertEqual(list(dominators.idom), [0, 0, 1, 2, 2, 1])
+        self.assertTrue(dominators.dominates(1, 4))
+        self.assertTrue(dominators.dominates(3, 3))
+        self.assertFalse(dominators.dominates(3, 4))
+        self.assertFalse(dominators.dominates(5, 1))
+
+    def test_nested(self):
+        loops = self.nested().analysis(Loops)
+        self.assertEqual(loops.headers, [1, 2])
+        self.assertEqual(list(loops.header), [-1, 1, 2, 2, 1, -1])
+        self.assertEqual(loops.parent[2], 1)
+        self.assertEqual(list(loops.depth), [0, 1, 2, 2, 1, 0])
+
+    def test_irreducible(self):
+        a, b = Label("a"), Label("b")
+        t = TEMP(Temp("x"))
+        # Both blocks of the cycle can be entered first: no back edge.
+        loops = ir_cfg([
+            CJUMP('<', t, CONST(0), NAME(a), NAME(b)),
+            LABEL(a), JUMP(NAME(b)),
+            LABEL(b), JUMP(NAME(a))]).analysis(Loops)
+        self.assertEqual(loops.headers, [])
+
+    def test_instructions(self):
+        with Context() as context:
+            tree = parse("let var s := 0 in (for i := 1 to 10 do "
+                         "for j := 1 to i do s := s + j; s) end")
+            tree.accept(Binder())
+            Typer().run(tree, False)
+            ((frame, stm),) = Translator(ArmFrame).run(tree).values()
+            with context.function(frame):
+                seq = reorder_blocks(canon(stm.accept(HoistCalls())), frame)
+                cfg = instr_cfg(seq.accept(Gen(frame)))
+        self.assertEqual(max(cfg.analysis(Loops).depth), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -72,8 +72,9 @@ class Frame:
 
     def label_name(self, suffix):
         """Return the name suitable for a temporary label with the given
-        suffix."""
-        return ".L%s" % suffix
+        suffix. Temporary labels are numbered per function, so the name
+        of the function is part of it."""
+        return ".L%s.%s" % (self.label.name, suffix)
 
     def alloc_parameter(self, escapes):
         """Returns an `Access` representing this parameter."""
@@ -221,6 +222,14 @@ class Frame:
         offset relative to the frame pointer."""
         raise AssertionError("unimplemented")
 
+    def rematerializable(self, instr):
+        """Return True if the given instruction only computes its single
+        destination from its sources, without accessing memory or having
+        any other effect, so that the register allocator may execute it
+        again instead of spilling its destination (see
+        codegen.alloc.rematerializable). No instruction is by default."""
+        return False
+
     def reserve_stack_space(self):
         """Return a list of instructions (wrapped in Instr instances) to
         reserve the stack space needed for the static link and the spills.
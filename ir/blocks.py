@@ -1,83 +1,95 @@
-from ir.nodes import *
+from flow.cfg import ir_cfg
 from frame.frame import Frame
+from ir.nodes import *
+
+
+def is_jump(stm):
+    return isinstance(stm, JUMP) or isinstance(stm, CJUMP)
 
 
 def reorder_blocks(seq, frame):
     """Reorder blocks in seq so that the negative branch of a CJUMP always
     follows the CJUMP itself. frame is the frame of the corresponding
-    function."""
+    function.
+
+    The basic blocks are those of the control flow graph of seq (see
+    flow.cfg). A label is added to the first block if it has none, and a
+    jump to the next label to the blocks falling through it. Blocks which
+    cannot be reached from the first one are dropped, except for the last
+    block, which returns from the function and may not end with a jump.
+
+    Blocks are laid out in traces: starting from the first block not laid
+    out yet (in the original order), the target of a JUMP or the negative
+    branch of a CJUMP is laid out next if it has not been already, the
+    condition of a CJUMP being inverted if only its positive branch is
+    available. Jumps to the next block are then dropped. The first block
+    stays first, and the last one, which returns from the function, stays
+    last. This takes linear time."""
     assert(isinstance(seq, SEQ))
     assert(isinstance(frame, Frame))
-    blocks = []
-    previous_stm = None
-    for stm in seq.stms:
-        if isinstance(stm, LABEL):
-            if previous_stm and not isinstance(previous_stm, JUMP) and not isinstance(previous_stm, CJUMP):
-                blocks[-1].append(JUMP(NAME(stm.label)))
-            blocks.append([stm])
-        else:
-            blocks[-1].append(stm)
-        previous_stm = stm
-    
-    examinated_blocks = []
-    examinated_blocks.append(blocks[0])
-    del blocks[0]
+    cfg = ir_cfg(seq.stms)
+    n = len(cfg)
+    if not n:
+        return SEQ([])
+    last = cfg.block(n - 1)
+    exit = n - 1 if not is_jump(last[-1]) and \
+        (n == 1 or isinstance(last[0], LABEL)) else None
+    reachable = cfg.reachable()
+    blocks = [None] * n
+    for b in range(n):
+        if reachable[b] or b == exit:
+            block = cfg.block(b)
+            if not isinstance(block[0], LABEL):
+                block.insert(0, LABEL(Label.create(frame)))
+            if not is_jump(block[-1]) and b != exit:
+                block.append(JUMP(NAME(cfg.items[cfg.start(b + 1)].label)))
+            blocks[b] = block
+    # Dropped blocks and the last one are never part of a trace.
+    visited = [block is None for block in blocks]
+    if exit is not None:
+        visited[exit] = True
 
-    while len(blocks) > 0:
-        current_block = examinated_blocks[-1]
-        ## JUMP case
-        if isinstance(current_block[-1], JUMP):
-            current_block_target = current_block[-1].target
-            if current_block_target in blocks:
-                examinated_blocks.append(current_block_target)
-                blocks.remove(current_block_target)
-            else:
-                examinated_blocks.append(blocks[0])
-                del blocks[0]
-        ## CJUMP case
-        elif isinstance(current_block[-1], CJUMP):
-            true_block = current_block[-1].ifTrue
-            false_block = current_block[-1].ifFalse
-            if is_block_in_list(current_block[-1].ifFalse.label, blocks):
-                block_index = find_block_index(current_block[-1].ifFalse.label, blocks)
-                examinated_blocks.append(blocks[block_index])
-                del blocks[block_index]
-            elif is_block_in_list(current_block[-1].ifTrue.label, blocks):
-                block_index = find_block_index(current_block[-1].ifTrue.label, blocks)
-                temp = current_block[-1].ifTrue
-                current_block[-1].ifTrue = current_block[-1].ifFalse
-                current_block[-1].ifFalse = temp
-                inverse(current_block[-1].op)
-                examinated_blocks.append(blocks[block_index])
-                del blocks[block_index]
-            else:
-                new_label = LABEL(Label.create(frame))
-                examinated_blocks.append([new_label, JUMP(false_block)])
-                current_block[-1].ifFalse = new_label
-                examinated_blocks.append(blocks[0])
-                del blocks[0]
-        ## Last block
-        else:
-            examinated_blocks.append(blocks[0])
-            del blocks[0]
+    def unvisited(target):
+        i = cfg.labels.get(target.label) if isinstance(target, NAME) else None
+        return None if i is None or visited[i] else i
 
-    # Linearisation
-    linearized_seq = []
-    for index, block in enumerate(examinated_blocks):
-        for stm in block:
-            if isinstance(examinated_blocks[index-1][-1], JUMP) and examinated_blocks[index-1][-1].target.label == block[0].label:
-                del examinated_blocks[index-1][-1]
-            linearized_seq.append(stm)
-    return SEQ(linearized_seq)
-
-def is_block_in_list(label, block_list):
-    for block in block_list:
-        if block[0].label == label:
-            return True
-    return False
+    order = []
+    for start in range(len(blocks)):
+        i = start
+        while i is not None and not visited[i]:
+            visited[i] = True
+            block = blocks[i]
+            order.append(block)
+            last = block[-1]
+            if isinstance(last, JUMP):
+                i = unvisited(last.target)
+            else:
+                i = unvisited(last.ifFalse)
+                if i is None:
+                    i = unvisited(last.ifTrue)
+                    if i is not None:
+                        block[-1] = CJUMP(inverse(last.op), last.left,
+                                          last.right, last.ifFalse,
+                                          last.ifTrue)
+    if exit is not None:
+        order.append(blocks[exit])
 
-def find_block_index(label, block_list):
-    for index, block in enumerate(block_list):
-        if block[0].label == label:
-            return index
-    return -1
+    # Linearization
+    result = []
+    for (n, block) in enumerate(order):
+        following = order[n + 1][0].label if n + 1 < len(order) else None
+        last = block[-1]
+        if isinstance(last, JUMP) and isinstance(last.target, NAME) and \
+           last.target.label == following:
+            result.extend(block[:-1])
+        elif isinstance(last, CJUMP) and last.ifFalse.label != following:
+            # Neither branch was available when the trace ended: jump to
+            # the negative branch from a new block.
+            label = Label.create(frame)
+            result.extend(block[:-1])
+            result.extend([CJUMP(last.op, last.left, last.right,
+                                 last.ifTrue, NAME(label)),
+                           LABEL(label), JUMP(last.ifFalse)])
+        else:
+            result.extend(block)
+    return SEQ(result)
@@ -1,53 +1,124 @@
+from ir.effects import Effects, effects
 from ir.nodes import *
 
+# The canonicalizer appends the statements it produces to an output list
+# instead of building and flattening intermediate SEQ, so that its running
+# time is linear in the size of the tree. Only non nop statements which are
+# not SEQ are ever appended to the list, which is thus always flat.
+
+
+def flatten_into(s, result):
+    """Append the statements of s to result, flattening the SEQ directly
+    inside it and dropping the nops, and return result."""
+    stack = [s]
+    while stack:
+        s = stack.pop()
+        if isinstance(s, SEQ):
+            stack.extend(reversed(s.stms))
+        elif not s.is_nop:
+            result.append(s)
+    return result
+
 
 def flatten(s):
     """If s is a SEQ, flatten all the SEQ directly inside it recursively."""
-    if isinstance(s, SEQ):
-        result = []
-        for ss in s.stms:
-            result = result + flatten(ss).stms
-        return SEQ(result)
-    if s.is_nop:
-        return SEQ([])
-    return SEQ([s])
+    return SEQ(flatten_into(s, []))
+
+
+def reorder_into(sxps, result):
+    """Append to result everything that needs to be done before the
+    expressions of the list sxps, and return the list of expressions to
+    use instead of them."""
+    assert all(isinstance(sxp, Sxp) for sxp in sxps)
+    stms, exps = [], []
+    for sxp in sxps:
+        s = []
+        exps.append(reorder_sxp_into(sxp, s))
+        stms.append(s)
+    # An expression must be saved in a temporary if it does not commute
+    # with the statements of the following expressions (see ir.effects),
+    # including the saving of those expressions. Temporaries are created
+    # from the last expression on.
+    temps = [None] * len(sxps)
+    tail = None
+    for i in range(len(sxps) - 1, -1, -1):
+        exp = exps[i]
+        if tail is not None and not isinstance(exp, (CONST, NAME)) and \
+           not tail.commutes_with(effects(exp)):
+            temps[i] = TEMP(Temp.create("reorder"))
+            tail.add(exp).writes.add(temps[i].temp)
+        if stms[i]:
+            if tail is None:
+                tail = Effects()
+            for stm in stms[i]:
+                tail.add(stm)
+    for (s, exp, temp) in zip(stms, exps, temps):
+        result.extend(s)
+        if temp is not None:
+            result.append(MOVE(temp, exp))
+    return [exp if temp is None else temp for (exp, temp) in zip(exps, temps)]
 
 
 def reorder(sxps):
     """Take a list of expressions and return a pair of
     (statement, expressions) with statement being everything that need to
     be done before the expressions. statement is a flattend statement."""
-    assert all(isinstance(sxp, Sxp) for sxp in sxps)
-    if sxps == []:
-        return (SEQ([]), [])
-    h = reorder_sxp(sxps[0])
-    (tstm, texps) = reorder(sxps[1:])
-    if tstm.commutes_with(h.exp):
-        return flatten(SEQ([h.stm, tstm])), [h.exp] + texps
-    else:
-        temp = TEMP(Temp.create("reorder"))
-        return flatten(SEQ([h.stm, MOVE(temp, h.exp), tstm])), \
-            [temp] + texps
+    result = []
+    exps = reorder_into(sxps, result)
+    return (SEQ(result), exps)
 
 
-def reorder_sxp(sxp):
-    """Return an ESEQ with a reordering of sxp."""
+def reorder_sxp_into(sxp, result):
+    """Append to result the statements of a reordering of sxp, and return
+    the expression to evaluate after them."""
     assert isinstance(sxp, Sxp)
-    rs, res = reorder(sxp.kids)
     if isinstance(sxp, ESEQ):
-        return ESEQ(flatten(SEQ([reorder_stm(sxp.stm), rs])), res[0])
-    return ESEQ(rs, sxp.build(res))
+        # The expression is reordered before the statement to number the
+        # temporaries in the same order as the tree.
+        s = []
+        exp = reorder_sxp_into(sxp.exp, s)
+        reorder_stm_into(sxp.stm, result)
+        result.extend(s)
+        return exp
+    return sxp.build(reorder_into(sxp.kids, result))
+
+
+def reorder_sxp(sxp):
+    """Return an ESEQ with a reordering of sxp."""
+    result = []
+    exp = reorder_sxp_into(sxp, result)
+    return ESEQ(SEQ(result), exp)
+
+
+def reorder_stm_into(stm, result):
+    """Append the statements of a reordering of stm to result, and return
+    result."""
+    assert isinstance(stm, Stm)
+    # Sequences are walked without recursion, whatever their length or
+    # nesting.
+    stack = [stm]
+    while stack:
+        stm = stack.pop()
+        if isinstance(stm, SEQ):
+            stack.extend(reversed(stm.stms))
+        elif isinstance(stm, MOVE) and isinstance(stm.dst, ESEQ):
+            stack.append(MOVE(stm.dst.exp, stm.src))
+            stack.append(stm.dst.stm)
+        elif isinstance(stm, MOVE) and isinstance(stm.dst, TEMP):
+            # The destination is not evaluated and must stay in place.
+            stm = MOVE(stm.dst, reorder_into([stm.src], result)[0])
+            if not stm.is_nop:
+                result.append(stm)
+        else:
+            stm = stm.build(reorder_into(stm.kids, result))
+            if not stm.is_nop:
+                result.append(stm)
+    return result
 
 
 def reorder_stm(stm):
     """Return a Stm with a reordering of stm."""
-    assert isinstance(stm, Stm)
-    if isinstance(stm, SEQ):
-        return flatten(SEQ([reorder_stm(s) for s in stm.stms]))
-    if isinstance(stm, MOVE) and isinstance(stm.dst, ESEQ):
-        return reorder_stm(SEQ([stm.dst.stm, MOVE(stm.dst.exp, stm.src)]))
-    s, exps = reorder(stm.kids)
-    return flatten(SEQ([s, stm.build(exps)]))
+    return SEQ(reorder_stm_into(stm, []))
 
 
 def canon(node):
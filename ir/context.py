@@ -0,0 +1,85 @@
+import threading
+import weakref
+from contextlib import contextmanager
+
+
+class Context:
+    """A compilation context holds the mutable state of a compilation,
+    such as the counters used to name temporaries and labels.
+
+    Temporaries and labels are numbered per function: the numbers given
+    in a function only depend on what has been done in this function, so
+    compiling the same program always gives the same output whatever has
+    been compiled before in the process or concurrently in other threads.
+
+    A context is made current for the running thread by using it in a
+    `with` statement, and the function being compiled is set with
+    `function(frame)`. Outside of any `with` statement, every thread has
+    a default context."""
+
+    _local = threading.local()
+
+    def __init__(self):
+        # Counters of temporaries and labels by frame, which are forgotten
+        # along with the frames so that a long-lived context does not keep
+        # every function compiled.
+        self.temps = weakref.WeakKeyDictionary()
+        self.labels = weakref.WeakKeyDictionary()
+        # Stack of the frames of the functions being compiled.
+        self.frames = []
+
+    def __enter__(self):
+        Context._stack().append(self)
+        return self
+
+    def __exit__(self, *exc):
+        Context._stack().pop()
+
+    @staticmethod
+    def _stack():
+        local = Context._local
+        if not hasattr(local, 'stack'):
+            local.stack = [Context()]
+        return local.stack
+
+    @staticmethod
+    def current():
+        """Return the current context of the running thread."""
+        return Context._stack()[-1]
+
+    @contextmanager
+    def function(self, frame):
+        """Make frame the frame of the function being compiled in the
+        body of the `with` statement."""
+        self.frames.append(frame)
+        try:
+            yield frame
+        finally:
+            self.frames.pop()
+
+    def next_temp(self):
+        """Return the number of a new temporary in the function being
+        compiled. Temporaries of different functions may get the same
+        number, so there must be one."""
+        assert self.frames, "temporary created outside of any function"
+        frame = self.frames[-1]
+        number = self.temps.get(frame, 0)
+        self.temps[frame] = number + 1
+        return number
+
+    def next_label(self, frame):
+        """Return the number of a new label in the function of frame."""
+        number = self.labels.get(frame, 0)
+        self.labels[frame] = number + 1
+        return number
+
+    def counts(self, frame):
+        """Return the numbers of temporaries and labels given so far in
+        the function of frame."""
+        return self.temps.get(frame, 0), self.labels.get(frame, 0)
+
+    def reserve(self, frame, temps, labels):
+        """Make sure that the numbers below temps and labels are never
+        given to new temporaries and labels in the function of frame."""
+        self.temps[frame] = max(self.temps.get(frame, 0), temps)
+        self.labels[frame] = max(self.labels.get(frame, 0), labels)
@@ -3,75 +3,98 @@ from utils.visitor import *
 
 
 class Dumper(Visitor):
+    """Write an IR tree to stream, one node per line. A node with only
+    simple arguments (such as a temporary or a label) is written on a
+    single line, otherwise its arguments follow on the next lines with
+    two more spaces of indentation. Every line ends with a newline."""
 
-    def __init__(self):
-        self.indent_level = 0
+    def __init__(self, stream):
+        self.write = stream.write
+        # Stack of indentations, the current one being on top.
+        self.indents = [""]
 
     def pr(self, cmd, *args):
         if len(args) == 1 and isinstance(args[0], list):
             args = args[0]
-        sargs = [arg.accept(self) if isinstance(arg, Node) else str(arg)
-                 for arg in args]
-        if any(" " in s for s in sargs):
-            return "\n  ".join([cmd] +
-                               [s for sa in sargs for s in sa.split("\n")])
-        return " ".join([cmd] + sargs)
+        indent = self.indents[-1]
+        if all(not isinstance(arg, Node) for arg in args):
+            sargs = [str(arg) for arg in args]
+            if not any(" " in s for s in sargs):
+                self.write(" ".join([indent + cmd] + sargs) + "\n")
+                return
+            # An argument which does not look simple is indented as if it
+            # was a node.
+            self.write(indent + cmd + "\n")
+            for s in sargs:
+                for line in s.split("\n"):
+                    self.write(indent + "  " + line + "\n")
+            return
+        self.write(indent + cmd + "\n")
+        self.indents.append(indent + "  ")
+        for arg in args:
+            if isinstance(arg, Node):
+                arg.accept(self)
+            else:
+                for line in str(arg).split("\n"):
+                    self.write(indent + "  " + line + "\n")
+        self.indents.pop()
 
     @visitor(None)
     def visit(self, node):
-        return self.pr(str(node))
+        self.pr(str(node))
 
     @visitor(LABEL)
     def visit(self, label):
-        return self.pr("label", label.label)
+        self.pr("label", label.label)
 
     @visitor(TEMP)
     def visit(self, temp):
-        return self.pr("temp", temp.temp)
+        self.pr("temp", temp.temp)
 
     @visitor(MOVE)
     def visit(self, move):
-        return self.pr("move", move.dst, move.src)
+        self.pr("move", move.dst, move.src)
 
     @visitor(CONST)
     def visit(self, const):
-        return self.pr("const", const.value)
+        self.pr("const", const.value)
 
     @visitor(MEM)
     def visit(self, mem):
-        return self.pr("mem", mem.exp)
+        self.pr("mem", mem.exp)
 
     @visitor(SEQ)
     def visit(self, seq):
-        return self.pr("seq", seq.stms) + "\n" + self.pr("seq end")
+        self.pr("seq", seq.stms)
+        self.pr("seq end")
 
     @visitor(ESEQ)
     def visit(self, eseq):
-        return self.pr("eseq", [eseq.stm, eseq.exp])
+        self.pr("eseq", [eseq.stm, eseq.exp])
 
     @visitor(JUMP)
     def visit(self, jump):
-        return self.pr("jump", jump.target)
+        self.pr("jump", jump.target)
 
     @visitor(CJUMP)
     def visit(self, cj):
-        return self.pr("cjump (%s)" % cj.op,
-                       [cj.left, cj.right, cj.ifTrue, cj.ifFalse])
+        self.pr("cjump (%s)" % cj.op,
+                [cj.left, cj.right, cj.ifTrue, cj.ifFalse])
 
     @visitor(BINOP)
     def visit(self, binop):
-        return self.pr("binop (%s)" % binop.op,
-                       [binop.left, binop.right])
+        self.pr("binop (%s)" % binop.op,
+                [binop.left, binop.right])
 
     @visitor(SXP)
     def visit(self, exp):
-        return self.pr("sxp", exp.exp)
+        self.pr("sxp", exp.exp)
 
     @visitor(NAME)
     def visit(self, name):
-        return self.pr("name", name.label)
+        self.pr("name", name.label)
 
     @visitor(CALL)
     def visit(self, call):
-        return self.pr("call", [call.func] + call.args) + "\n" + \
-            self.pr("call end")
+        self.pr("call", [call.func] + call.args)
+        self.pr("call end")
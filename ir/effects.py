@@ -0,0 +1,134 @@
+from ir.nodes import *
+
+
+def location(address):
+    """Return the (base temporary, offset) pair designated by an address
+    of the form `base`, `base + offset` or `base - offset`, such as a frame
+    slot, or None if the address cannot be analyzed."""
+    if isinstance(address, TEMP):
+        return (address.temp, 0)
+    if isinstance(address, BINOP) and address.op in ('+', '-'):
+        left, right = address.left, address.right
+        if isinstance(left, TEMP) and isinstance(right, CONST):
+            return (left.temp,
+                    right.value if address.op == '+' else -right.value)
+        if isinstance(left, CONST) and isinstance(right, TEMP) and \
+           address.op == '+':
+            return (right.temp, left.value)
+    return None
+
+
+class Effects:
+    """Effects of the evaluation of IR nodes.
+
+    `reads` and `writes` are the sets of temporaries read and written.
+    `loads` and `stores` map a base temporary to the set of offsets from
+    it which are read from and written to in memory (see `location`), and
+    `loads_any` and `stores_any` are True if an address which cannot be
+    analyzed is read from or written to. Two locations with the same base
+    only alias when their offsets are equal, since memory is accessed by
+    whole words; locations with different bases may always alias.
+
+    `calls` is True if a function is called. A call reads and writes any
+    memory location, but is not considered to change the temporaries of
+    the caller. `traps` is True if the evaluation may fail (a division by
+    something else than a non-zero constant), and `jumps` if it contains
+    jumps or labels, which may for example loop forever. Calls must stay
+    ordered with respect to calls, traps and jumps, and traps with
+    respect to jumps."""
+
+    __slots__ = ('reads', 'writes', 'loads', 'stores', 'loads_any',
+                 'stores_any', 'calls', 'traps', 'jumps')
+
+    def __init__(self):
+        self.reads = set()
+        self.writes = set()
+        self.loads = {}
+        self.stores = {}
+        self.loads_any = False
+        self.stores_any = False
+        self.calls = False
+        self.traps = False
+        self.jumps = False
+
+    def add(self, node):
+        """Add the effects of node to the current ones and return self."""
+        nodes = [node]
+        while nodes:
+            node = nodes.pop()
+            cls = type(node)
+            if cls is TEMP:
+                self.reads.add(node.temp)
+                continue
+            if cls is CONST or cls is NAME:
+                continue
+            if cls is MEM:
+                self.access(self.loads, node.exp, False)
+            elif cls is MOVE:
+                if isinstance(node.dst, TEMP):
+                    self.writes.add(node.dst.temp)
+                    nodes.append(node.src)
+                    continue
+                self.access(self.stores, node.dst.exp, True)
+            elif cls is BINOP:
+                if node.op == '/' and not (isinstance(node.right, CONST) and
+                                           node.right.value != 0):
+                    self.traps = True
+            elif cls is CALL:
+                self.calls = self.loads_any = self.stores_any = True
+            elif cls is SEQ:
+                nodes.extend(node.stms)
+                continue
+            elif cls is ESEQ:
+                nodes.append(node.stm)
+            elif cls is JUMP or cls is CJUMP or cls is LABEL:
+                self.jumps = True
+            nodes.extend(node.kids)
+        return self
+
+    def access(self, accesses, address, store):
+        """Record a memory access at address in accesses."""
+        loc = location(address)
+        if loc is None:
+            if store:
+                self.stores_any = True
+            else:
+                self.loads_any = True
+        else:
+            accesses.setdefault(loc[0], set()).add(loc[1])
+
+    def ordered(self):
+        return self.calls or self.traps or self.jumps
+
+    def commutes_with(self, other):
+        """Check if the evaluations having the current effects and the
+        other effects can be swapped without changing their results."""
+        if (self.writes and (not self.writes.isdisjoint(other.reads) or
+                             not self.writes.isdisjoint(other.writes))) or \
+           (other.writes and not other.writes.isdisjoint(self.reads)):
+            return False
+        if self.calls and other.ordered() or \
+           other.calls and self.ordered() or \
+           self.traps and other.jumps or other.traps and self.jumps:
+            return False
+        return not (conflict(self.stores, self.stores_any,
+                             other.loads, other.loads_any) or
+                    conflict(self.stores, self.stores_any,
+                             other.stores, other.stores_any) or
+                    conflict(other.stores, other.stores_any,
+                             self.loads, self.loads_any))
+
+
+def conflict(stores, stores_any, accesses, accesses_any):
+    """Check if memory accesses may alias the stored locations."""
+    if not (stores or stores_any) or not (accesses or accesses_any):
+        return False
+    if stores_any or accesses_any or len(stores) > 1 or len(accesses) > 1:
+        return True
+    ((base, offsets),) = accesses.items()
+    return base not in stores or not offsets.isdisjoint(stores[base])
+
+
+def effects(node):
+    """Return the effects of the evaluation of node."""
+    return Effects().add(node)
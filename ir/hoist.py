@@ -6,25 +6,71 @@ class HoistCalls(Visitor):
 
     # Transform every expression representing a CALL node returning a value
     # into an ESEQ returning a simple temporary (after copying the result
-    # of the call to this temporary).
+    # of the call to this temporary). Calls whose result is directly moved
+    # into a temporary or discarded are left in place.
+    #
+    # Subtrees without calls are returned unchanged, and a node is only
+    # rebuilt when one of its kids has changed. Side effect free
+    # expressions and nop statements cannot contain calls.
+
+    def hoist_kids(self, node):
+        """Return node with calls hoisted from its kids."""
+        kids = node.kids
+        new_kids = None
+        for (i, kid) in enumerate(kids):
+            new_kid = kid.accept(self)
+            if new_kid is not kid:
+                if new_kids is None:
+                    new_kids = list(kids)
+                new_kids[i] = new_kid
+        return node if new_kids is None else node.build(new_kids)
 
     @visitor(None)
     def visit(self, node):
-        return node.build([child.accept(self) for child in node.kids])
+        if isinstance(node, Sxp) and node.is_side_effect_free or \
+           isinstance(node, Stm) and node.is_nop:
+            return node
+        return self.hoist_kids(node)
 
     @visitor(CALL)
     def visit(self, call):
-        hoisted = call.build(self.visit_all(call.kids))
+        hoisted = self.hoist_kids(call)
         if hoisted.return_result:
             temp = TEMP(Temp.create("call"))
             return ESEQ(MOVE(temp, hoisted),
                         temp)
         return hoisted
 
+    @visitor(MOVE)
+    def visit(self, move):
+        if isinstance(move.dst, TEMP) and isinstance(move.src, CALL):
+            # The result of the call already goes into a temporary.
+            src = self.hoist_kids(move.src)
+            return move if src is move.src else MOVE(move.dst, src)
+        return self.hoist_kids(move)
+
+    @visitor(SXP)
+    def visit(self, sxp):
+        if isinstance(sxp.exp, CALL):
+            # The result of the call, if any, is not used.
+            exp = self.hoist_kids(sxp.exp)
+            return sxp if exp is sxp.exp else SXP(exp)
+        return self.hoist_kids(sxp)
+
     @visitor(SEQ)
     def visit(self, seq):
-        return SEQ([stm.accept(self) for stm in seq.stms])
+        stms = None
+        for (i, stm) in enumerate(seq.stms):
+            new_stm = stm.accept(self)
+            if new_stm is not stm:
+                if stms is None:
+                    stms = list(seq.stms)
+                stms[i] = new_stm
+        return seq if stms is None else SEQ(stms)
 
     @visitor(ESEQ)
     def visit(self, eseq):
-        return ESEQ(eseq.stm.accept(self), eseq.exp.accept(self))
+        stm, exp = eseq.stm.accept(self), eseq.exp.accept(self)
+        if stm is eseq.stm and exp is eseq.exp:
+            return eseq
+        return ESEQ(stm, exp)
@@ -1,3 +1,9 @@
+import itertools
+import threading
+import weakref
+
+from ir.context import Context
+
 # List of logical binary operators and their inverses.
 # When adding a new logical operator, add it at the
 # beginning and add its inverse at the end, so that we
@@ -16,34 +22,81 @@ class Label:
     a `LABEL` node) or referenced (through a `NAME` node).
 
     It is possible to create a new Label instance by calling
-    `Label.create()`."""
-
-    def __init__(self, name):
+    `Label.create()`.
+
+    Labels are interned: `Label(name)` always returns the same label for
+    a given name and `label + subname` the same label for a given label
+    and subname while it is in use, so labels compare and hash by
+    identity. Its name is only built when it is first needed, for example
+    when the code is dumped or emitted.
+
+    Every label has an integer `id`. The local labels of a function are
+    numbered densely from 0 in the function, like virtual registers, so
+    that their ids can index arrays, while the named labels and the ones
+    built by `+`, which are shared by all the functions, get negative ids
+    which are unique in the process."""
+
+    __slots__ = ('id', '_name', '_parent', '_frame', '_number', '_derived',
+                 '__weakref__')
+
+    # Labels by name, shared by all the compilations as long as they are
+    # used. The labels built by `+` are likewise found from their parent
+    # label in `_derived`, by subname.
+    _named = weakref.WeakValueDictionary()
+    _ids = itertools.count(-1, -1)
+    _lock = threading.Lock()
+
+    def __new__(cls, name):
         assert isinstance(name, str), "label name must be a string"
-        self.name = name
-
-    _idx = 0
+        label = Label._named.get(name)
+        if label is None:
+            label = Label._named.setdefault(
+                name, Label._new(name, None, None, None))
+        return label
+
+    @staticmethod
+    def _new(name, parent, frame, number):
+        label = object.__new__(Label)
+        label.id = number if frame is not None else next(Label._ids)
+        label._name = name
+        label._parent = parent
+        label._frame = frame
+        label._number = number
+        label._derived = None
+        return label
 
     def create(frame):
-        """Return a new local label with a unique name suitable for
-        the given frame."""
-        try:
-            return Label(frame.label_name(str(Label._idx)))
-        finally:
-            Label._idx += 1
-
-    def __eq__(self, other):
-        return isinstance(other, Label) and self.name == other.name
-
-    def __hash__(self):
-        return hash(self.name)
+        """Return a new local label with a name suitable for the given
+        frame, numbered in the function of frame by the current
+        compilation context."""
+        return Label._new(None, None, frame,
+                          Context.current().next_label(frame))
+
+    @property
+    def name(self):
+        if self._name is None:
+            self._name = \
+                "%s$%s" % (self._parent.name, self._number) \
+                if self._parent is not None \
+                else self._frame.label_name(str(self._number))
+        return self._name
 
     def __repr__(self):
         return self.name
 
     def __add__(self, subname):
         assert isinstance(subname, str), "subname must be a string"
-        return Label("%s$%s" % (self.name, subname))
+        derived = self._derived
+        if derived is None:
+            with Label._lock:
+                if self._derived is None:
+                    self._derived = weakref.WeakValueDictionary()
+            derived = self._derived
+        label = derived.get(subname)
+        if label is None:
+            label = derived.setdefault(subname,
+                                       Label._new(None, self, None, subname))
+        return label
 
 
 class Temp:
@@ -52,42 +105,128 @@ class Temp:
 
     It is possible to create a new virtual register by calling
     `Temp.create(prefix)`. The `prefix` argument is an optional string
-    which may help determine where the register comes from in the output."""
+    which may help determine where the register comes from in the output.
 
-    def __init__(self, name):
-        assert isinstance(name, str), "register name must be a string"
-        self.name = name
+    Every temporary has an integer `id`. Physical registers, which are
+    named with `Temp(name)`, are interned and get ids below `reserved`,
+    while virtual registers are numbered densely from `reserved` on in
+    every function by the current compilation context, so that ids can
+    index arrays or bitsets. Temporaries compare and hash by identity,
+    and the name of a virtual register is only built when it is needed."""
 
-    _idx = 0
+    __slots__ = ('id', 'prefix')
+
+    # Number of ids reserved for physical registers.
+    reserved = 256
+
+    # Physical registers by name, shared by all the compilations.
+    _named = {}
+    _lock = threading.Lock()
+
+    def __new__(cls, name):
+        assert isinstance(name, str), "register name must be a string"
+        temp = Temp._named.get(name)
+        if temp is None:
+            with Temp._lock:
+                temp = Temp._named.get(name)
+                if temp is None:
+                    assert len(Temp._named) < Temp.reserved, \
+                        "too many physical registers"
+                    temp = object.__new__(Temp)
+                    temp.id = len(Temp._named)
+                    temp.prefix = name
+                    Temp._named[name] = temp
+        return temp
 
     def create(prefix=None):
         """Return a new temporary register with a unique name and
         an optional prefix."""
         assert prefix is None or isinstance(prefix, str), \
             "prefix for register name must be a string or None"
-        prefix = "t_%s_" % prefix if prefix else "t_"
-        try:
-            return Temp("%s%d" % (prefix or "", Temp._idx))
-        finally:
-            Temp._idx += 1
-
-    def __eq__(self, other):
-        return isinstance(other, Temp) and self.name == other.name
-
-    def __hash__(self):
-        return hash(self.name)
+        return Temp._new(Context.current().next_temp(), prefix)
+
+    @staticmethod
+    def _new(number, prefix):
+        temp = object.__new__(Temp)
+        temp.id = Temp.reserved + number
+        temp.prefix = prefix
+        return temp
+
+    def is_physical(self):
+        return self.id < Temp.reserved
+
+    @property
+    def name(self):
+        if self.id < Temp.reserved:
+            return self.prefix
+        number = self.id - Temp.reserved
+        return "t_%s_%d" % (self.prefix, number) if self.prefix \
+            else "t_%d" % number
 
     def __repr__(self):
         return self.name
 
 
-class Node:
-    """A node in the IR tree."""
+class Interned(type):
+    """Metaclass of the IR nodes, which are immutable and hash-consed:
+    creating a node with the same arguments as a living node of the same
+    class returns the existing node instead of a new one. Since the kids
+    of a node are themselves interned, two trees are structurally equal
+    if and only if they are the same object, and the IR is a DAG in which
+    identical subtrees are shared. The identity hash of a node is thus a
+    structural hash, which costs nothing to compute."""
+
+    def __init__(cls, name, bases, namespace):
+        super().__init__(name, bases, namespace)
+        # Map intern keys to weak references to the living nodes. This is
+        # what weakref.WeakValueDictionary does, without the overhead of its
+        # Python-level methods.
+        instances = {}
+
+        def forget(ref):
+            if instances.get(ref.key) is ref:
+                del instances[ref.key]
+
+        cls._instances = instances
+        cls._forget = forget
+
+    def __call__(cls, *args, **kwargs):
+        key = cls.intern_key(*args, **kwargs)
+        ref = cls._instances.get(key)
+        if ref is not None:
+            node = ref()
+            if node is not None:
+                return node
+        node = super().__call__(*args, **kwargs)
+        ref = weakref.KeyedRef(node, cls._forget, key)
+        # Another thread may have built the same node in the meantime.
+        other = cls._instances.setdefault(key, ref)
+        if other is not ref:
+            existing = other()
+            if existing is not None:
+                return existing
+            cls._instances[key] = ref
+        return node
+
+
+class Node(metaclass=Interned):
+    """A node in the IR tree.
+
+    Nodes must never be modified once built as they may be shared. The
+    `build` method of a node returns the node itself when given its own
+    kids."""
 
     def __init__(self):
         # Kids are sub-expressions
         self.kids = []
 
+    @classmethod
+    def intern_key(cls, *args):
+        """Return the key identifying the node built from args. Nodes are
+        interned, so they are identified by their id, which stays valid
+        as long as the node built from them is alive."""
+        raise AssertionError("intern_key must be implemented for %s" % cls)
+
     def accept(self, visitor):
         return visitor.visit(self)
 
@@ -120,9 +259,11 @@ class Stm(Node):
 
     def commutes_with(self, sxp):
         """Check if the current statement can be moved around the
-        given Sxp without changing the result of the Sxp evaluation."""
+        given Sxp without changing the result of the Sxp evaluation
+        (see ir.effects)."""
         assert isinstance(sxp, Sxp)
-        return self.is_nop or sxp.is_side_effect_free
+        from ir.effects import effects
+        return self.is_nop or effects(self).commutes_with(effects(sxp))
 
     def jumps(self):
         """Return a list of expressions that the current Stm
@@ -152,14 +293,21 @@ class BINOP(Sxp):
             left.is_side_effect_free and right.is_side_effect_free and \
             (op != '/' or (isinstance(right, CONST) and right.value != 0))
 
+    @classmethod
+    def intern_key(cls, op, left, right):
+        return (op, id(left), id(right))
+
     def build(self, kids):
+        if kids == self.kids:
+            return self
         return BINOP(self.op, kids[0], kids[1])
 
 
 class CALL(Sxp):
-    """Function call."""
+    """Function call. return_result is False when the result of the
+    call is not used."""
 
-    def __init__(self, func, args):
+    def __init__(self, func, args, return_result=True):
         super().__init__()
         assert isinstance(func, Sxp), "func must be a Sxp"
         assert isinstance(args, list), "args must be a list of Sxp"
@@ -168,13 +316,16 @@ class CALL(Sxp):
         self.func = func
         self.args = args
         self.kids = [func] + args
-        # The following variable can be set to False by the translator
-        self.return_result = True
+        self.return_result = return_result
+
+    @classmethod
+    def intern_key(cls, func, args, return_result=True):
+        return (id(func), tuple(map(id, args)), return_result)
 
     def build(self, kids):
-        call = CALL(kids[0], kids[1:])
-        call.return_result = self.return_result
-        return call
+        if kids == self.kids:
+            return self
+        return CALL(kids[0], kids[1:], self.return_result)
 
 
 class CJUMP(Stm):
@@ -194,7 +345,13 @@ class CJUMP(Stm):
         self.ifFalse = ifFalse
         self.kids = [left, right]
 
+    @classmethod
+    def intern_key(cls, op, left, right, ifTrue, ifFalse):
+        return (op, id(left), id(right), id(ifTrue), id(ifFalse))
+
     def build(self, kids):
+        if kids == self.kids:
+            return self
         return CJUMP(self.op, kids[0], kids[1],
                      self.ifTrue, self.ifFalse)
 
@@ -211,6 +368,10 @@ class CONST(Sxp):
         self.value = value
         self.is_side_effect_free = True
 
+    @classmethod
+    def intern_key(cls, value):
+        return value
+
     def build(self, kids):
         return self
 
@@ -227,6 +388,10 @@ class ESEQ(Sxp):
         self.is_side_effect_free = stm.is_nop and exp.is_side_effect_free
         self.kids = [exp]
 
+    @classmethod
+    def intern_key(cls, stm, exp):
+        return (id(stm), id(exp))
+
 
 class SXP(Stm):
     """Transform an expression into a statement."""
@@ -238,7 +403,13 @@ class SXP(Stm):
         self.is_nop = exp.is_side_effect_free
         self.kids = [exp]
 
+    @classmethod
+    def intern_key(cls, exp):
+        return id(exp)
+
     def build(self, kids):
+        if kids == self.kids:
+            return self
         return SXP(kids[0])
 
 
@@ -251,7 +422,13 @@ class JUMP(Stm):
         self.target = target
         self.kids = [target]
 
+    @classmethod
+    def intern_key(cls, target):
+        return id(target)
+
     def build(self, kids):
+        if kids == self.kids:
+            return self
         return JUMP(kids[0])
 
     def jumps(self):
@@ -266,6 +443,10 @@ class LABEL(Stm):
         assert isinstance(label, Label), "label must be a Label"
         self.label = label
 
+    @classmethod
+    def intern_key(cls, label):
+        return label
+
     def build(self, kids):
         return self
 
@@ -282,7 +463,13 @@ class MEM(Sxp):
         # because a memory access can trigger an action on a peripheral.
         self.is_side_effect_free = exp.is_side_effect_free
 
+    @classmethod
+    def intern_key(cls, exp):
+        return id(exp)
+
     def build(self, kids):
+        if kids == self.kids:
+            return self
         return MEM(kids[0])
 
 
@@ -299,7 +486,13 @@ class MOVE(Stm):
         self.src = src
         self.kids = [dst.exp if isinstance(dst, MEM) else dst, src]
 
+    @classmethod
+    def intern_key(cls, dst, src):
+        return (id(dst), id(src))
+
     def build(self, kids):
+        if kids == self.kids:
+            return self
         return MOVE(MEM(kids[0]) if isinstance(self.dst, MEM)
                     else kids[0],
                     kids[1])
@@ -314,6 +507,10 @@ class NAME(Sxp):
         self.label = label
         self.is_side_effect_free = True
 
+    @classmethod
+    def intern_key(cls, label):
+        return label
+
     def build(self, kids):
         return self
 
@@ -329,6 +526,10 @@ class SEQ(Stm):
         self.stms = stms
         self.is_nop = all(stm.is_nop for stm in stms)
 
+    @classmethod
+    def intern_key(cls, stms):
+        return tuple(map(id, stms))
+
 
 class TEMP(Sxp):
     """Temporary register (physical or virtual)."""
@@ -339,5 +540,9 @@ class TEMP(Sxp):
         self.temp = temp
         self.is_side_effect_free = True
 
+    @classmethod
+    def intern_key(cls, temp):
+        return temp
+
     def build(self, kids):
         return self
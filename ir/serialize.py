@@ -0,0 +1,416 @@
+#
+# Binary storage of the IR of a program, for example the canonical and
+# block-ordered IR produced by the middle end, so that the back end can
+# be run later or on another machine without translating the program
+# again.
+#
+# A file starts with MAGIC and the major and minor versions of Python as
+# two bytes, followed by one record per function. A record is a
+# little-endian 32 bits length followed by a marshalled tuple holding the
+# frame of the function and its IR:
+#
+#   - the frame class, as its tag in FRAMES, the index of the frame label
+#     in the label table, the frame offset, the returns_value flag and the
+#     parameter accesses, as (True, temp index) or (False, frame offset);
+#   - the numbers of temporaries and labels given in the function, so that
+#     the back end numbers the new ones as if the IR had not been stored;
+#   - the tables of the strings (operators), labels, temporaries and
+#     constants referenced by the nodes;
+#   - the nodes, as an array of 32 bits integers. Every node is an opcode
+#     followed by its operands, its kids being the indices of previously
+#     stored nodes, and the last node is the root. Since the IR is
+#     hash-consed, a shared subtree is only stored once.
+#
+# A label is stored as its name, as (parent index, subname) if it has been
+# built with `+`, or as its number if it is a local label of the function.
+# A temporary is stored as its name if it is a physical register, and as
+# (number, prefix) otherwise.
+#
+# Loading reads every record in one go and rebuilds its nodes in a single
+# pass over the integer array, so that a whole program is never held in
+# memory as bytes and functions can be used as they are loaded.
+#
+# The marshal format may change between Python versions, so a file is
+# only loaded by the version of Python which wrote it. Records which are
+# not shaped as above, or whose indices are out of their tables, are
+# rejected with a SerializeException. marshal itself is not meant to
+# read hostile data, though: files should only be loaded from trusted
+# places.
+#
+
+import marshal
+import sys
+from array import array
+from io import BytesIO
+
+from arm.frame import ArmFrame
+from frame.frame import InFrame, InRegister
+from ir.context import Context
+from ir.nodes import *
+from irvm.frame import IrvmFrame
+
+# Bump the last byte whenever the format changes.
+MAGIC = b"TIGERIR\3"
+
+# Version of Python, and thus of marshal, written after MAGIC.
+_VERSION = bytes(sys.version_info[:2])
+
+# Frame classes by tag. Files may come from anywhere, so only those
+# classes can be instantiated when loading.
+FRAMES = {"arm": ArmFrame, "irvm": IrvmFrame}
+_tags = dict((cls, tag) for (tag, cls) in FRAMES.items())
+
+(_CONST, _NAME, _TEMP, _BINOP, _MEM, _CALL, _ESEQ, _MOVE, _SXP, _JUMP,
+ _CJUMP, _SEQ, _LABEL) = range(13)
+
+# Kids of the nodes, stored before the node itself.
+_kids = {
+    CONST: lambda node: (),
+    NAME: lambda node: (),
+    TEMP: lambda node: (),
+    BINOP: lambda node: (node.left, node.right),
+    MEM: lambda node: (node.exp,),
+    CALL: lambda node: [node.func] + node.args,
+    ESEQ: lambda node: (node.stm, node.exp),
+    MOVE: lambda node: (node.dst, node.src),
+    SXP: lambda node: (node.exp,),
+    JUMP: lambda node: (node.target,),
+    CJUMP: lambda node: (node.left, node.right, node.ifTrue, node.ifFalse),
+    SEQ: lambda node: node.stms,
+    LABEL: lambda node: (),
+}
+
+
+class SerializeException(Exception):
+    pass
+
+
+def _words(code):
+    """Return the bytes of code, an array of integers, in little-endian
+    order."""
+    if sys.byteorder == 'big':
+        code = array('i', code)
+        code.byteswap()
+    return code.tobytes()
+
+
+class _Encoder:
+    """Build the record of a function."""
+
+    def __init__(self, frame, context):
+        self.frame = frame
+        self.temp_count, self.label_count = context.counts(frame)
+        self.strings, self.labels, self.temps, self.consts = [], [], [], []
+        # Indices in the tables above and in the stored nodes.
+        self.string_index, self.label_index, self.temp_index, \
+            self.const_index, self.node_index = {}, {}, {}, {}, {}
+        self.code = array('i')
+
+    def string(self, s):
+        index = self.string_index.get(s)
+        if index is None:
+            index = self.string_index[s] = len(self.strings)
+            self.strings.append(s)
+        return index
+
+    def label(self, label):
+        index = self.label_index.get(label)
+        if index is None:
+            if label._parent is not None:
+                entry = (self.label(label._parent), label._number)
+            elif label._frame is not None:
+                if label._frame is not self.frame:
+                    raise SerializeException(
+                        "label %s belongs to another function" % label)
+                entry = label._number
+                self.label_count = max(self.label_count, entry + 1)
+            else:
+                entry = label.name
+            index = self.label_index[label] = len(self.labels)
+            self.labels.append(entry)
+        return index
+
+    def temp(self, temp):
+        index = self.temp_index.get(temp)
+        if index is None:
+            if temp.is_physical():
+                entry = temp.name
+            else:
+                number = temp.id - Temp.reserved
+                entry = (number, temp.prefix)
+                self.temp_count = max(self.temp_count, number + 1)
+            index = self.temp_index[temp] = len(self.temps)
+            self.temps.append(entry)
+        return index
+
+    def const(self, value):
+        index = self.const_index.get(value)
+        if index is None:
+            index = self.const_index[value] = len(self.consts)
+            self.consts.append(value)
+        return index
+
+    def node(self, root):
+        """Store root and the nodes below it which have not been stored
+        yet, kids first."""
+        index = self.node_index
+        stack = [root]
+        while stack:
+            node = stack[-1]
+            if id(node) in index:
+                stack.pop()
+                continue
+            pending = [kid for kid in _kids[type(node)](node)
+                       if id(kid) not in index]
+            if pending:
+                stack.extend(reversed(pending))
+                continue
+            stack.pop()
+            index[id(node)] = len(index)
+            self.emit(node)
+
+    def emit(self, node):
+        code, index = self.code, self.node_index
+        if isinstance(node, CONST):
+            code.extend((_CONST, self.const(node.value)))
+        elif isinstance(node, NAME):
+            code.extend((_NAME, self.label(node.label)))
+        elif isinstance(node, TEMP):
+            code.extend((_TEMP, self.temp(node.temp)))
+        elif isinstance(node, BINOP):
+            code.extend((_BINOP, self.string(node.op),
+                         index[id(node.left)], index[id(node.right)]))
+        elif isinstance(node, MEM):
+            code.extend((_MEM, index[id(node.exp)]))
+        elif isinstance(node, CALL):
+            code.extend((_CALL, node.return_result, index[id(node.func)],
+                         len(node.args)))
+            code.extend(index[id(arg)] for arg in node.args)
+        elif isinstance(node, ESEQ):
+            code.extend((_ESEQ, index[id(node.stm)], index[id(node.exp)]))
+        elif isinstance(node, MOVE):
+            code.extend((_MOVE, index[id(node.dst)], index[id(node.src)]))
+        elif isinstance(node, SXP):
+            code.extend((_SXP, index[id(node.exp)]))
+        elif isinstance(node, JUMP):
+            code.extend((_JUMP, index[id(node.target)]))
+        elif isinstance(node, CJUMP):
+            code.extend((_CJUMP, self.string(node.op),
+                         index[id(node.left)], index[id(node.right)],
+                         index[id(node.ifTrue)], index[id(node.ifFalse)]))
+        elif isinstance(node, SEQ):
+            code.extend((_SEQ, len(node.stms)))
+            code.extend(index[id(stm)] for stm in node.stms)
+        else:
+            code.extend((_LABEL, self.label(node.label)))
+
+    def record(self, stm):
+        frame = self.frame
+        # The frame label comes first in the label table, so that the
+        # frame can be built before the local labels when loading.
+        label = self.label(frame.label)
+        params = tuple((True, self.temp(access.temp.temp))
+                       if isinstance(access, InRegister)
+                       else (False, access.offset)
+                       for access in frame.param_access)
+        self.node(stm)
+        tag = _tags.get(type(frame))
+        if tag is None:
+            raise SerializeException("cannot store a frame of class %s" %
+                                     type(frame).__name__)
+        return (tag, label,
+                frame.offset, frame.returns_value, params,
+                self.temp_count, self.label_count, tuple(self.strings),
+                tuple(self.labels), tuple(self.temps), tuple(self.consts),
+                _words(self.code))
+
+
+def dump(funcs, fd, context=None):
+    """Write the functions of funcs, a dictionary whose values are
+    (frame, stm) pairs, to the binary file fd. The numbering of the
+    functions is taken from context, or from the current context."""
+    context = context or Context.current()
+    fd.write(MAGIC + _VERSION)
+    for (frame, stm) in funcs.values():
+        data = marshal.dumps(_Encoder(frame, context).record(stm))
+        fd.write(len(data).to_bytes(4, 'little'))
+        fd.write(data)
+
+
+def dumps(funcs, context=None):
+    """Return the bytes written by `dump`."""
+    fd = BytesIO()
+    dump(funcs, fd, context)
+    return fd.getvalue()
+
+
+def _index(index, table):
+    """Check that index, read from a file, designates an entry of
+    table."""
+    if not (isinstance(index, int) and 0 <= index < len(table)):
+        raise SerializeException("corrupted IR file")
+    return index
+
+
+def _label(entry, labels, frame):
+    if isinstance(entry, str):
+        return Label(entry)
+    if isinstance(entry, tuple):
+        return labels[_index(entry[0], labels)] + entry[1]
+    if frame is None or not isinstance(entry, int) or entry < 0:
+        raise SerializeException("corrupted IR file")
+    return Label._new(None, None, frame, entry)
+
+
+def _temp(entry):
+    if isinstance(entry, str):
+        return Temp(entry)
+    (number, prefix) = entry
+    if not isinstance(number, int) or number < 0:
+        raise SerializeException("corrupted IR file")
+    return Temp._new(number, prefix)
+
+
+def _decode(record, context):
+    """Return the (frame, stm) pair stored in record. Malformed records
+    raise a SerializeException."""
+    try:
+        return _decode_record(record, context)
+    except (AssertionError, IndexError, KeyError, TypeError, ValueError):
+        raise SerializeException("corrupted IR file")
+
+
+def _decode_record(record, context):
+    if not (isinstance(record, tuple) and len(record) == 12):
+        raise SerializeException("corrupted IR file")
+    (tag, label, offset, returns_value, params, temp_count, label_count,
+     strings, label_entries, temp_entries, consts, words) = record
+    cls = FRAMES.get(tag) if isinstance(tag, str) else None
+    if cls is None:
+        raise SerializeException("unknown frame class %r" % (tag,))
+    _index(label, label_entries)
+    labels = []
+    for entry in label_entries[:label + 1]:
+        labels.append(_label(entry, labels, None))
+    frame = cls(labels[label])
+    for entry in label_entries[label + 1:]:
+        labels.append(_label(entry, labels, frame))
+    temps = [_temp(entry) for entry in temp_entries]
+    frame.offset = offset
+    frame.returns_value = returns_value
+    for (in_register, value) in params:
+        if in_register:
+            access = object.__new__(InRegister)
+            access.temp = TEMP(temps[_index(value, temps)])
+        else:
+            access = InFrame(value)
+        frame.param_access.append(access)
+    context.reserve(frame, temp_count, label_count)
+
+    code = array('i')
+    code.frombytes(words)
+    if sys.byteorder == 'big':
+        code.byteswap()
+    code = code.tolist()
+    # Every word is an opcode, a count or an index. Indices beyond their
+    # table or beyond the nodes built so far raise an IndexError.
+    if code and min(code) < 0:
+        raise SerializeException("corrupted IR file")
+    nodes = []
+    append = nodes.append
+    i, end = 0, len(code)
+    while i < end:
+        op = code[i]
+        if op == _TEMP:
+            append(TEMP(temps[code[i + 1]]))
+            i += 2
+        elif op == _CONST:
+            append(CONST(consts[code[i + 1]]))
+            i += 2
+        elif op == _MOVE:
+            append(MOVE(nodes[code[i + 1]], nodes[code[i + 2]]))
+            i += 3
+        elif op == _BINOP:
+            append(BINOP(strings[code[i + 1]], nodes[code[i + 2]],
+                         nodes[code[i + 3]]))
+            i += 4
+        elif op == _MEM:
+            append(MEM(nodes[code[i + 1]]))
+            i += 2
+        elif op == _NAME:
+            append(NAME(labels[code[i + 1]]))
+            i += 2
+        elif op == _LABEL:
+            append(LABEL(labels[code[i + 1]]))
+            i += 2
+        elif op == _CJUMP:
+            append(CJUMP(strings[code[i + 1]], nodes[code[i + 2]],
+                         nodes[code[i + 3]], nodes[code[i + 4]],
+                         nodes[code[i + 5]]))
+            i += 6
+        elif op == _JUMP:
+            append(JUMP(nodes[code[i + 1]]))
+            i += 2
+        elif op == _CALL:
+            n = code[i + 3]
+            append(CALL(nodes[code[i + 2]],
+                        [nodes[k] for k in code[i + 4:i + 4 + n]],
+                        bool(code[i + 1])))
+            i += 4 + n
+        elif op == _SXP:
+            append(SXP(nodes[code[i + 1]]))
+            i += 2
+        elif op == _ESEQ:
+            append(ESEQ(nodes[code[i + 1]], nodes[code[i + 2]]))
+            i += 3
+        elif op == _SEQ:
+            n = code[i + 1]
+            append(SEQ([nodes[k] for k in code[i + 2:i + 2 + n]]))
+            i += 2 + n
+        else:
+            raise SerializeException("unknown opcode %d" % op)
+    if i != end:
+        # The last node has more operands than the code holds.
+        raise SerializeException("corrupted IR file")
+    if not nodes or not isinstance(nodes[-1], Stm):
+        raise SerializeException("function %s has no code" % frame.label)
+    return (frame, nodes[-1])
+
+
+def iterload(fd, context=None):
+    """Yield the (frame, stm) pairs stored in the binary file fd as they
+    are read. The functions are numbered in context, or in the current
+    context, as they were when they were stored."""
+    context = context or Context.current()
+    if fd.read(len(MAGIC)) != MAGIC:
+        raise SerializeException("not a serialized IR file")
+    version = fd.read(len(_VERSION))
+    if version != _VERSION:
+        raise SerializeException(
+            "IR file written by Python %s, not %d.%d" %
+            (".".join(map(str, version)) or "?", *sys.version_info[:2]))
+    while True:
+        header = fd.read(4)
+        if not header:
+            return
+        size = int.from_bytes(header, 'little')
+        data = fd.read(size)
+        if len(header) != 4 or len(data) != size:
+            raise SerializeException("truncated IR file")
+        try:
+            record = marshal.loads(data)
+        except (EOFError, ValueError, TypeError):
+            raise SerializeException("corrupted IR file")
+        yield _decode(record, context)
+
+
+def load(fd, context=None):
+    """Return a dictionary mapping the label of every function stored in
+    the binary file fd to its (frame, stm) pair."""
+    return dict((frame.label, (frame, stm))
+                for (frame, stm) in iterload(fd, context))
+
+
+def loads(data, context=None):
+    """Return the functions stored in data by `dumps`."""
+    return load(BytesIO(data), context)
@@ -0,0 +1,50 @@
+import unittest
+
+from ir.blocks import reorder_blocks
+from ir.context import Context
+from ir.nodes import *
+from irvm.frame import IrvmFrame
+
+class TestBlocks(unittest.TestCase):
+
+    def layout(self, stms):
+        with Context():
+            return reorder_blocks(SEQ(stms), IrvmFrame(Label("f"))).stms
+
+    def test_traces(self):
+        a, b, c, end = [Label(name) for name in ("a", "b", "c", "end")]
+        t = TEMP(Temp("x"))
+        # The positive branch is the only one left: the condition must be
+        # inverted. Jumps are followed, and dropped before their target.
+        stms = self.layout([
+            LABEL(a), JUMP(NAME(c)),
+            LABEL(b), MOVE(t, CONST(1)), JUMP(NAME(end)),
+            LABEL(c), CJUMP('<', t, CONST(0), NAME(b), NAME(a)),
+            LABEL(end)])
+        self.assertEqual(stms, [
+            LABEL(a), LABEL(c), CJUMP('>=', t, CONST(0), NAME(a), NAME(b)),
+            LABEL(b), MOVE(t, CONST(1)), LABEL(end)])
+
+    def test_both_branches_visited(self):
+        a, b = Label("a"), Label("b")
+        t = TEMP(Temp("x"))
+        stms = self.layout([
+            LABEL(a), MOVE(t, CONST(1)),
+            LABEL(b), CJUMP('=', t, CONST(0), NAME(a), NAME(b))])
+        cjump, label, jump = stms[-3:]
+        self.assertEqual(stms[:3], [LABEL(a), MOVE(t, CONST(1)), LABEL(b)])
+        self.assertEqual(cjump.ifFalse, NAME(label.label))
+        self.assertEqual(jump, JUMP(NAME(b)))
+
+    def test_unreachable(self):
+        a, b, end = Label("a"), Label("b"), Label("end")
+        t = TEMP(Temp("x"))
+        # Blocks which cannot be reached are dropped, but not the last one.
+        stms = self.layout([
+            LABEL(a), JUMP(NAME(a)), MOVE(t, CONST(0)),
+            LABEL(b), MOVE(t, CONST(1)), JUMP(NAME(end)),
+            LABEL(end)])
+        self.assertEqual(stms, [LABEL(a), JUMP(NAME(a)), LABEL(end)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+from ir.canonical import canon
+from ir.context import Context
+from ir.nodes import *
+from irvm.frame import IrvmFrame
+
+class TestCanonical(unittest.TestCase):
+
+    def test_reorder(self):
+        with Context() as context, \
+             context.function(IrvmFrame(Label("f"))):
+            t, u, fp = Temp.create(), Temp.create(), TEMP(Temp("fp"))
+            f = NAME(Label("f"))
+            # The call does not change t, but must be evaluated before the
+            # third argument changes it.
+            s = canon(SXP(CALL(f, [TEMP(t), CALL(f, []),
+                                   ESEQ(MOVE(TEMP(t), CONST(1)), TEMP(u))])))
+            self.assertEqual(len(s.stms), 3)
+            save, move, call = s.stms
+            self.assertEqual(save.src, TEMP(t))
+            self.assertEqual(move, MOVE(TEMP(t), CONST(1)))
+            self.assertEqual(call.exp.args, [save.dst, CALL(f, []), TEMP(u)])
+
+    def test_frame_slots(self):
+        def slot(offset):
+            return MEM(BINOP('+', fp, CONST(offset)))
+        with Context() as context, \
+             context.function(IrvmFrame(Label("f"))):
+            fp = TEMP(Temp("fp"))
+            store = MOVE(slot(8), CONST(1))
+            s = canon(SXP(BINOP('+', slot(4), ESEQ(store, CONST(2)))))
+            self.assertEqual(s.stms, [store])
+            s = canon(SXP(BINOP('+', slot(8), ESEQ(store, CONST(2)))))
+            self.assertEqual(len(s.stms), 2)
+            self.assertEqual(s.stms[0].src, slot(8))
+            call = MOVE(TEMP(Temp.create()), CALL(NAME(Label("f")), []))
+            s = canon(SXP(BINOP('+', slot(4), ESEQ(call, CONST(2)))))
+            self.assertEqual(len(s.stms), 2)
+
+    def test_long_sequences(self):
+        with Context() as context, \
+             context.function(IrvmFrame(Label("f"))):
+            t = TEMP(Temp.create())
+            moves = [MOVE(t, CONST(i)) for i in range(20000)]
+            s = SEQ([])
+            for move in moves:
+                s = SEQ([s, SXP(CONST(0)), move])
+            self.assertEqual(canon(s).stms, moves)
+            self.assertEqual(canon(ESEQ(s, t)), ESEQ(SEQ(moves), t))
+
+if __name__ == '__main__':
+    unittest.main()
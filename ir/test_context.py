@@ -0,0 +1,86 @@
+import gc
+import glob
+import os
+import unittest
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from arm.frame import ArmFrame
+from arm.gen import Gen
+from ir.blocks import reorder_blocks
+from ir.canonical import canon
+from ir.context import Context
+from ir.hoist import HoistCalls
+from ir.nodes import *
+from ir.translate import Translator
+from parser.parser import parse
+from semantics.binder import Binder
+from typer.typer import Typer
+
+TESTS = os.path.join(os.path.dirname(os.path.dirname(__file__)), "tests")
+
+def compile(text):
+    """Compile text down to ARM assembly in a new context and return the
+    dump of the generated code."""
+    with Context() as context:
+        tree = parse(text)
+        tree.accept(Binder())
+        Typer().run(tree, False)
+        lines = []
+        H = HoistCalls()
+        for (frame, stm) in Translator(ArmFrame).run(tree).values():
+            with context.function(frame):
+                seq = reorder_blocks(canon(stm.accept(H)), frame)
+                lines.extend(i.dump(False) for i in seq.accept(Gen(frame)))
+        return "\n".join(lines)
+
+class TestContext(unittest.TestCase):
+
+    def test_numbering(self):
+        class Frame:
+            def label_name(self, suffix):
+                return "L" + suffix
+        f, g = Frame(), Frame()
+        with Context() as context:
+            with context.function(f):
+                self.assertEqual(Temp.create().name, "t_0")
+                self.assertEqual(Label.create(f).name, "L0")
+                with context.function(g):
+                    self.assertEqual(Temp.create("x").name, "t_x_0")
+                self.assertEqual(Temp.create().name, "t_1")
+                self.assertEqual(Label.create(f).name, "L1")
+        self.assertIsNot(Context.current(), context)
+
+    def test_threads(self):
+        texts = []
+        for filename in sorted(glob.glob(os.path.join(TESTS, "*.tiger"))):
+            with open(filename) as fd:
+                texts.append(fd.read())
+        expected = [compile(text) for text in texts]
+        # Compiling the same programs again, in any order or concurrently,
+        # gives the same output.
+        self.assertEqual([compile(text) for text in texts], expected)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            self.assertEqual(list(executor.map(compile, texts * 4)),
+                             expected * 4)
+
+    def test_collection(self):
+        # Nothing is kept once the functions compiled are not used any
+        # longer, even in a long-lived context.
+        context = Context.current()
+        with context:
+            tree = parse("let function f(): int = 1 in f() end")
+            tree.accept(Binder())
+            Typer().run(tree, False)
+            funcs = Translator(ArmFrame).run(tree)
+            frames = [weakref.ref(frame) for (frame, _) in funcs.values()]
+            labels = [weakref.ref(frame().label + "x") for frame in frames]
+            labels.append(weakref.ref(Label("test_collection")))
+        del tree, funcs
+        gc.collect()
+        self.assertEqual([frame() for frame in frames], [None, None])
+        self.assertEqual([label() for label in labels], [None] * 3)
+        self.assertNotIn("test_collection", Label._named)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+import unittest
+
+from ir.context import Context
+from ir.hoist import HoistCalls
+from ir.nodes import *
+from irvm.frame import IrvmFrame
+
+class TestHoist(unittest.TestCase):
+
+    def test_hoist(self):
+        with Context() as context, \
+             context.function(IrvmFrame(Label("f"))):
+            t, f = TEMP(Temp.create()), NAME(Label("f"))
+            tree = SEQ([MOVE(t, BINOP('/', t, t)), MOVE(t, CALL(f, [t])),
+                        SXP(CALL(f, []))])
+            # Nothing to hoist: the tree is returned as is.
+            self.assertIs(tree.accept(HoistCalls()), tree)
+            tree = MOVE(t, BINOP('+', t, CALL(f, [CALL(f, [])])))
+            hoisted = tree.accept(HoistCalls())
+            outer = hoisted.src.right
+            self.assertIsInstance(outer, ESEQ)
+            self.assertEqual(outer.stm.src.func, f)
+            inner = outer.stm.src.args[0]
+            self.assertIsInstance(inner, ESEQ)
+            self.assertEqual(inner.stm.src, CALL(f, []))
+
+if __name__ == '__main__':
+    unittest.main()
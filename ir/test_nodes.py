@@ -0,0 +1,77 @@
+import gc
+import unittest
+
+from ir.context import Context
+from ir.nodes import *
+
+class TestNodes(unittest.TestCase):
+
+    def test_interning(self):
+        t = Temp("t")
+        self.assertIs(CONST(3), CONST(3))
+        self.assertIs(TEMP(t), TEMP(Temp("t")))
+        self.assertIs(NAME(Label("l")), NAME(Label("l")))
+        tree = BINOP('+', MEM(TEMP(t)), CONST(1))
+        self.assertIs(tree, BINOP('+', MEM(TEMP(t)), CONST(1)))
+        self.assertIsNot(tree, BINOP('-', MEM(TEMP(t)), CONST(1)))
+        self.assertIsNot(tree, BINOP('+', MEM(TEMP(t)), CONST(2)))
+        self.assertIs(SEQ([SXP(tree), LABEL(Label("l"))]),
+                      SEQ([SXP(tree), LABEL(Label("l"))]))
+        call = CALL(NAME(Label("f")), [tree])
+        self.assertTrue(call.return_result)
+        self.assertIs(call, CALL(NAME(Label("f")), [tree], True))
+        self.assertIsNot(call, CALL(NAME(Label("f")), [tree], False))
+
+    def test_temps(self):
+        self.assertIs(Temp("r0"), Temp("r0"))
+        self.assertTrue(Temp("r0").is_physical())
+        self.assertLess(Temp("r0").id, Temp.reserved)
+        class Frame:
+            pass
+        with Context() as context, context.function(Frame()):
+            t1, t2 = Temp.create(), Temp.create("call")
+        self.assertRaises(AssertionError, Temp.create)
+        self.assertFalse(t1.is_physical())
+        self.assertEqual(t2.id, t1.id + 1)
+        self.assertEqual(t1.name, "t_%d" % (t1.id - Temp.reserved))
+        self.assertEqual(t2.name, "t_call_%d" % (t2.id - Temp.reserved))
+        self.assertNotEqual(t1, t2)
+
+    def test_labels(self):
+        class Frame:
+            def label_name(self, suffix):
+                return ".L" + suffix
+        main = Label("main")
+        self.assertIs(main, Label("main"))
+        self.assertIs(main + "f", main + "f")
+        self.assertEqual((main + "f" + "$end").name, "main$f$$end")
+        frame = Frame()
+        l1, l2 = Label.create(frame), Label.create(frame)
+        self.assertNotEqual(l1, l2)
+        self.assertEqual(l2.name, ".L%d" % (int(l1.name[2:]) + 1))
+        other = Label.create(Frame())
+        self.assertNotEqual(other, l1)
+        # Local labels are numbered in their function.
+        self.assertEqual((l1.id, l2.id, other.id), (0, 1, 0))
+        self.assertLess(main.id, 0)
+        self.assertLess((main + "f").id, 0)
+        self.assertNotEqual(main.id, (main + "f").id)
+
+    def test_build(self):
+        tree = MOVE(MEM(TEMP(Temp("fp"))), BINOP('*', CONST(2), CONST(3)))
+        self.assertIs(tree.build(list(tree.kids)), tree)
+        other = tree.build([TEMP(Temp("sp")), tree.src])
+        self.assertIs(other.dst, MEM(TEMP(Temp("sp"))))
+        self.assertIs(other.src, tree.src)
+
+    def test_collection(self):
+        tree = BINOP('+', CONST(123456), CONST(654321))
+        del tree
+        gc.collect()
+        alive = [ref() for ref in BINOP._instances.values()]
+        self.assertFalse(any(isinstance(node.left, CONST) and
+                             node.left.value == 123456
+                             for node in alive if node is not None))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import io
+import marshal
+import unittest
+from array import array
+
+from frame.frame import InFrame, InRegister
+from ir.blocks import reorder_blocks
+from ir.canonical import canon
+from ir.context import Context
+from ir.dumper import Dumper
+from ir.hoist import HoistCalls
+from ir.nodes import *
+from ir.serialize import MAGIC, SerializeException, _MEM, dumps, loads
+from ir.translate import Translator
+from irvm.frame import IrvmFrame
+from parser.parser import parse
+from semantics.binder import Binder
+from typer.typer import Typer
+
+PROGRAM = """
+let function f2(x: int): int = if x > 10 then x else f2(x * 2)
+    function f(a: int, b: int): int =
+      let function g(): int = b in (b := a + 1; f2(g())) end
+in f(1, 2) end"""
+
+def dump(funcs):
+    out = io.StringIO()
+    for (frame, stm) in funcs.values():
+        stm.accept(Dumper(out))
+    return out.getvalue()
+
+class TestSerialize(unittest.TestCase):
+
+    def compile(self, context):
+        tree = parse(PROGRAM)
+        tree.accept(Binder())
+        Typer().run(tree, False)
+        funcs = Translator(IrvmFrame).run(tree)
+        H = HoistCalls()
+        for (f, (frame, stm)) in funcs.items():
+            with context.function(frame):
+                funcs[f] = (frame,
+                            reorder_blocks(canon(stm.accept(H)), frame))
+        return funcs
+
+    def test_round_trip(self):
+        with Context() as context:
+            funcs = self.compile(context)
+            data = dumps(funcs)
+            text = dump(funcs)
+            counts = [context.counts(frame) for (frame, _) in funcs.values()]
+        with Context() as context:
+            loaded = loads(data)
+            self.assertEqual(dump(loaded), text)
+            self.assertEqual([context.counts(frame)
+                              for (frame, _) in loaded.values()], counts)
+        for ((frame, _), (other, _)) in zip(funcs.values(), loaded.values()):
+            self.assertIs(other.label, frame.label)
+            self.assertEqual(other.offset, frame.offset)
+            self.assertEqual(other.returns_value, frame.returns_value)
+            self.assertEqual(
+                [(type(a), getattr(a, 'offset', None)) for a in
+                 other.param_access],
+                [(type(a), getattr(a, 'offset', None)) for a in
+                 frame.param_access])
+        # The parameter "b" escapes.
+        f = loaded[Label("main") + "f"][0]
+        self.assertIsInstance(f.param_access[0], InRegister)
+        self.assertIsInstance(f.param_access[1], InFrame)
+
+    def test_shared_nodes(self):
+        with Context() as context:
+            frame = IrvmFrame(Label("g"))
+            with context.function(frame):
+                t = TEMP(Temp.create("x"))
+                label = Label.create(frame)
+                add = BINOP('+', t, CONST(1 << 40))
+                stm = SEQ([LABEL(label), MOVE(t, add), MOVE(MEM(add), add),
+                           JUMP(NAME(label))])
+            data = dumps({None: (frame, stm)})
+        with Context() as context:
+            ((other, seq),) = loads(data).values()
+            label, move, store, jump = seq.stms
+            self.assertIs(move.src, store.src)
+            self.assertIs(store.dst.exp, move.src)
+            self.assertEqual(move.src.right.value, 1 << 40)
+            self.assertIs(label.label._frame, other)
+            self.assertIs(jump.target.label, label.label)
+            # New temporaries and labels do not collide with loaded ones.
+            with context.function(other):
+                self.assertEqual(Temp.create("x").name, "t_x_1")
+                self.assertEqual(Label.create(other).name, "Lg.1")
+
+    def test_errors(self):
+        with self.assertRaises(SerializeException):
+            loads(b"not an IR file")
+        with Context() as context:
+            data = dumps(self.compile(context))
+        with self.assertRaises(SerializeException):
+            loads(data[:-1])
+        # Files written by another version of Python are rejected.
+        header = len(MAGIC) + 2
+        with self.assertRaises(SerializeException):
+            loads(MAGIC + b"\2\7" + data[header:])
+        record = marshal.loads(data[header + 4:])
+
+        def load_record(record):
+            record = marshal.dumps(record)
+            return loads(data[:header] + len(record).to_bytes(4, 'little') +
+                         record)
+
+        # Only the known frame classes are instantiated.
+        with self.assertRaises(SerializeException):
+            load_record(("os.system",) + record[1:])
+        # Malformed records and out of range indices are rejected.
+        code = array('i')
+        code.frombytes(record[-1])
+        for bad in [record[:-1], record[:8] + ((-1,),) + record[9:],
+                    record[:-1] + (code[:-1].tobytes(),),
+                    record[:-1] + ((code[:-1] + array('i', [-1])).tobytes(),),
+                    record[:-1] + (array('i', [_MEM, 0]).tobytes(),)]:
+            with self.assertRaises(SerializeException):
+                load_record(bad)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 from ast.nodes import *
 from frame.frame import *
+from ir.context import Context
 from ir.nodes import *
 from utils.visitor import *
 
@@ -278,21 +279,24 @@ class Translator(Visitor):
                 else Label(decl.name)
         self.labels[decl] = label
         frame = self.Frame(label)
-        self.frame_stack.append(frame)
-        # For every argument to this function, allocate an access for
-        # this argument into the function frame.
-        for arg in decl.args:
-            self.frame_parameters[arg] = frame.alloc_parameter(arg.escapes)
-        # Analyze the expression for this function and get its Shell.
-        body = decl.exp.accept(self)
-        # Turn the body into a statement, after putting its result into
-        # a register if it returns a value.
-        stm = body.unNx() \
-            if decl.exp.type is None or decl.exp.type.typename == 'void' \
-            else frame.wrap_result(body.unEx())
-        # Register the current function into the list of functions and
-        # pop the current frame from the frame stack.
-        self.functions[decl] = (frame, frame.decorate(stm))
+        # Temporaries and labels are numbered per function.
+        with Context.current().function(frame):
+            self.frame_stack.append(frame)
+            # For every argument to this function, allocate an access for
+            # this argument into the function frame.
+            for arg in decl.args:
+                self.frame_parameters[arg] = \
+                    frame.alloc_parameter(arg.escapes)
+            # Analyze the expression for this function and get its Shell.
+            body = decl.exp.accept(self)
+            # Turn the body into a statement, after putting its result into
+            # a register if it returns a value.
+            stm = body.unNx() if decl.exp.type is None or \
+                decl.exp.type.typename == 'void' \
+                else frame.wrap_result(body.unEx())
+            # Register the current function into the list of functions and
+            # pop the current frame from the frame stack.
+            self.functions[decl] = (frame, frame.decorate(stm))
         del self.frame_stack[-1]
         # Nothing has to be built dynamically when a function declaration
         # is encountered.
@@ -391,7 +395,7 @@ class Translator(Visitor):
         # do not need to do that for an intrinsics function.
         args = [param.accept(self).unEx() for param in funcall.params]
         if isinstance(funcall.identifier.decl.exp, Intrinsics):
-            call = CALL(NAME(Label(funcall.identifier.name)), args)
+            func = NAME(Label(funcall.identifier.name))
         else:
             name = NAME(self.labels[funcall.identifier.decl])
             # We want to give the function the static link of its enclosing
@@ -404,12 +408,11 @@ class Translator(Visitor):
             static_link = TEMP(self.current_frame().fp)
             for i in range(call_depth):
                 static_link = MEM(static_link)
-            call = CALL(name, [static_link] + args)
+            func, args = name, [static_link] + args
         type = funcall.identifier.decl.type
         if type is None or type.typename == 'void':
-            call.return_result = False
-            return Nx(SXP(call))
-        return Ex(call)
+            return Nx(SXP(CALL(func, args, False)))
+        return Ex(CALL(func, args))
 
     @visitor(SeqExp)
     def visit(self, seq):
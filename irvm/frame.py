@@ -33,7 +33,8 @@ class IrvmFrame(Frame):
         return MOVE(TEMP(self.rv), sxp)
 
     def label_name(self, suffix):
-        return "L%s" % suffix
+        # Labels are numbered per function.
+        return "L%s.%s" % (self.label.name, suffix)
 
     def allocate_frame_size(self):
         """In IRVM, we know the frame size at this stage already since
@@ -0,0 +1,274 @@
+#
+# Interpreter for the canonical, block-ordered IR targeting the IRVM frame.
+#
+# Every function is decoded once into a flat array of instructions. Labels
+# are resolved to indices into this array, virtual temporaries are mapped
+# to indices into a per-activation register list, and the registers shared
+# between functions (fp, sp, rv and the parameter registers) live in a
+# global register list. Expressions are turned into Python closures taking
+# the local register list as their only argument.
+#
+
+import operator
+import sys
+import time
+
+from ir.nodes import *
+from irvm.frame import IrvmFrame
+
+
+class IrvmException(Exception):
+    """Exception encountered while decoding or running IRVM code."""
+    pass
+
+
+# Opcodes of decoded instructions.
+MOVE_LOCAL, MOVE_GLOBAL, STORE, EVAL, JUMP_TO, CJUMP_TO, CALL_TO, RETURN = \
+    range(8)
+
+comparisons = {'<': operator.lt, '>': operator.gt, '=': operator.eq,
+               '<>': operator.ne, '<=': operator.le, '>=': operator.ge}
+
+
+def divide(left, right):
+    """Integer division truncating towards zero."""
+    q = left // right
+    if q < 0 and q * right != left:
+        q += 1
+    return q
+
+arithmetic = {'+': operator.add, '-': operator.sub, '*': operator.mul,
+              '/': divide}
+
+# Registers shared by all the functions.
+global_registers = [IrvmFrame.fp, IrvmFrame.sp, IrvmFrame.rv] + \
+                   IrvmFrame.param_regs
+FP, SP, RV, I0 = 0, 1, 2, 3
+
+
+class Function:
+    """A decoded function along with its execution statistics."""
+
+    def __init__(self, name):
+        self.name = name
+        self.code = []
+        self.ntemps = 0
+        self.returns_value = False
+        self.calls = 0
+        self.instructions = 0
+        # Jumps executed, and conditional jumps not falling through to
+        # the next instruction.
+        self.jumps = 0
+        self.time = 0.0
+
+
+class Interpreter:
+    """Run the functions returned by the translator once they have been
+    canonicalized and their blocks reordered.
+
+    Memory is a list of words indexed by address divided by the word
+    size. The stack starts at the top of this memory and grows towards
+    lower addresses. Tiger calls do not recurse in Python: the interpreter
+    keeps its own stack of activations."""
+
+    def __init__(self, funcs, stack_size=1 << 20, output=None):
+        self.output = output if output is not None else sys.stdout
+        self.globals = [0] * len(global_registers)
+        self.global_index = dict((t, i) for (i, t) in
+                                 enumerate(global_registers))
+        self.memory = [0] * stack_size
+        self.stack_top = stack_size * IrvmFrame.word_size
+        # Decode the functions in two steps so that calls can be resolved
+        # to Function objects regardless of the declaration order.
+        self.functions = dict((frame.label, Function(frame.label.name))
+                              for (frame, _) in funcs.values())
+        for (frame, seq) in funcs.values():
+            self.functions[frame.label].returns_value = frame.returns_value
+            self.decode(self.functions[frame.label], seq)
+
+    def decode(self, function, seq):
+        """Decode a canonical SEQ into function.code."""
+        assert isinstance(seq, SEQ), "function body must be a SEQ"
+        local_index = {}
+        # Resolve labels first. A label designates the index of the
+        # instruction following it.
+        labels = {}
+        pc = 0
+        for stm in seq.stms:
+            if isinstance(stm, LABEL):
+                labels[stm.label] = pc
+            else:
+                pc += 1
+
+        def target(sxp):
+            if not isinstance(sxp, NAME) or sxp.label not in labels:
+                raise IrvmException("invalid jump target in %s" %
+                                    function.name)
+            return labels[sxp.label]
+
+        def temp(t):
+            """Return a pair (is_global, index) for a temporary."""
+            if t in self.global_index:
+                return True, self.global_index[t]
+            if t not in local_index:
+                local_index[t] = len(local_index)
+            return False, local_index[t]
+
+        def sxp(e):
+            return self.compile(e, temp)
+
+        def call(c, dst):
+            if not isinstance(c.func, NAME):
+                raise IrvmException("indirect calls are not supported")
+            args = [sxp(a) for a in c.args]
+            callee = self.functions.get(c.func.label, c.func.label.name)
+            return (CALL_TO, callee, args, dst)
+
+        code = function.code
+        for stm in seq.stms:
+            if isinstance(stm, LABEL):
+                continue
+            if isinstance(stm, MOVE) and isinstance(stm.dst, TEMP):
+                is_global, idx = temp(stm.dst.temp)
+                if isinstance(stm.src, CALL):
+                    code.append(call(stm.src, (is_global, idx)))
+                else:
+                    code.append((MOVE_GLOBAL if is_global else MOVE_LOCAL,
+                                 idx, sxp(stm.src)))
+            elif isinstance(stm, MOVE):
+                code.append((STORE, sxp(stm.dst.exp), sxp(stm.src)))
+            elif isinstance(stm, SXP) and isinstance(stm.exp, CALL):
+                code.append(call(stm.exp, None))
+            elif isinstance(stm, SXP):
+                code.append((EVAL, sxp(stm.exp)))
+            elif isinstance(stm, JUMP):
+                code.append((JUMP_TO, target(stm.target)))
+            elif isinstance(stm, CJUMP):
+                code.append((CJUMP_TO,
+                             self.compile_condition(stm, temp),
+                             target(stm.ifTrue), target(stm.ifFalse)))
+            else:
+                raise IrvmException("non canonical statement %s in %s" %
+                                    (stm, function.name))
+        # Falling off the end of the function, or jumping to a label at the
+        # end of it, returns to the caller.
+        code.append((RETURN,))
+        function.ntemps = len(local_index)
+
+    def compile_condition(self, cjump, temp):
+        """Return a closure evaluating the condition of a CJUMP."""
+        cmp = comparisons[cjump.op]
+        left = self.compile(cjump.left, temp)
+        right = self.compile(cjump.right, temp)
+        return lambda r: cmp(left(r), right(r))
+
+    def compile(self, e, temp):
+        """Return a closure computing the value of a canonical expression
+        from the local register list."""
+        if isinstance(e, CONST):
+            value = e.value
+            return lambda r: value
+        if isinstance(e, TEMP):
+            is_global, idx = temp(e.temp)
+            if is_global:
+                g = self.globals
+                return lambda r: g[idx]
+            return operator.itemgetter(idx)
+        if isinstance(e, BINOP):
+            op = arithmetic[e.op]
+            left = self.compile(e.left, temp)
+            if isinstance(e.right, CONST) and e.op in ('+', '-'):
+                value = e.right.value if e.op == '+' else -e.right.value
+                return lambda r: left(r) + value
+            right = self.compile(e.right, temp)
+            return lambda r: op(left(r), right(r))
+        if isinstance(e, MEM):
+            memory = self.memory
+            address = self.compile(e.exp, temp)
+            return lambda r: memory[address(r) >> 2]
+        raise IrvmException("non canonical expression %s" % e)
+
+    def intrinsic(self, name, args):
+        if name == 'print_int':
+            self.output.write("%d\n" % args[0])
+        elif name == 'exit':
+            raise SystemExit(args[0])
+        else:
+            raise IrvmException("unknown function %s" % name)
+
+    def run(self, label=Label("main")):
+        """Run the function with the given label and return the content of
+        the rv register when it returns, or None if it does not return
+        a value."""
+        g, memory = self.globals, self.memory
+        g[FP] = g[SP] = self.stack_top
+        g[I0] = 0
+        function = self.functions[label]
+        function.calls += 1
+        code, pc, regs = function.code, 0, [0] * function.ntemps
+        stack = []
+        count = jumps = 0
+        start = time.perf_counter()
+        while True:
+            ins = code[pc]
+            op = ins[0]
+            pc += 1
+            count += 1
+            if op == MOVE_LOCAL:
+                regs[ins[1]] = ins[2](regs)
+            elif op == CJUMP_TO:
+                target = ins[2] if ins[1](regs) else ins[3]
+                if target != pc:
+                    jumps += 1
+                    pc = target
+            elif op == JUMP_TO:
+                jumps += 1
+                pc = ins[1]
+            elif op == MOVE_GLOBAL:
+                g[ins[1]] = ins[2](regs)
+            elif op == STORE:
+                memory[ins[1](regs) >> 2] = ins[2](regs)
+            elif op == CALL_TO:
+                callee = ins[1]
+                args = [a(regs) for a in ins[2]]
+                if not isinstance(callee, Function):
+                    self.intrinsic(callee, args)
+                    continue
+                if g[SP] < 1024:
+                    raise IrvmException("stack overflow in %s" % callee.name)
+                g[I0:I0 + len(args)] = args
+                now = time.perf_counter()
+                function.instructions += count
+                function.jumps += jumps
+                function.time += now - start
+                count, jumps, start = 0, 0, now
+                stack.append((function, code, pc, regs, ins[3]))
+                function = callee
+                function.calls += 1
+                code, pc, regs = function.code, 0, [0] * function.ntemps
+            elif op == EVAL:
+                ins[1](regs)
+            else:
+                now = time.perf_counter()
+                function.instructions += count
+                function.jumps += jumps
+                function.time += now - start
+                count, jumps, start = 0, 0, now
+                if not stack:
+                    return g[RV] if function.returns_value else None
+                function, code, pc, regs, dst = stack.pop()
+                if dst is not None:
+                    (regs if not dst[0] else g)[dst[1]] = g[RV]
+
+    def report(self, stream):
+        """Write the execution statistics of every called function. The time
+        spent in a function does not include the time spent in its
+        callees."""
+        stream.write("%-30s %10s %12s %10s %10s\n" %
+                     ("function", "calls", "instructions", "jumps",
+                      "time (ms)"))
+        for f in sorted(self.functions.values(), key=lambda f: -f.time):
+            if f.calls:
+                stream.write("%-30s %10d %12d %10d %10.3f\n" %
+                             (f.name, f.calls, f.instructions, f.jumps,
+                              f.time * 1000))
@@ -0,0 +1,84 @@
+import glob
+import io
+import os
+import unittest
+
+from ir.blocks import reorder_blocks
+from ir.canonical import canon
+from ir.context import Context
+from ir.hoist import HoistCalls
+from ir.nodes import LABEL
+from ir.translate import Translator
+from irvm.frame import IrvmFrame
+from irvm.interpreter import Interpreter
+from parser.parser import parse
+from semantics.binder import Binder
+from typer.typer import Typer
+
+TESTS = os.path.join(os.path.dirname(os.path.dirname(__file__)), "tests")
+
+class TestInterpreter(unittest.TestCase):
+
+    def compile(self, text):
+        tree = parse(text)
+        tree.accept(Binder())
+        Typer().run(tree, False)
+        with Context() as context:
+            funcs = Translator(IrvmFrame).run(tree)
+            H = HoistCalls()
+            for (f, (frame, stm)) in funcs.items():
+                with context.function(frame):
+                    funcs[f] = (frame,
+                                reorder_blocks(canon(stm.accept(H)), frame))
+        return funcs
+
+    def interpreter(self, text, output):
+        return Interpreter(self.compile(text), output=output)
+
+    def run_text(self, text):
+        output = io.StringIO()
+        return self.interpreter(text, output).run(), output.getvalue()
+
+    def check(self, text, expected):
+        self.assertEqual(self.run_text(text)[0], expected)
+
+    def test_expressions(self):
+        self.check('1 + 2 * 3', 7)
+        self.check('-7 / 2', -3)
+        self.check('if 0 then 100 else 200 + 300', 500)
+
+    def test_escaping_variable(self):
+        self.check('let var a := 1 function f() = a := a + 1 '
+                   'in f(); f(); a end', 3)
+
+    def test_tests_directory(self):
+        for filename in sorted(glob.glob(os.path.join(TESTS, "*.tiger"))):
+            with open(filename) as fd:
+                content = fd.read()
+            expected = content.split("\n")[0].lstrip("/ ")
+            _, output = self.run_text(content)
+            self.assertEqual(output.strip(), expected, filename)
+
+    def test_statistics(self):
+        interpreter = self.interpreter(
+            'let function f(n: int): int = if n = 0 then 0 else f(n - 1) '
+            'in f(10) end', io.StringIO())
+        interpreter.run()
+        calls = dict((f.name, f.calls)
+                     for f in interpreter.functions.values())
+        self.assertEqual(calls, {'main': 1, 'main$f': 11})
+
+    def test_labels(self):
+        funcs = self.compile(
+            'let function f(n: int): int = if n > 0 then n else 0 '
+            'in if f(1) > 0 then f(2) else 3 end')
+        names = [stm.label.name for (_, seq) in funcs.values()
+                 for stm in seq.stms if isinstance(stm, LABEL) and
+                 stm.label.name.startswith("L")]
+        # Local labels are numbered per function, and named after it.
+        self.assertIn("Lmain.0", names)
+        self.assertIn("Lmain$f.0", names)
+        self.assertEqual(len(names), len(set(names)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,103 +10,141 @@ class Dumper(Visitor):
         and identifiers."""
         self.semantics = semantics
 
+    @visitor(None)
+    def visit(self, node):
+        """Return the text of the whole tree, as written by a Writer."""
+        parts = []
+        node.accept(Writer(self.semantics, parts.append))
+        return "".join(parts)
+
+
+class Writer(Visitor):
+    """Write a tree as Dumper does, piece by piece, without building its
+    text in memory. The text of nested constructs is written as it is
+    produced, so that dumping takes a time linear in the size of the
+    output whatever the depth of the tree."""
+
+    def __init__(self, semantics, write):
+        """Initialize a new Writer visitor calling write with every piece
+        of text, for example the `write` method of a stream. semantics is
+        as for Dumper."""
+        self.semantics = semantics
+        self.write = write
+
+    def write_list(self, nodes, separator):
+        """Write nodes separated by separator."""
+        for (i, node) in enumerate(nodes):
+            if i:
+                self.write(separator)
+            node.accept(self)
+
     @visitor(None)
     def visit(self, node):
         raise Exception("unable to dump %s" % node)
 
     @visitor(IntegerLiteral)
     def visit(self, i):
-        return str(i.intValue)
+        self.write(str(i.intValue))
 
     @visitor(BinaryOperator)
     def visit(self, binop):
         # Always use parentheses to reflect grouping and associativity,
         # even if they may be superfluous.
-        return "(%s %s %s)" % \
-               (binop.left.accept(self), binop.op, binop.right.accept(self))
+        self.write("(")
+        binop.left.accept(self)
+        self.write(" %s " % binop.op)
+        binop.right.accept(self)
+        self.write(")")
 
     @visitor(Let)
     def visit(self, let):
-        decls = ''
-        expr = ''
-        length_decls = len(let.decls)
-        length_exps = len(let.exps)
-        i = 1
+        # A let with a single declaration is written on one line.
+        single = len(let.decls) == 1
+        self.write("let " if single else "let\n")
         for decl in let.decls:
-            decls += decl.accept(self) + ('\n' if length_decls != 1 else '')
-        for exp in let.exps:
-            expr += exp.accept(self) + ("; " if i != length_exps else "")
-            i += 1
-        return "let %s in %s end" % (decls, expr) if length_decls == 1 else "let\n%sin\n%s\nend" %(decls, expr)
+            decl.accept(self)
+            if not single:
+                self.write("\n")
+        self.write(" in " if single else "in\n")
+        self.write_list(let.exps, "; ")
+        self.write(" end" if single else "\nend")
 
     @visitor(Identifier)
     def visit(self, id):
+        self.write(id.name)
         if self.semantics:
             diff = id.depth - id.decl.depth
-            scope_diff = "/*%d*/" % diff if diff else ''
-        else:
-            scope_diff = ''
-        return '%s%s' % (id.name, scope_diff)
+            if diff:
+                self.write("/*%d*/" % diff)
 
     @visitor(IfThenElse)
     def visit(self, ifthenelse):
-        return "if %s then %s" % (ifthenelse.condition.accept(self), ifthenelse.then_part.accept(self)) + (" else %s" % ifthenelse.else_part.accept(self) if (ifthenelse.else_part is not None) else "")
+        self.write("if ")
+        ifthenelse.condition.accept(self)
+        self.write(" then ")
+        ifthenelse.then_part.accept(self)
+        if ifthenelse.else_part is not None:
+            self.write(" else ")
+            ifthenelse.else_part.accept(self)
 
     @visitor(VarDecl)
     def visit(self, decl):
-        if decl.type == None:
-            return "var %s" % decl.name + ("/*e*/" if decl.escapes and self.semantics else "") + " := %s" % decl.exp.accept(self)
-        else:
-            return "var %s" % decl.name + ("/*e*/" if decl.escapes and self.semantics else "") + ": %s := %s" % (decl.type.typename, decl.exp.accept(self))
+        self.write("var %s" % decl.name)
+        if decl.escapes and self.semantics:
+            self.write("/*e*/")
+        if decl.type is not None:
+            self.write(": %s" % decl.type.typename)
+        self.write(" := ")
+        decl.exp.accept(self)
 
     @visitor(FunDecl)
     def visit(self, func):
-        args = ''
-        length = len(func.args)
-        i = 1
-        if length != 0:
-            for arg in func.args:
-                args += "%s: %s" % (arg.name, arg.type.typename) + (", " if i != length else "")
-                i += 1
-
-        if func.type == None or func.type.typename == "void":
-            return "function %s(%s) = %s" % (func.name, args, func.exp.accept(self))
-        else:
-            return "function %s(%s): %s = %s" % (func.name, args, func.type.typename, func.exp.accept(self))
+        self.write("function %s(%s)" %
+                   (func.name, ", ".join("%s: %s" % (arg.name,
+                                                     arg.type.typename)
+                                         for arg in func.args)))
+        if func.type is not None and func.type.typename != "void":
+            self.write(": %s" % func.type.typename)
+        self.write(" = ")
+        func.exp.accept(self)
 
     @visitor(FunCall)
     def visit(self, func):
-        params = ''
-        length = len(func.params)
-        i = 1
-        if length != 0:
-            for param in func.params:
-                params += param.accept(self) + (", " if i != length else "")
-                i = i + 1
-        return "%s(%s)" % (func.identifier.name, params)
+        self.write("%s(" % func.identifier.name)
+        self.write_list(func.params, ", ")
+        self.write(")")
 
     @visitor(SeqExp)
     def visit(self, exprs):
-        length = len(exprs.exps)
-        exps = ''
-        i = 1
-        for expr in exprs.exps:
-            exps += "%s" % expr.accept(self) + ("; " if i != length else "")
-            i += 1
-        return ("(" if length != 1 else "") + "%s" % exps + (")" if length != 1 else "")
+        parenthesized = len(exprs.exps) != 1
+        if parenthesized:
+            self.write("(")
+        self.write_list(exprs.exps, "; ")
+        if parenthesized:
+            self.write(")")
 
     @visitor(While)
     def visit(self, whi):
-        return "while %s do %s" % (whi.condition.accept(self), whi.exp.accept(self))
+        self.write("while ")
+        whi.condition.accept(self)
+        self.write(" do ")
+        whi.exp.accept(self)
 
     @visitor(For)
     def visit(self, fo):
-        return "for %s := %s to %s do %s" % (fo.indexdecl.name, fo.low_bound.accept(self), fo.high_bound.accept(self), fo.exp.accept(self))
+        self.write("for %s := " % fo.indexdecl.name)
+        fo.low_bound.accept(self)
+        self.write(" to ")
+        fo.high_bound.accept(self)
+        self.write(" do ")
+        fo.exp.accept(self)
 
     @visitor(Break)
     def visit(self, bre):
-        return "break"
+        self.write("break")
 
     @visitor(Assignment)
     def visit(self, ass):
-        return "%s := %s" % (ass.identifier.accept(self), ass.exp.accept(self))
+        ass.identifier.accept(self)
+        self.write(" := ")
+        ass.exp.accept(self)
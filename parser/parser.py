@@ -1,6 +1,8 @@
 from ast.nodes import *
 from . import tokenizer
 import ply.yacc as yacc
+import copy
+import threading
 
 tokens = tokenizer.tokens
 
@@ -79,6 +81,7 @@ def p_fun_decl(p):
     '''fun_decl : FUNCTION ID LPAREN fun_decl_args RPAREN EQUAL expression
                 | FUNCTION ID LPAREN fun_decl_args RPAREN COLON INT EQUAL expression'''
     p[0] = FunDecl(p[2], p[4], Type(p[7]), p[9]) if len(p) == 10 else FunDecl(p[2], p[4], None, p[7])
+    p[0].lineno = p.lineno(1)
 
 def p_fun_decl_args(p):
     '''fun_decl_args :
@@ -123,17 +126,20 @@ def p_assignment(p):
 ### While structure
 def p_while(p):
     '''expression : WHILE expression DO expression'''
-    p[0] = While(p[2], p[4]) 
+    p[0] = While(p[2], p[4])
+    p[0].lineno = p.lineno(1)
 
 ### For structure
 def p_for(p):
     '''expression : FOR ID ASSIGN expression TO expression DO expression'''
     p[0] = For(IndexDecl(p[2]), p[4], p[6], p[8])
+    p[0].lineno = p.lineno(1)
 
 ### Break
 def p_break(p):
     '''expression : BREAK'''
     p[0] = Break()
+    p[0].lineno = p.lineno(1)
 
 
 def p_error(p):
@@ -143,5 +149,15 @@ def p_error(p):
 
 parser = yacc.yacc()
 
+# The parser keeps its state in attributes while parsing: every thread
+# gets its own copy sharing the (read-only) tables.
+_local = threading.local()
+
 def parse(text):
-    return parser.parse(text, lexer = tokenizer.lexer.clone())
+    # Function declarations, loops and breaks record the line they start
+    # on in a `lineno` field, so line counting must start afresh.
+    lexer = tokenizer.lexer.clone()
+    lexer.lineno = 1
+    if not hasattr(_local, 'parser'):
+        _local.parser = copy.copy(parser)
+    return _local.parser.parse(text, lexer = lexer)
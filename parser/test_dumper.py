@@ -1,6 +1,7 @@
+import io
 import unittest
 
-from parser.dumper import Dumper
+from parser.dumper import Dumper, Writer
 from parser.parser import parse
 
 class TestDumper(unittest.TestCase):
@@ -41,5 +42,15 @@ class TestDumper(unittest.TestCase):
         self.check("func()", "func()")
         self.check("func(1 + 2)", "func((1 + 2))")
         self.check("func(a, b, c)", "func(a, b, c)")
+
+    def test_writer(self):
+        text = "let var a := 1 var b := 2 in (a; " * 20 + "b" + ") end" * 20
+        expected = "let\nvar a := 1\nvar b := 2\nin\n(a; " * 20 + "b" + \
+                   ")\nend" * 20
+        self.check(text, expected)
+        stream = io.StringIO()
+        parse(text).accept(Writer(False, stream.write))
+        self.assertEqual(stream.getvalue(), expected)
+
 if __name__ == '__main__':
     unittest.main()
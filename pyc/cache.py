@@ -0,0 +1,72 @@
+#
+# Storage of the code objects produced by the Python backend. The files use
+# the layout of hash-based .pyc files (PEP 552): the interpreter magic
+# number, a flags word, the hash of the Tiger source and the marshalled
+# code object. A cached file is only used if the interpreter and the hash
+# of the source both match.
+#
+
+import importlib.util
+import marshal
+import os
+import sys
+
+# Bump this whenever the generated code changes so that previously cached
+# artifacts get rebuilt.
+GEN_VERSION = b"tiger-pyc-1\0"
+
+# Hash-based, checked source (see PEP 552).
+FLAGS = 0b11
+
+
+def source_hash(content):
+    """Return the hash identifying a given Tiger source and backend
+    version."""
+    return importlib.util.source_hash(GEN_VERSION + content.encode())
+
+
+def cache_path(filename):
+    """Return the path of the cached artifact for a Tiger source file."""
+    directory, basename = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, "__pycache__", "%s.%s.pyc" %
+                        (basename, sys.implementation.cache_tag))
+
+
+def dumps(code, content):
+    """Serialize a code object compiled from the given Tiger source."""
+    return importlib.util.MAGIC_NUMBER + FLAGS.to_bytes(4, 'little') + \
+        source_hash(content) + marshal.dumps(code)
+
+
+def loads(data, content):
+    """Return the code object stored in data if it has been compiled by
+    this interpreter from the given Tiger source, None otherwise."""
+    if data[:4] != importlib.util.MAGIC_NUMBER or \
+       int.from_bytes(data[4:8], 'little') != FLAGS or \
+       data[8:16] != source_hash(content):
+        return None
+    return marshal.loads(data[16:])
+
+
+def load(filename, content):
+    """Return the cached code object for a Tiger source file or None if
+    there is no valid one."""
+    try:
+        with open(cache_path(filename), 'rb') as fd:
+            return loads(fd.read(), content)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def store(filename, content, code):
+    """Store the code object compiled from a Tiger source file. Failures
+    are ignored as the cache is only an optimization."""
+    path = cache_path(filename)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = "%s.%d" % (path, os.getpid())
+        with open(tmp, 'wb') as fd:
+            fd.write(dumps(code, content))
+        os.replace(tmp, path)
+    except OSError:
+        pass
@@ -0,0 +1,271 @@
+from ast.nodes import *
+from utils.visitor import *
+
+
+class PythonGenException(Exception):
+    """Exception encountered while lowering the AST to Python."""
+    pass
+
+
+# Python rendering of the arithmetic and logical Tiger operators. The
+# division is handled separately since it truncates towards zero.
+arithmetic_operators = {'+': '+', '-': '-', '*': '*'}
+logical_operators = {'<': '<', '>': '>', '<=': '<=', '>=': '>=',
+                     '=': '==', '<>': '!='}
+
+
+def indent(lines):
+    """Indent a list of Python source lines by one level."""
+    return ["    " + line for line in lines]
+
+
+class Gen(Visitor):
+    """Lower a bound and typed AST into Python source code.
+
+    As in the ARM code generator, this visitor returns a pair for every
+    expression: a list of Python statements (source lines) which must be
+    executed first, and a Python expression (a string) giving the value of
+    the Tiger expression, or None if the expression does not return a
+    value.
+
+    Every declaration is renamed to a unique Python identifier so that
+    shadowing within a single Python function cannot clash. Tiger functions
+    become nested Python functions (closures), and `nonlocal` statements are
+    emitted for the variables of enclosing functions which are assigned.
+    The whole program is wrapped into a `main` function."""
+
+    def __init__(self):
+        # Mapping from declarations to Python identifiers.
+        self.names = {}
+        self.counter = 0
+        # Stack of sets of declarations assigned from the function being
+        # generated but declared in an enclosing one.
+        self.nonlocals = []
+        # Stack of the Tiger loops whose Python loop encloses the code
+        # being generated. A Python break leaves the innermost one.
+        self.loops = [None]
+
+    def run(self, tree):
+        """Return the Python source code for the whole program."""
+        self.nonlocals.append(set())
+        stms, exp = tree.accept(self)
+        self.nonlocals.pop()
+        return "\n".join(["def main():"] +
+                         indent(stms + ["return %s" % exp if exp else
+                                        "return None"])) + "\n"
+
+    def fresh(self, prefix):
+        """Return a new unique Python identifier."""
+        self.counter += 1
+        return "%s%d" % (prefix, self.counter)
+
+    def name(self, decl):
+        """Return the Python identifier of a declaration, creating it on
+        first use."""
+        if decl not in self.names:
+            prefix = "f" if isinstance(decl, FunDecl) else "v"
+            self.names[decl] = "%s_%s" % (self.fresh(prefix), decl.name)
+        return self.names[decl]
+
+    def sequence(self, nodes):
+        """Visit nodes in order and return the statements and the list of
+        expressions. An expression is copied into a temporary when the
+        statements of a later node could change its value."""
+        results = [node.accept(self) for node in nodes]
+        stms, exps = [], []
+        for (idx, (s, e)) in enumerate(results):
+            stms += s
+            if e is not None and not e.isdigit() and \
+               any(later for (later, _) in results[idx + 1:]):
+                t = self.fresh("_t")
+                stms.append("%s = %s" % (t, e))
+                e = t
+            exps.append(e)
+        return stms, exps
+
+    def statement(self, node):
+        """Return the statements for a node whose value is ignored."""
+        stms, exp = node.accept(self)
+        if exp is not None and not exp.isdigit() and \
+           not exp.isidentifier():
+            stms = stms + [exp]
+        return stms
+
+    def statements(self, nodes):
+        return [s for node in nodes for s in self.statement(node)]
+
+    def condition(self, node):
+        """Return the statements and a Python expression usable as a
+        condition. Comparisons are not converted back to integers."""
+        if isinstance(node, BinaryOperator) and node.op in logical_operators:
+            stms, (left, right) = self.sequence([node.left, node.right])
+            return stms, "%s %s %s" % (left, logical_operators[node.op],
+                                       right)
+        return node.accept(self)
+
+    def body(self, exps, void):
+        """Visit a non-empty list of expressions whose value is the value
+        of the last one."""
+        stms = self.statements(exps[:-1])
+        if void:
+            return stms + self.statement(exps[-1]), None
+        last_stms, exp = exps[-1].accept(self)
+        return stms + last_stms, exp
+
+    @visitor(None)
+    def visit(self, node):
+        raise PythonGenException("unable to lower %s" % node)
+
+    @visitor(IntegerLiteral)
+    def visit(self, i):
+        return [], str(i.intValue)
+
+    @visitor(Identifier)
+    def visit(self, id):
+        return [], self.name(id.decl)
+
+    @visitor(BinaryOperator)
+    def visit(self, binop):
+        if binop.op in ('&', '|'):
+            left_stms, left = self.condition(binop.left)
+            right_stms, right = self.condition(binop.right)
+            if not right_stms:
+                return left_stms, "(1 if %s %s %s else 0)" % \
+                    (left, "and" if binop.op == '&' else "or", right)
+            # The right operand needs statements, it must only be evaluated
+            # when the left one does not determine the result.
+            t = self.fresh("_t")
+            return left_stms + \
+                ["%s = %d" % (t, 0 if binop.op == '&' else 1),
+                 ("if %s:" if binop.op == '&' else "if not (%s):") % left] + \
+                indent(right_stms + ["if %s:" % right, "    %s = 1" % t,
+                                     "else:", "    %s = 0" % t]), t
+        if binop.op in logical_operators:
+            stms, exp = self.condition(binop)
+            return stms, "int(%s)" % exp
+        stms, (left, right) = self.sequence([binop.left, binop.right])
+        if binop.op == '/':
+            return stms, "int(%s / %s)" % (left, right)
+        if binop.op not in arithmetic_operators:
+            raise PythonGenException("unknown operator %s" % binop.op)
+        return stms, "(%s %s %s)" % (left, arithmetic_operators[binop.op],
+                                     right)
+
+    @visitor(IfThenElse)
+    def visit(self, ite):
+        cond_stms, cond = self.condition(ite.condition)
+        void = ite.type is None or ite.type.typename == 'void'
+        if void:
+            then_stms = self.statement(ite.then_part) or ["pass"]
+            else_stms = self.statement(ite.else_part) \
+                if ite.else_part else []
+            return cond_stms + ["if %s:" % cond] + indent(then_stms) + \
+                (["else:"] + indent(else_stms) if else_stms else []), None
+        then_stms, then_exp = ite.then_part.accept(self)
+        else_stms, else_exp = ite.else_part.accept(self)
+        if not then_stms and not else_stms:
+            return cond_stms, "(%s if %s else %s)" % (then_exp, cond,
+                                                      else_exp)
+        t = self.fresh("_t")
+        return cond_stms + ["if %s:" % cond] + \
+            indent(then_stms + ["%s = %s" % (t, then_exp)]) + \
+            ["else:"] + indent(else_stms + ["%s = %s" % (t, else_exp)]), t
+
+    @visitor(SeqExp)
+    def visit(self, seq):
+        if not seq.exps:
+            return [], None
+        return self.body(seq.exps,
+                         seq.type is None or seq.type.typename == 'void')
+
+    @visitor(Let)
+    def visit(self, let):
+        stms = [s for decl in let.decls for s in decl.accept(self)]
+        if not let.exps:
+            return stms, None
+        body_stms, exp = \
+            self.body(let.exps, let.type is None or
+                      let.type.typename == 'void')
+        return stms + body_stms, exp
+
+    @visitor(VarDecl)
+    def visit(self, decl):
+        stms, exp = decl.exp.accept(self)
+        return stms + ["%s = %s" % (self.name(decl), exp)]
+
+    @visitor(FunDecl)
+    def visit(self, decl):
+        self.nonlocals.append(set())
+        args = ", ".join(self.name(arg) for arg in decl.args)
+        stms, exp = decl.exp.accept(self)
+        # Variables declared outside this function but assigned inside it
+        # must be declared nonlocal. The enclosing functions do not need it
+        # unless they also assign them.
+        nonlocals = sorted(self.name(d) for d in self.nonlocals.pop())
+        header = ["nonlocal %s" % ", ".join(nonlocals)] if nonlocals else []
+        if exp is not None:
+            stms = stms + ["return %s" % exp]
+        return ["def %s(%s):" % (self.name(decl), args)] + \
+            indent(header + stms or ["pass"])
+
+    @visitor(FunCall)
+    def visit(self, call):
+        decl = call.identifier.decl
+        stms, args = self.sequence(call.params)
+        func = decl.name if isinstance(decl.exp, Intrinsics) \
+            else self.name(decl)
+        exp = "%s(%s)" % (func, ", ".join(args))
+        if decl.type is None or decl.type.typename == 'void':
+            return stms + [exp], None
+        return stms, exp
+
+    @visitor(Assignment)
+    def visit(self, assign):
+        decl = assign.identifier.decl
+        if assign.identifier.depth > decl.depth:
+            self.nonlocals[-1].add(decl)
+        stms, exp = assign.exp.accept(self)
+        return stms + ["%s = %s" % (self.name(decl), exp)], None
+
+    @visitor(While)
+    def visit(self, w):
+        # The condition may need statements, which are then emitted in the
+        # Python loop. A break of an enclosing loop in those statements
+        # would exit this While instead, and is rejected (see Break).
+        self.loops.append(w)
+        cond_stms, cond = self.condition(w.condition)
+        body = self.statement(w.exp) or ["pass"]
+        self.loops.pop()
+        if not cond_stms:
+            return ["while %s:" % cond] + indent(body), None
+        return ["while True:"] + \
+            indent(cond_stms + ["if not (%s):" % cond, "    break"] + body), \
+            None
+
+    @visitor(For)
+    def visit(self, f):
+        stms, (low, high) = self.sequence([f.low_bound, f.high_bound])
+        self.loops.append(f)
+        body = self.statement(f.exp) or ["pass"]
+        self.loops.pop()
+        return stms + ["for %s in range(%s, %s + 1):" %
+                       (self.name(f.indexdecl), low, high)] + \
+            indent(body), None
+
+    @visitor(Break)
+    def visit(self, b):
+        if b.loop is not self.loops[-1]:
+            raise PythonGenException("break in while condition "
+                                     "is not supported")
+        return ["break"], None
+
+
+def lower(tree):
+    """Return the Python source code corresponding to a bound and typed
+    AST."""
+    return Gen().run(tree)
+
+
+def compile_tree(tree, filename="<tiger>"):
+    """Lower a bound and typed AST into a Python code object."""
+    return compile(lower(tree), filename, 'exec')
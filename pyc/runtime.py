@@ -0,0 +1,33 @@
+#
+# Runtime support for programs compiled by the Python backend. The names
+# defined in `namespace()` are the only globals visible from the generated
+# code.
+#
+
+import sys
+
+
+def print_int(i):
+    """Print an integer followed by a newline."""
+    sys.stdout.write("%d\n" % i)
+
+
+def exit(code):
+    """Terminate the program with the given exit code."""
+    raise SystemExit(code)
+
+
+def namespace():
+    """Return a fresh globals dictionary in which a generated code object
+    can be executed."""
+    return {'__builtins__': {'int': int, 'range': range},
+            'print_int': print_int,
+            'exit': exit}
+
+
+def run(code):
+    """Execute a code object produced by the Python backend and return the
+    value of the main expression."""
+    globals = namespace()
+    exec(code, globals)
+    return globals['main']()
@@ -0,0 +1,81 @@
+import contextlib
+import glob
+import io
+import os
+import tempfile
+import unittest
+
+from parser.parser import parse
+from pyc import cache, runtime
+from pyc.gen import PythonGenException, compile_tree
+from semantics.binder import Binder
+from typer.typer import Typer
+
+TESTS = os.path.join(os.path.dirname(os.path.dirname(__file__)), "tests")
+
+class TestGen(unittest.TestCase):
+
+    def compile(self, text):
+        tree = parse(text)
+        tree.accept(Binder())
+        Typer().run(tree, False)
+        return compile_tree(tree)
+
+    def run_code(self, code):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            result = runtime.run(code)
+        return result, output.getvalue()
+
+    def check(self, text, expected):
+        self.assertEqual(self.run_code(self.compile(text))[0], expected)
+
+    def test_expressions(self):
+        self.check('1 + 2 * 3', 7)
+        self.check('7 / 2', 3)
+        self.check('-7 / 2', -3)
+        self.check('3 < 4', 1)
+        self.check('0 & 2 / 0', 0)
+        self.check('1 | 2 / 0', 1)
+        self.check('if 0 then 100 else 200 + 300', 500)
+
+    def test_shadowing(self):
+        self.check('let var a := 1 in let var a := 2 in a := 3 end; a end', 1)
+
+    def test_closure_assignment(self):
+        self.check('let var a := 1 function f() = a := a + 1 '
+                   'in f(); f(); a end', 3)
+
+    def test_short_circuit_with_statements(self):
+        self.check('let var a := 0 in 0 & (a := 1; 1); a end', 0)
+        self.check('let var a := 0 in 1 & (a := 1; 1); a end', 1)
+
+    def test_break_in_while_condition(self):
+        # The break leaves a loop of the condition, not the While.
+        self.check('let var n := 0 in while (for i := 1 to 10 do '
+                   '(n := n + 1; if i = 3 then break); n < 10) do '
+                   'n := n + 1; n end', 11)
+        # This one would leave the For, but the Python loop of the While.
+        with self.assertRaises(PythonGenException):
+            self.compile('for j := 1 to 5 do while (break; 1) do ()')
+
+    def test_tests_directory(self):
+        for filename in sorted(glob.glob(os.path.join(TESTS, "*.tiger"))):
+            with open(filename) as fd:
+                content = fd.read()
+            expected = content.split("\n")[0].lstrip("/ ")
+            _, output = self.run_code(self.compile(content))
+            self.assertEqual(output.strip(), expected, filename)
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "prog.tiger")
+            content = "let var a := 6 in a * 7 end"
+            self.assertIsNone(cache.load(filename, content))
+            cache.store(filename, content, self.compile(content))
+            code = cache.load(filename, content)
+            self.assertEqual(self.run_code(code)[0], 42)
+            self.assertIsNone(cache.load(filename, content + " "))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+import pickle
+import sys
+
+from ply.lex import LexError
+
+from ast.nodes import *
+from ast.stack_evaluator import Activation, StackEvaluator
+from parser import tokenizer
+from parser.parser import parse
+from semantics.binder import Binder, BindException
+from typer.typer import Typer, TypeException
+
+
+class SessionException(Exception):
+    """Exception encountered while handling a session input."""
+    pass
+
+
+class Session:
+    """An interactive session, in which declarations and expressions are
+    given one at a time.
+
+    Every input is either a sequence of `var` and `function` declarations,
+    which stay visible for the following inputs, or an expression whose
+    value is returned. An input is parsed, bound, typed and evaluated once:
+    later inputs only refer to the declarations already processed, so the
+    cost of an input does not depend on the size of the session.
+
+      - The binder keeps the session scope, in which new declarations are
+        added. A declaration with the same name as an existing one goes
+        into a new scope and hides the older one.
+      - Every input is typed by a new typer, in which the declarations
+        it refers to are merged with the type they got when typed.
+      - The evaluator keeps a top-level activation holding the session
+        variables, along with its analyses of the functions.
+
+    An input which fails at any step leaves the session unchanged, except
+    for the side effects of its evaluation on existing variables.
+
+    A session can be saved to and restored from a file with `save` and
+    `load`."""
+
+    def __init__(self, output=None):
+        self.binder = Binder()
+        self.binder.push_new_scope()
+        self.evaluator = StackEvaluator(output)
+        self.activation = Activation({}, None)
+
+    @classmethod
+    def load(cls, filename, output=None):
+        """Restore a session saved by `save`, writing to output."""
+        with open(filename, "rb") as fd:
+            session = pickle.load(fd)
+        if not isinstance(session, cls):
+            raise SessionException("%s does not contain a session" %
+                                   filename)
+        if output is not None:
+            session.evaluator.output = output
+        return session
+
+    def save(self, filename):
+        with open(filename, "wb") as fd:
+            pickle.dump(self, fd, pickle.HIGHEST_PROTOCOL)
+
+    def declarations(self, text):
+        """Check if text starts with a declaration."""
+        lexer = tokenizer.lexer.clone()
+        lexer.input(text)
+        try:
+            token = lexer.token()
+        except LexError as e:
+            raise SessionException("illegal character %s" % e.text[:1])
+        return token is not None and token.type in ('VAR', 'FUNCTION')
+
+    def parse(self, text):
+        """Parse text and return the list of declarations or the expression
+        it contains."""
+        try:
+            if self.declarations(text):
+                return parse("let %s in end" % text).decls
+            return parse(text)
+        except SystemExit:
+            # The parser reports syntax errors and exits.
+            raise SessionException("syntax error")
+        except LexError as e:
+            raise SessionException("illegal character %s" % e.text[:1])
+
+    def bind(self, decls, exp):
+        """Bind the new declarations, or an expression, in a new scope which
+        is returned."""
+        binder = self.binder
+        binder.push_new_scope()
+        scope = binder.current_scope()
+        try:
+            for decl in decls:
+                decl.accept(binder)
+            if exp is not None:
+                exp.accept(binder)
+        finally:
+            binder.pop_scope()
+        return scope
+
+    def type(self, tree):
+        """Type tree, which may refer to declarations already typed."""
+        typer = Typer()
+        nodes = [tree]
+        while nodes:
+            node = nodes.pop()
+            nodes.extend(node.children)
+            if isinstance(node, Identifier) and node.decl.type is not None:
+                decl = node.decl
+                for d in [decl] + getattr(decl, 'args', []):
+                    if d.type is not None:
+                        typer.merge(d, typer.int_type
+                                    if d.type.typename == 'int'
+                                    else typer.void_type)
+        typer.run(tree, False)
+
+    def commit(self, scope):
+        """Make the declarations of scope visible to the following
+        inputs."""
+        scopes = self.binder.scopes
+        if any(name in scopes[-1] for name in scope):
+            scopes.append(scope)
+        else:
+            scopes[-1].update(scope)
+
+    def feed(self, text):
+        """Process an input and return the value of the expression it
+        contains, or None for declarations and expressions without a
+        value."""
+        tree = self.parse(text)
+        if isinstance(tree, list):
+            decls = tree
+            tree, exp = Let(decls, []), None
+        else:
+            decls, exp = [], tree
+        scope = self.bind(decls, exp)
+        self.type(tree)
+        value = self.evaluator.run(tree, self.activation)
+        self.commit(scope)
+        return value
+
+
+def interact(session, input, prompt=None):
+    """Feed session with the lines read from input, printing the value of
+    expressions. A line ending with a backslash continues on the next
+    line. Errors are reported and do not stop the session."""
+    lines = []
+    while True:
+        if prompt is not None:
+            sys.stderr.write(prompt if not lines else "." * len(prompt))
+            sys.stderr.flush()
+        line = input.readline()
+        if not line:
+            break
+        line = line.rstrip("\n")
+        if line.endswith("\\"):
+            lines.append(line[:-1])
+            continue
+        text = "\n".join(lines + [line])
+        lines = []
+        if not text.strip():
+            continue
+        try:
+            value = session.feed(text)
+        except (SessionException, BindException, TypeException,
+                ArithmeticError, RecursionError) as e:
+            print("Error: %s" % e, file=sys.stderr)
+            continue
+        if value is not None:
+            print(value, file=session.evaluator.output)
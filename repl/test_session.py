@@ -0,0 +1,74 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from repl.session import Session, SessionException, interact
+from semantics.binder import BindException
+from typer.typer import TypeException
+
+class TestSession(unittest.TestCase):
+
+    def test_declarations(self):
+        session = Session(io.StringIO())
+        self.assertIsNone(session.feed('var a := 3'))
+        self.assertEqual(session.feed('a * 2'), 6)
+        session.feed('function f(n: int): int = '
+                     'if n < 2 then n else f(n - 1) + f(n - 2)')
+        self.assertEqual(session.feed('f(a + 7)'), 55)
+        session.feed('function incr() = a := a + 1')
+        session.feed('(incr(); incr())')
+        self.assertEqual(session.feed('a'), 5)
+
+    def test_shadowing(self):
+        session = Session(io.StringIO())
+        session.feed('var a := 1')
+        session.feed('function get(): int = a')
+        session.feed('var a := 10')
+        self.assertEqual(session.feed('a + get()'), 11)
+        # Intrinsics can be hidden as well.
+        session.feed('function exit(n: int): int = n')
+        self.assertEqual(session.feed('exit(2)'), 2)
+
+    def test_errors(self):
+        session = Session(io.StringIO())
+        session.feed('var a := 1 function f() = a := 2')
+        self.assertRaises(BindException, session.feed, 'b')
+        self.assertRaises(TypeException, session.feed, 'var c := f()')
+        self.assertRaises(BindException, session.feed, 'c')
+        self.assertRaises(ZeroDivisionError, session.feed, 'var d := 1 / 0')
+        self.assertRaises(BindException, session.feed, 'd')
+        self.assertRaises(SessionException, session.feed, 'a $ 2')
+        self.assertRaises(SessionException, session.feed, '$')
+        self.assertEqual(session.feed('a'), 1)
+
+    def test_save(self):
+        output = io.StringIO()
+        session = Session(output)
+        session.feed('var a := 4')
+        session.feed('function sq(n: int): int = n * n')
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "session")
+            session.save(filename)
+            restored = Session.load(filename, output)
+        session.feed('a := 0')
+        self.assertEqual(restored.feed('sq(a)'), 16)
+        restored.feed('print_int(a)')
+        self.assertEqual(output.getvalue(), "4\n")
+
+    def test_interact(self):
+        output = io.StringIO()
+        interact(Session(output),
+                 io.StringIO('var a := 2\n\nfunction f(n: int): int = \\\n'
+                             '  n + a\nf(1)\n'))
+        self.assertEqual(output.getvalue(), "3\n")
+        # Errors are reported and the session goes on.
+        output, errors = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stderr(errors):
+            interact(Session(output), io.StringIO('1 $ 2\n1 + 2\n'))
+        self.assertEqual(output.getvalue(), "3\n")
+        self.assertEqual(errors.getvalue(), "Error: illegal character $\n")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+from ast.nodes import *
+from utils.visitor import *
+
+
+class PurityAnalysis(Visitor):
+    """Find out which functions of a bound AST are pure, that is whose
+    result only depends on their arguments and whose evaluation has no
+    observable effect. Calls to a pure function can be memoized on the
+    values of their arguments.
+
+    A function is impure if it:
+      - calls an intrinsic (`print_int` or `exit`);
+      - assigns a variable declared outside of it;
+      - reads a variable declared outside of it, since its result would
+        then depend on more than its arguments;
+      - calls an impure function.
+
+    The last rule is applied until a fixed point is reached, so that
+    recursive and mutually recursive functions can be pure.
+
+    After `run`, `pure` is the set of pure function declarations and
+    `reasons` maps every impure function declaration to a short
+    explanation."""
+
+    def __init__(self):
+        self.functions = []
+        self.names = {}
+        self.reasons = {}
+        self.callees = {}
+        self.pure = set()
+        # Stack of functions being analyzed.
+        self.current = []
+
+    def run(self, tree):
+        """Analyze tree and return the set of pure functions. run may be
+        called again on other trees, which may call the functions already
+        analyzed: only the functions declared in the new tree are
+        analyzed."""
+        start = len(self.functions)
+        tree.accept(self)
+        functions = self.functions[start:]
+        # Propagate impurity to the callers until a fixed point is reached.
+        # Functions analyzed previously cannot call the new ones.
+        callers = dict((decl, []) for decl in functions)
+        for decl in functions:
+            for callee in self.callees[decl]:
+                if callee in callers:
+                    callers[callee].append(decl)
+                elif callee not in self.reasons and callee not in self.pure:
+                    # Function declared outside of the analyzed trees.
+                    self.reasons[callee] = "not analyzed"
+                if callee not in callers and callee in self.reasons and \
+                   decl not in self.reasons:
+                    self.reasons[decl] = "calls impure %s" % self.name(callee)
+        worklist = [decl for decl in functions if decl in self.reasons]
+        while worklist:
+            callee = worklist.pop()
+            for caller in callers.get(callee, []):
+                if caller not in self.reasons:
+                    self.reasons[caller] = "calls impure %s" % \
+                        self.name(callee)
+                    worklist.append(caller)
+        self.pure.update(decl for decl in functions
+                         if decl not in self.reasons)
+        return self.pure
+
+    def name(self, decl):
+        return self.names.get(decl, decl.name)
+
+    def impure(self, reason):
+        """Mark the function being analyzed as impure, keeping the first
+        reason found."""
+        if self.current and self.current[-1] not in self.reasons:
+            self.reasons[self.current[-1]] = reason
+
+    def outside(self, identifier):
+        """Check if an identifier refers to a declaration made outside the
+        function being analyzed."""
+        return identifier.depth > identifier.decl.depth
+
+    def report(self):
+        """Return a list of lines describing the analysis results."""
+        return ["%s: %s" % (self.name(decl),
+                            "impure (%s)" % self.reasons[decl]
+                            if decl in self.reasons else "pure")
+                for decl in self.functions]
+
+    @visitor(None)
+    def visit(self, node):
+        self.visit_all(node.children)
+
+    @visitor(FunDecl)
+    def visit(self, decl):
+        self.names[decl] = "$".join([self.name(f) for f in self.current] +
+                                    [decl.name])
+        self.functions.append(decl)
+        self.callees[decl] = set()
+        self.current.append(decl)
+        decl.exp.accept(self)
+        self.current.pop()
+
+    @visitor(FunCall)
+    def visit(self, call):
+        decl = call.identifier.decl
+        if isinstance(decl.exp, Intrinsics):
+            self.impure("calls %s" % decl.name)
+        elif self.current:
+            self.callees[self.current[-1]].add(decl)
+        self.visit_all(call.params)
+
+    @visitor(Assignment)
+    def visit(self, assignment):
+        if self.outside(assignment.identifier):
+            self.impure("assigns %s" % assignment.identifier.name)
+        assignment.exp.accept(self)
+
+    @visitor(Identifier)
+    def visit(self, identifier):
+        if self.outside(identifier):
+            self.impure("reads %s" % identifier.name)
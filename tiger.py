@@ -7,6 +7,12 @@ from parser.parser import parse
 import sys
 
 parser = OptionParser()
+parser.add_option("-a", "--allocator",
+                  help="register allocator: coloring, linear (scan) or "
+                       "auto (linear scan for large functions only)",
+                  type="choice", choices=["auto", "coloring", "linear"],
+                  default="auto", metavar="ALLOCATOR",
+                  dest="allocator")
 parser.add_option("-b", "--bind",
                   help="invoke the binder",
                   action="store_true", default=False,
@@ -27,6 +33,11 @@ parser.add_option("-e", "--eval",
                   help="evaluate input file to output",
                   action="store_true", default=False,
                   dest="eval")
+parser.add_option("-F", "--flame-graph",
+                  help="write the collapsed call stacks of the evaluation "
+                       "to FILE (implies -P)",
+                  action="store", default=None, metavar="FILE",
+                  dest="flame_graph")
 parser.add_option("-g", "--gen",
                   help="generate assembly code",
                   action="store_true", default=False,
@@ -43,10 +54,29 @@ parser.add_option("-l", "--liveness",
                   help="perform liveness analysis",
                   action="store_true", default=False,
                   dest="liveness")
+parser.add_option("-p", "--python",
+                  help="execute through the Python backend, caching the "
+                       "compiled code next to the input file",
+                  action="store_true", default=False,
+                  dest="python")
+parser.add_option("-P", "--profile",
+                  help="profile the evaluation (implies -e and -b)",
+                  action="store_true", default=False,
+                  dest="profile")
 parser.add_option("-r", "--registers",
                   help="allocate registers",
                   action="store_true", default=False,
                   dest="registers")
+parser.add_option("-R", "--repl",
+                  help="read declarations and expressions one line at a "
+                       "time and evaluate them",
+                  action="store_true", default=False,
+                  dest="repl")
+parser.add_option("-S", "--session",
+                  help="restore the REPL session from FILE if it exists, "
+                       "and save it there when leaving (implies -R)",
+                  action="store", default=None, metavar="FILE",
+                  dest="session")
 parser.add_option("-t", "--type",
                   help="invoke the typer",
                   action="store_true", default=False,
@@ -59,6 +89,9 @@ parser.usage = """%prog [options] [file]"""
 parser.description = "Compile a Tiger program (or standard input)"
 
 (options, args) = parser.parse_args()
+options.profile |= options.flame_graph is not None
+options.eval |= options.profile
+options.bind |= options.profile
 options.liveness |= options.registers
 options.gen |= options.liveness
 options.canon |= options.gen
@@ -66,6 +99,8 @@ if options.irvm and options.gen:
     print("Error: IRVM cannot be selected for code generation", file=sys.stderr)
     sys.exit(1)
 options.irvm &= not options.gen
+# Evaluating IRVM code requires the canonical, block-ordered IR.
+options.canon |= options.irvm and options.eval
 options.ir |= options.canon | options.irvm
 options.type |= options.ir
 
@@ -73,6 +108,22 @@ if len(args) > 1 or (options.expression and len(args) > 0):
     parser.print_help(file=sys.stderr)
     sys.exit(1)
 
+options.repl |= options.session is not None
+if options.repl:
+    import os
+    from repl.session import Session, interact
+    if options.session is not None and os.path.exists(options.session):
+        session = Session.load(options.session)
+    else:
+        session = Session()
+    try:
+        fd = open(args[0]) if args else sys.stdin
+        interact(session, fd, "> " if fd.isatty() else None)
+    finally:
+        if options.session is not None:
+            session.save(options.session)
+    sys.exit(0)
+
 if options.expression:
     content = options.expression
 else:
@@ -80,6 +131,31 @@ else:
     content = fd.read()
     fd.close()
 
+if options.python:
+    # The Python backend caches the compiled program, in which case the
+    # whole front end can be skipped.
+    from pyc import cache, runtime
+    code = cache.load(args[0], content) if args else None
+    if code is None:
+        from pyc.gen import PythonGenException, compile_tree
+        from semantics.binder import Binder
+        from typer.typer import Typer
+        tree = parse(content)
+        tree.accept(Binder())
+        Typer().run(tree, True)
+        try:
+            code = compile_tree(tree,
+                                "<%s>" % (args[0] if args else "stdin"))
+        except PythonGenException:
+            # Programs which cannot be lowered to Python are evaluated.
+            from ast.stack_evaluator import StackEvaluator
+            print("Evaluating: %s" % StackEvaluator().run(tree))
+            sys.exit(0)
+        if args:
+            cache.store(args[0], content, code)
+    print("Evaluating: %s" % runtime.run(code))
+    sys.exit(0)
+
 tree = parse(content)
 
 if options.bind or options.type:
@@ -95,6 +171,8 @@ if options.ir:
     else:
         from arm.frame import ArmFrame as Frame
     from ir.translate import Translator
+    from ir.context import Context
+    context = Context.current()
     funcs = Translator(Frame).run(tree)
     if options.canon:
         from ir.canonical import canon
@@ -102,32 +180,77 @@ if options.ir:
         from ir.blocks import reorder_blocks
         H = HoistCalls()
         for (f, (frame, stm)) in funcs.items():
-            funcs[f] = (frame, reorder_blocks(canon(stm.accept(H)), frame))
+            with context.function(frame):
+                funcs[f] = (frame,
+                            reorder_blocks(canon(stm.accept(H)), frame))
     if options.gen:
         from arm.gen import Gen
         assembly = {}
         for (f, (frame, seq)) in funcs.items():
-            assembly[f] = (frame, seq.accept(Gen(frame)))
-            if options.liveness and not options.registers:
-                # This is useful for testing only, the register allocation
-                # will take care of calling liveness analysis itself.
-                from codegen.liveness import liveness_analysis
-                liveness_analysis(frame, assembly[f][1])
-            if options.registers:
-                from codegen.alloc import allocate_registers
-                assembly[f] = (frame, allocate_registers(frame, assembly[f][1]))
+            with context.function(frame):
+                assembly[f] = (frame, seq.accept(Gen(frame)))
+                if options.liveness and not options.registers:
+                    # This is useful for testing only, the register allocation
+                    # will take care of calling liveness analysis itself.
+                    from codegen.liveness import liveness_analysis
+                    liveness_analysis(frame, assembly[f][1], options.verbose)
+                if options.registers:
+                    from codegen.alloc import allocate_registers
+                    stats = {}
+                    assembly[f] = (frame,
+                                   allocate_registers(
+                                       frame, assembly[f][1], stats,
+                                       None if options.allocator == "auto"
+                                       else options.allocator))
+                    if options.verbose:
+                        sys.stderr.write(
+                            "{}: {} of {} moves eliminated, {} spills\n"
+                            .format(frame.label, stats.get("eliminated", 0),
+                                    stats.get("moves", 0),
+                                    stats.get("spills", 0)))
         if options.dump:
             for (f, (frame, code)) in assembly.items():
                 for i in code:
-                    print(i.dump(options.verbose))
+                    i.write(sys.stdout, options.verbose)
     elif options.dump:
         from ir.dumper import Dumper
         for (frame, stm) in funcs.values():
-            print(stm.accept(Dumper()))
+            stm.accept(Dumper(sys.stdout))
+    if options.irvm and options.eval:
+        from irvm.interpreter import Interpreter
+        interpreter = Interpreter(funcs)
+        print("Evaluating: %s" % interpreter.run())
+        if options.verbose:
+            interpreter.report(sys.stderr)
 elif options.dump:
-    from parser.dumper import Dumper
-    print(tree.accept(Dumper(options.bind)))
+    from parser.dumper import Writer
+    tree.accept(Writer(options.bind, sys.stdout.write))
+    sys.stdout.write("\n")
 
-if options.eval:
-    from ast.evaluator import Evaluator
-    print("Evaluating: %s" % tree.accept(Evaluator()))
+if options.eval and not options.irvm:
+    if options.bind or options.type:
+        # Bound programs may declare and call functions, evaluate them
+        # without being limited by the Python stack depth.
+        from ast.stack_evaluator import StackEvaluator
+        profiler = None
+        if options.profile:
+            from ast.profiler import Profiler
+            profiler = Profiler()
+        evaluator = StackEvaluator(profiler=profiler)
+        try:
+            print("Evaluating: %s" % evaluator.run(tree))
+        finally:
+            if profiler is not None:
+                profiler.report(sys.stderr)
+                if options.flame_graph is not None:
+                    with open(options.flame_graph, "w") as fd:
+                        profiler.write_collapsed(fd)
+        if options.verbose:
+            for line in evaluator.purity.report():
+                print(line, file=sys.stderr)
+            print("memoized calls: %d hits, %d misses" %
+                  (evaluator.memo_hits, evaluator.memo_misses),
+                  file=sys.stderr)
+    else:
+        from ast.evaluator import Evaluator
+        print("Evaluating: %s" % tree.accept(Evaluator()))